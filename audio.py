@@ -0,0 +1,324 @@
+from typing import Dict, List, Optional
+import importlib.util
+import threading
+import time
+import wave
+import numpy as np
+
+"""Everything is mixed as 16-bit stereo at this rate, in blocks of this
+many frames (about 23 ms, which bounds how late an effect can start)
+"""
+SAMPLE_RATE = 44100
+CHANNELS = 2
+BLOCK_FRAMES = 1024
+
+_tracks: Dict[str, np.ndarray] = {}
+
+
+def load_wav(path: str) -> np.ndarray:
+    """Reads a 16-bit WAV file as stereo samples at SAMPLE_RATE
+
+    Args:
+        path (str): the file
+
+    Raises:
+        ValueError: if it isn't 16-bit
+
+    Returns:
+        np.ndarray: int16 samples, one row per frame
+    """
+    with wave.open(path, "rb") as file:
+        if file.getsampwidth() != 2:
+            raise ValueError("Only 16-bit WAV files are supported")
+        channels, rate = file.getnchannels(), file.getframerate()
+        samples = np.frombuffer(file.readframes(file.getnframes()), dtype="<i2")
+    samples = samples.reshape(-1, channels)[:, :CHANNELS]
+    if samples.shape[1] == 1:
+        samples = np.repeat(samples, CHANNELS, axis=1)
+    if rate != SAMPLE_RATE:
+        positions = np.arange(0, len(samples), rate / SAMPLE_RATE)
+        samples = np.stack([np.interp(positions, np.arange(len(samples)), channel)
+                            for channel in samples.T], axis=1)
+    return np.ascontiguousarray(samples, dtype=np.int16)
+
+
+def decode_track(path: str) -> np.ndarray:
+    """Decodes a track to PCM, once per process. WAV files are read with
+    the standard library, anything else (the MP3) needs miniaudio
+
+    Args:
+        path (str): the file
+
+    Returns:
+        np.ndarray: int16 samples, one row per frame
+    """
+    if path not in _tracks:
+        if path.lower().endswith(".wav"):
+            _tracks[path] = load_wav(path)
+        else:
+            import miniaudio
+            decoded = miniaudio.decode_file(path, miniaudio.SampleFormat.SIGNED16,
+                                            CHANNELS, SAMPLE_RATE)
+            _tracks[path] = np.frombuffer(decoded.samples, dtype=np.int16).reshape(-1, CHANNELS)
+    return _tracks[path]
+
+
+def can_decode(path: str) -> bool:
+    """Returns whether decode_track can read a file type here, without
+    decoding it
+
+    Args:
+        path (str): the file
+
+    Returns:
+        bool: True for WAV files, and for anything else if miniaudio is installed
+    """
+    return path.lower().endswith(".wav") or importlib.util.find_spec("miniaudio") is not None
+
+
+def tone(notes: List[float], seconds: float, volume: float = .3) -> np.ndarray:
+    """Synthesizes a short effect: each note in turn, with a fast decay
+
+    Args:
+        notes (List[float]): the frequencies, in Hz
+        seconds (float): the length of each note
+        volume (float): the peak amplitude, 1 is full scale
+
+    Returns:
+        np.ndarray: int16 samples, one row per frame
+    """
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    envelope = np.exp(-t * 8 / seconds)
+    signal = np.concatenate([np.sin(2 * np.pi * note * t) * envelope for note in notes])
+    samples = (signal * volume * 32767).astype(np.int16)
+    return np.repeat(samples[:, None], CHANNELS, axis=1)
+
+
+"""The sound effects, synthesized so there is nothing to load
+"""
+EFFECTS = {
+    "lock": tone([110], .05),
+    "clear": tone([523.25, 659.25], .06),
+    "tetris": tone([523.25, 659.25, 783.99, 1046.5], .07),
+}
+
+
+class Mixer:
+    """
+    Mixes the looping music with any playing effects. The decoded track is
+    read as a ring, so the loop point is just the index wrapping around and
+    there is no gap
+    """
+
+    def __init__(self, music: Optional[np.ndarray] = None, volume: float = .6) -> None:
+        """Creates a mixer
+
+        Args:
+            music (Optional[np.ndarray]): the track to loop, if any yet
+            volume (float): the music's volume, 0 to 1
+        """
+        self.music = music
+        self.volume = volume
+        self.position = 0
+        self.lock = threading.Lock()
+        self.playing: List[list] = []
+
+    def play(self, samples: np.ndarray) -> None:
+        """Starts an effect with the next block
+
+        Args:
+            samples (np.ndarray): the effect
+        """
+        with self.lock:
+            self.playing.append([samples, 0])
+
+    def mix(self, frames: int) -> np.ndarray:
+        """Returns the next block of output
+
+        Args:
+            frames (int): the block's length
+
+        Returns:
+            np.ndarray: int16 samples, one row per frame
+        """
+        out = np.zeros((frames, CHANNELS), dtype=np.int32)
+        music = self.music
+        if music is not None and len(music):
+            indices = (self.position + np.arange(frames)) % len(music)
+            out += (music[indices] * self.volume).astype(np.int32)
+            self.position = (self.position + frames) % len(music)
+        with self.lock:
+            for effect in self.playing:
+                samples, start = effect
+                chunk = samples[start:start + frames]
+                out[:len(chunk)] += chunk
+                effect[1] += frames
+            self.playing = [effect for effect in self.playing if effect[1] < len(effect[0])]
+        return np.clip(out, -32768, 32767).astype(np.int16)
+
+
+class NullBackend:
+    """
+    Pulls blocks from the mixer at the rate a sound card would, on one
+    background thread, and throws them away
+    """
+
+    def __init__(self, realtime: bool = True, limit: Optional[int] = None) -> None:
+        """Creates a backend
+
+        Args:
+            realtime (bool): whether to pace output to the clock, rather
+                than mixing as fast as possible
+            limit (Optional[int]): the frames to write before stopping on its
+                own, None to run until stopped
+        """
+        self.realtime = realtime
+        self.limit = limit
+        self.stopping = threading.Event()
+        self.thread = None
+        self.frames = 0
+
+    def start(self, mixer: Mixer) -> None:
+        self.thread = threading.Thread(target=self.run, args=(mixer,), daemon=True)
+        self.thread.start()
+
+    def run(self, mixer: Mixer) -> None:
+        block_time = BLOCK_FRAMES / SAMPLE_RATE
+        deadline = time.monotonic()
+        while not self.stopping.is_set():
+            if self.limit is not None and self.frames >= self.limit:
+                break
+            self.write(mixer.mix(BLOCK_FRAMES))
+            self.frames += BLOCK_FRAMES
+            if self.realtime:
+                deadline += block_time
+                self.stopping.wait(max(0.0, deadline - time.monotonic()))
+
+    def write(self, block: np.ndarray) -> None:
+        pass
+
+    def stop(self) -> None:
+        self.stopping.set()
+        if self.thread:
+            self.thread.join()
+
+
+class WavBackend(NullBackend):
+    """
+    Like NullBackend, but writes everything to a WAV file
+    """
+
+    def __init__(self, path: str, realtime: bool = True, limit: Optional[int] = None) -> None:
+        """Creates a backend
+
+        Args:
+            path (str): the file to write
+            realtime (bool): see NullBackend
+            limit (Optional[int]): see NullBackend
+        """
+        super().__init__(realtime, limit)
+        self.file = wave.open(path, "wb")
+        self.file.setnchannels(CHANNELS)
+        self.file.setsampwidth(2)
+        self.file.setframerate(SAMPLE_RATE)
+
+    def write(self, block: np.ndarray) -> None:
+        self.file.writeframes(block.astype("<i2").tobytes())
+
+    def stop(self) -> None:
+        super().stop()
+        self.file.close()
+
+
+class DeviceBackend:
+    """
+    Plays through the sound card with miniaudio, which calls back into the
+    mixer from its own thread
+    """
+
+    def __init__(self, buffer_ms: int = 40) -> None:
+        """Opens the default output device
+
+        Args:
+            buffer_ms (int): the device buffer, which is the effect latency
+        """
+        import miniaudio
+        self.device = miniaudio.PlaybackDevice(miniaudio.SampleFormat.SIGNED16, CHANNELS,
+                                               SAMPLE_RATE, buffersize_msec=buffer_ms)
+
+    def start(self, mixer: Mixer) -> None:
+        def stream():
+            frames = yield b""
+            while True:
+                frames = yield mixer.mix(frames).tobytes()
+        generator = stream()
+        next(generator)
+        self.device.start(generator)
+
+    def stop(self) -> None:
+        self.device.close()
+
+
+class AudioEngine:
+    """
+    Background music and sound effects. The track is decoded on a loader
+    thread, so starting costs nothing and effects work straight away. If it
+    can't be decoded, the music stays silent and the error is kept in error
+    """
+
+    def __init__(self, backend, music_path: Optional[str] = None, volume: float = .6) -> None:
+        """Creates an engine
+
+        Args:
+            backend: where the sound goes, see NullBackend
+            music_path (Optional[str]): the track to loop, if any
+            volume (float): the music's volume, 0 to 1
+        """
+        self.backend = backend
+        self.music_path = music_path
+        self.mixer = Mixer(volume=volume)
+        self.loader = None
+        self.error = None
+
+    def start(self) -> None:
+        """Starts playing
+        """
+        if self.music_path:
+            self.loader = threading.Thread(target=self.load, daemon=True)
+            self.loader.start()
+        self.backend.start(self.mixer)
+
+    def load(self) -> None:
+        try:
+            self.mixer.music = decode_track(self.music_path)
+        except Exception as error:
+            # a traceback from this thread would be drawn over the game
+            self.error = error
+
+    def play(self, effect: str) -> None:
+        """Plays a sound effect
+
+        Args:
+            effect (str): a key of EFFECTS
+        """
+        self.mixer.play(EFFECTS[effect])
+
+    def set_volume(self, volume: float) -> None:
+        """Sets the music's volume
+
+        Args:
+            volume (float): 0 to 1
+        """
+        self.mixer.volume = volume
+
+    def stop(self) -> None:
+        """Stops playing and releases the backend
+        """
+        self.backend.stop()
+
+    def __enter__(self) -> "AudioEngine":
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
@@ -0,0 +1,293 @@
+from typing import NamedTuple, Optional
+import numpy as np
+from tetris import Action, PIECE_TYPES, ROTATION_STATES
+
+"""Cell offsets of every (piece, rotation), shape (7, 4, 4, 2). Pieces are
+numbered by their index in PIECE_TYPES, and stored on boards as index + 1 so
+that 0 means empty
+"""
+CELLS = np.array([[state.cells for state in ROTATION_STATES[type]]
+                  for type in PIECE_TYPES], dtype=np.int32)
+LEFT = CELLS[..., 1].min(axis=2)
+RIGHT = CELLS[..., 1].max(axis=2)
+BOTTOM = CELLS[..., 0].max(axis=2)
+
+
+class BatchStepResult(NamedTuple):
+    """
+    The outcome of one batched step, one entry per environment
+    """
+
+    lines_cleared: np.ndarray
+    game_over: np.ndarray
+    locked: np.ndarray
+
+
+class BatchTetris:
+    """
+    Runs many games of tetris in lockstep. All boards live in one
+    (N, rows, cols) array, and every rule of TetrisEngine (gravity, moves,
+    rotation, collision, locking, line clears and spawning) is applied to
+    all environments at once with array operations
+    """
+
+    def __init__(self, num_envs: int, num_rows: int = 20, num_cols: int = 10,
+                 seed: Optional[int] = None, streams: Optional[np.ndarray] = None) -> None:
+        """Creates N games. Call reset() before stepping
+
+        Args:
+            num_envs (int): the number of games
+            num_rows (int): the number of rows of every board
+            num_cols (int): the number of columns of every board
+            seed (Optional[int]): the seed for the piece bags
+            streams (Optional[np.ndarray]): the pieces each game deals, in
+                order, shape (N, length). Build rows with
+                np.frombuffer(PieceStream(...).codes, np.uint8) to give every
+                game its own randomizer and seed. Streams start over when
+                they run out. By default, all games deal 7-bags from one
+                generator
+        """
+        self.num_envs = num_envs
+        self.numRows = num_rows
+        self.numCols = num_cols
+        self.rng = np.random.default_rng(seed)
+        self.boards = np.zeros((num_envs, num_rows, num_cols), dtype=np.uint8)
+        self.piece = np.zeros(num_envs, dtype=np.int32)
+        self.rotation = np.zeros(num_envs, dtype=np.int32)
+        self.r = np.zeros(num_envs, dtype=np.int32)
+        self.c = np.zeros(num_envs, dtype=np.int32)
+        self.bags = np.zeros((num_envs, len(PIECE_TYPES)), dtype=np.int32)
+        self.bag_len = np.zeros(num_envs, dtype=np.int32)
+        self.streams = None if streams is None else np.asarray(streams, dtype=np.int32)
+        self.cursor = np.zeros(num_envs, dtype=np.int64)
+        self.game_over = np.zeros(num_envs, dtype=bool)
+        self.tick = 0
+
+    def reset(self, envs: Optional[np.ndarray] = None) -> None:
+        """Starts new games with empty boards and fresh bags
+
+        Args:
+            envs (Optional[np.ndarray]): a mask or indices of the games to
+                reset, all of them by default
+        """
+        idx = self._indices(envs)
+        self.boards[idx] = 0
+        self.bag_len[idx] = 0
+        self.cursor[idx] = 0
+        self.game_over[idx] = False
+        self.spawn(idx)
+
+    def _indices(self, envs: Optional[np.ndarray]) -> np.ndarray:
+        if envs is None:
+            return np.arange(self.num_envs)
+        envs = np.asarray(envs)
+        return np.flatnonzero(envs) if envs.dtype == bool else envs
+
+    def next_pieces(self) -> np.ndarray:
+        """Returns the piece each game will spawn next
+
+        Returns:
+            np.ndarray: indices into PIECE_TYPES
+        """
+        if self.streams is not None:
+            return self.streams[np.arange(self.num_envs), self.cursor % self.streams.shape[1]]
+        return self.bags[np.arange(self.num_envs), self.bag_len - 1]
+
+    def refill_bags(self, idx: np.ndarray) -> None:
+        """Deals a freshly shuffled 7-bag to the given games
+
+        Args:
+            idx (np.ndarray): the games to refill
+        """
+        bags = np.tile(np.arange(len(PIECE_TYPES), dtype=np.int32), (len(idx), 1))
+        self.bags[idx] = self.rng.permuted(bags, axis=1)
+        self.bag_len[idx] = len(PIECE_TYPES)
+
+    def deal(self, idx: np.ndarray) -> np.ndarray:
+        """Takes the next piece of each game, from its stream or its bag
+
+        Args:
+            idx (np.ndarray): the games
+
+        Returns:
+            np.ndarray: the pieces
+        """
+        if self.streams is not None:
+            piece = self.streams[idx, self.cursor[idx] % self.streams.shape[1]]
+            self.cursor[idx] += 1
+            return piece
+        empty = idx[self.bag_len[idx] == 0]
+        if len(empty):
+            self.refill_bags(empty)
+        self.bag_len[idx] -= 1
+        piece = self.bags[idx, self.bag_len[idx]]
+        # keep the next block visible for lookahead
+        empty = idx[self.bag_len[idx] == 0]
+        if len(empty):
+            self.refill_bags(empty)
+        return piece
+
+    def spawn(self, idx: np.ndarray) -> None:
+        """Pops the next block of each game and puts it above the board,
+        ending the games where it collides on spawn
+
+        Args:
+            idx (np.ndarray): the games that need a new block
+        """
+        piece = self.deal(idx)
+        self.piece[idx] = piece
+        self.rotation[idx] = 0
+        bottom = BOTTOM[piece, 0]
+        self.r[idx] = -bottom - 2
+        self.c[idx] = self.numCols // 2
+        self.game_over[idx] = self.collides(idx, piece, self.rotation[idx], -bottom, self.c[idx])
+
+    def collides(self, idx: np.ndarray, piece: np.ndarray, rotation: np.ndarray,
+                 r: np.ndarray, c: np.ndarray) -> np.ndarray:
+        """The batched block_would_collide: whether each block would hit a
+        wall, the floor or a filled cell at (r, c)
+
+        Args:
+            idx (np.ndarray): the games to test
+            piece (np.ndarray): the piece of each game
+            rotation (np.ndarray): the rotation of each game
+            r (np.ndarray): the test r of each game
+            c (np.ndarray): the test c of each game
+
+        Returns:
+            np.ndarray: one bool per game
+        """
+        cells = CELLS[piece, rotation]
+        rows = r[:, None] + cells[..., 0]
+        cols = c[:, None] + cells[..., 1]
+        outside = (cols < 0) | (cols >= self.numCols) | (rows >= self.numRows)
+        filled = self.boards[idx[:, None],
+                             np.clip(rows, 0, self.numRows - 1),
+                             np.clip(cols, 0, self.numCols - 1)] != 0
+        return (outside | (filled & (rows >= 0))).any(axis=1)
+
+    def find_bottom_r(self, idx: np.ndarray) -> np.ndarray:
+        """The batched find_curr_block_bottom_xy: the row each block would
+        land on if dropped straight down. Assumes the current placements are
+        valid
+
+        Args:
+            idx (np.ndarray): the games to drop
+
+        Returns:
+            np.ndarray: the landing row of each game
+        """
+        boards = self.boards[idx] != 0
+        rows = np.arange(self.numRows, dtype=np.int32)[None, :, None]
+        # first filled row at or below each cell, numRows for the floor
+        below = np.where(boards, rows, self.numRows)
+        below = np.minimum.accumulate(below[:, ::-1], axis=1)[:, ::-1]
+
+        cells = CELLS[self.piece[idx], self.rotation[idx]]
+        cell_r = self.r[idx, None] + cells[..., 0]
+        cell_c = self.c[idx, None] + cells[..., 1]
+        hit = below[np.arange(len(idx))[:, None], np.maximum(cell_r, 0), cell_c]
+        return self.r[idx] + (hit - cell_r - 1).min(axis=1)
+
+    def step(self, actions: np.ndarray, gravity: bool = True) -> BatchStepResult:
+        """Advances every game by one TetrisEngine.step: gravity (if asked),
+        then each game's action, then locking, line clears and spawning
+
+        Args:
+            actions (np.ndarray): one Action value per game
+            gravity (bool): whether this step is a gravity tick
+
+        Returns:
+            BatchStepResult: the lines cleared, whether each game is over
+            and whether each game locked a block
+        """
+        actions = np.asarray(actions)
+        alive = np.flatnonzero(~self.game_over)
+        lines_cleared = np.zeros(self.num_envs, dtype=np.int32)
+        locked = np.zeros(self.num_envs, dtype=bool)
+
+        if gravity:
+            self.tick += 1
+            free = ~self.collides(alive, self.piece[alive], self.rotation[alive],
+                                  self.r[alive] + 1, self.c[alive])
+            self.r[alive[free]] += 1
+
+        act = actions[alive]
+        for action, dc in ((Action.LEFT, -1), (Action.RIGHT, 1)):
+            self._shift(alive[act == action.value], dc)
+        for action, dr in ((Action.ROTATE_RIGHT, 1), (Action.ROTATE_LEFT, -1)):
+            self._rotate(alive[act == action.value], dr)
+        drop = alive[(act == Action.DOWN.value) | (act == Action.HARD_DROP.value)]
+        if len(drop):
+            bottom = self.find_bottom_r(drop)
+            hard = actions[drop] == Action.HARD_DROP.value
+            self.r[drop] = np.where(hard, bottom, np.minimum(self.r[drop] + 1, bottom))
+
+        landed = alive[self.collides(alive, self.piece[alive], self.rotation[alive],
+                                     self.r[alive] + 1, self.c[alive])]
+        if len(landed):
+            self.place(landed)
+            lines_cleared[landed] = self.clear_full_lines(landed)
+            locked[landed] = True
+            self.spawn(landed)
+        return BatchStepResult(lines_cleared, self.game_over.copy(), locked)
+
+    def _shift(self, idx: np.ndarray, dc: int) -> None:
+        if not len(idx):
+            return
+        blocked = self.collides(idx, self.piece[idx], self.rotation[idx],
+                                self.r[idx], self.c[idx] + dc)
+        self.c[idx[~blocked]] += dc
+        self._maintain_in_boundary(idx, self.rotation[idx])
+
+    def _rotate(self, idx: np.ndarray, dr: int) -> None:
+        if not len(idx):
+            return
+        rotation = (self.rotation[idx] + dr) % 4
+        # like rotate_curr_right, the boundary fix-up sticks even if the rotation is undone
+        self._maintain_in_boundary(idx, rotation)
+        blocked = self.collides(idx, self.piece[idx], rotation, self.r[idx], self.c[idx])
+        self.rotation[idx] = np.where(blocked, self.rotation[idx], rotation)
+
+    def _maintain_in_boundary(self, idx: np.ndarray, rotation: np.ndarray) -> None:
+        piece = self.piece[idx]
+        self.c[idx] = np.clip(self.c[idx], -LEFT[piece, rotation],
+                              self.numCols - 1 - RIGHT[piece, rotation])
+
+    def place(self, idx: np.ndarray) -> None:
+        """The batched place_curr_block: writes each block into its board.
+        Cells above the top of the board are dropped
+
+        Args:
+            idx (np.ndarray): the games whose block to place
+        """
+        cells = CELLS[self.piece[idx], self.rotation[idx]]
+        rows = self.r[idx, None] + cells[..., 0]
+        cols = self.c[idx, None] + cells[..., 1]
+        envs = np.broadcast_to(idx[:, None], rows.shape)
+        values = np.broadcast_to(self.piece[idx, None] + 1, rows.shape)
+        keep = rows >= 0
+        self.boards[envs[keep], rows[keep], cols[keep]] = values[keep]
+
+    def clear_full_lines(self, idx: np.ndarray) -> np.ndarray:
+        """The batched clear_full_lines: removes every full row and moves
+        the rows above them down
+
+        Args:
+            idx (np.ndarray): the games to clear
+
+        Returns:
+            np.ndarray: the number of lines cleared in each game
+        """
+        boards = self.boards[idx]
+        full = (boards != 0).all(axis=2)
+        cleared = full.sum(axis=1)
+        some = cleared > 0
+        if some.any():
+            boards = boards[some]
+            # full rows sort to the top, every other row keeps its order
+            order = np.argsort(~full[some], axis=1, kind="stable")
+            boards = np.take_along_axis(boards, order[:, :, None], axis=1)
+            boards[np.arange(self.numRows)[None, :] < cleared[some, None]] = 0
+            self.boards[idx[some]] = boards
+        return cleared
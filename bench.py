@@ -0,0 +1,291 @@
+from random import Random
+from typing import Callable, Dict, List
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from perft import perft, piece_sequence
+from tetris import Action, PIECE_TYPES, Board, Tetris, TetrisEngine, Tetromino, TetrominoType
+from virtual_terminal import VirtualTerminal
+
+"""Metrics compared between runs; lower is better for all of them
+"""
+COMPARED_METRICS = ("ns_per_op", "bytes_per_frame", "writes_per_frame")
+
+
+def best_time(fn: Callable[[], None], number: int, repeat: int) -> float:
+    """Times fn, taking the best of several runs
+
+    Args:
+        fn (Callable[[], None]): the code to time
+        number (int): calls per run
+        repeat (int): number of runs
+
+    Returns:
+        float: the best nanoseconds per call
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1e9 / number
+
+
+def midgame_engine(seed: int, pieces: int = 25) -> TetrisEngine:
+    """Builds a reproducible, partly filled board by dropping pieces in
+    random columns
+
+    Args:
+        seed (int): the seed
+        pieces (int): how many pieces to drop
+
+    Returns:
+        TetrisEngine: the game, with a current block above the board
+    """
+    rng = Random(seed)
+    engine = TetrisEngine()
+    engine.reset(seed)
+    for _ in range(pieces):
+        shift = rng.randint(-5, 5)
+        for _ in range(abs(shift)):
+            engine.step(Action.LEFT if shift < 0 else Action.RIGHT, gravity=False)
+        result = engine.step(Action.HARD_DROP, gravity=False)
+        if result.game_over:
+            engine.reset(seed)
+    return engine
+
+
+def bench_rotate(seed: int, repeat: int) -> dict:
+    pieces = [Tetromino(type) for type in PIECE_TYPES]
+
+    def rotate():
+        for piece in pieces:
+            piece.rotate_left()
+            piece.rotate_right()
+            piece.rotate_right()
+            piece.rotate_left()
+    return {"ns_per_op": best_time(rotate, 2000, repeat) / (4 * len(pieces))}
+
+
+def bench_block_would_collide(seed: int, repeat: int) -> dict:
+    engine = midgame_engine(seed)
+    positions = [(r, c) for r in range(-2, engine.numRows) for c in range(-1, engine.numCols)]
+
+    def collide():
+        for r, c in positions:
+            engine.block_would_collide(r, c)
+    return {"ns_per_op": best_time(collide, 200, repeat) / len(positions)}
+
+
+def bench_find_curr_block_bottom_xy(seed: int, repeat: int) -> dict:
+    engine = midgame_engine(seed)
+    columns = [engine.clamp_in_boundary(engine.curr_block, c) for c in range(engine.numCols)]
+
+    def find():
+        for c in columns:
+            engine.curr_block_c = c
+            engine.find_curr_block_bottom_xy()
+    return {"ns_per_op": best_time(find, 500, repeat) / len(columns)}
+
+
+def bench_clear_full_lines(seed: int, repeat: int) -> dict:
+    engine = midgame_engine(seed)
+    rng = Random(seed)
+    for r in rng.sample(range(engine.numRows - 8, engine.numRows), 4):
+        engine.grid.set_row(r, [TetrominoType.Z] * engine.numCols)
+    full = engine.grid
+    best = None
+    for _ in range(repeat):
+        # copies are made up front, so only the clears are timed
+        boards = [full.copy() for _ in range(1000)]
+        start = time.perf_counter()
+        for board in boards:
+            engine.grid = board
+            engine.clear_full_lines()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return {"ns_per_op": best * 1e9 / len(boards)}
+
+
+def bench_place_curr_block(seed: int, repeat: int) -> dict:
+    engine = midgame_engine(seed)
+    piece = engine.curr_block
+    r, c = engine.find_curr_block_bottom_xy()
+
+    def place():
+        engine.curr_block = piece
+        engine.curr_block_r, engine.curr_block_c = r, c
+        engine.place_curr_block()
+    return {"ns_per_op": best_time(place, 5000, repeat)}
+
+
+def bench_perft(seed: int, repeat: int) -> dict:
+    pieces = piece_sequence(seed, 2)
+    best = None
+    for _ in range(repeat):
+        result = perft(Board(20, 10), pieces)
+        best = result if best is None else min(best, result, key=lambda result: result.seconds)
+    return {"ns_per_op": best.seconds * 1e9 / best.nodes, "nodes_per_second": best.nodes_per_second}
+
+
+def bench_render_game(seed: int, repeat: int, frames: int = 300) -> dict:
+    rng = Random(seed)
+    inputs = [(Action(rng.randrange(len(Action))), rng.random() < .3) for _ in range(frames)]
+    best = None
+    for _ in range(repeat):
+        term = VirtualTerminal(120, 50)
+        game = Tetris(term)
+        game.reset(seed)
+        game.render_game()
+        first_frame_bytes = term.stream.bytes
+        stream = term.stream
+        stream.bytes = stream.writes = stream.flushes = 0
+        elapsed = 0.0
+        for action, gravity in inputs:
+            if game.step(action, gravity).game_over:
+                game.reset(seed)
+            start = time.perf_counter()
+            game.render_game()
+            elapsed += time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return {
+        "ns_per_op": best * 1e9 / frames,
+        "first_frame_bytes": first_frame_bytes,
+        "bytes_per_frame": stream.bytes / frames,
+        "writes_per_frame": stream.writes / frames,
+        "flushes_per_frame": stream.flushes / frames,
+    }
+
+
+def import_time(module: str, repeat: int) -> dict:
+    """Times importing a module in a fresh interpreter, the way a short
+    lived process would, taking the best of several runs
+
+    Args:
+        module (str): the module
+        repeat (int): number of runs
+
+    Returns:
+        dict: the import time, the whole process's time and the number of
+        modules the import loaded
+    """
+    code = ("import sys, time; modules = len(sys.modules); start = time.perf_counter(); "
+            f"import {module}; "
+            "print(time.perf_counter() - start, len(sys.modules) - modules)")
+    here = os.path.dirname(os.path.abspath(__file__))
+    best = best_process = None
+    # once more than asked, so the first run can write the bytecode caches
+    for _ in range(repeat + 1):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, "-c", code], cwd=here, check=True,
+                                capture_output=True, text=True).stdout
+        process = time.perf_counter() - start
+        seconds, modules = output.split()
+        if best is None or float(seconds) < best:
+            best = float(seconds)
+        if best_process is None or process < best_process:
+            best_process = process
+    return {"ns_per_op": best * 1e9, "process_ns": best_process * 1e9, "modules": int(modules)}
+
+
+def bench_import_main(seed: int, repeat: int) -> dict:
+    return import_time("main", repeat)
+
+
+def bench_import_replay(seed: int, repeat: int) -> dict:
+    return import_time("replay", repeat)
+
+
+BENCHMARKS: Dict[str, Callable[[int, int], dict]] = {
+    "rotate": bench_rotate,
+    "block_would_collide": bench_block_would_collide,
+    "find_curr_block_bottom_xy": bench_find_curr_block_bottom_xy,
+    "clear_full_lines": bench_clear_full_lines,
+    "place_curr_block": bench_place_curr_block,
+    "perft": bench_perft,
+    "render_game": bench_render_game,
+    "import_main": bench_import_main,
+    "import_replay": bench_import_replay,
+}
+
+
+def run(names: List[str], seed: int, repeat: int) -> dict:
+    """Runs benchmarks
+
+    Args:
+        names (List[str]): which ones, all of them if empty
+        seed (int): the seed for every workload
+        repeat (int): runs per benchmark, the best is kept
+
+    Returns:
+        dict: the results, by benchmark name
+    """
+    results = {name: BENCHMARKS[name](seed, repeat) for name in names or BENCHMARKS}
+    return {
+        "meta": {"python": platform.python_version(), "seed": seed,
+                 "repeat": repeat, "time": time.time()},
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> List[str]:
+    """Finds regressions against a baseline run
+
+    Args:
+        current (dict): this run
+        baseline (dict): the run to compare against
+        threshold (float): the allowed slowdown, 0.1 is 10%
+
+    Returns:
+        List[str]: one line per regression
+    """
+    regressions = []
+    for name, metrics in current["results"].items():
+        old_metrics = baseline["results"].get(name, {})
+        for metric in COMPARED_METRICS:
+            old, new = old_metrics.get(metric), metrics.get(metric)
+            if old and new is not None and new > old * (1 + threshold):
+                regressions.append(f"{name}.{metric}: {old:.1f} -> {new:.1f} "
+                                   f"(+{100 * (new / old - 1):.0f}%)")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="benchmark the engine and renderer hot paths")
+    parser.add_argument(
+        'names', nargs='*', help="Benchmarks to run, all by default: " + ", ".join(BENCHMARKS))
+    parser.add_argument(
+        '-s', '--seed', type=int, default=0, help="Seed for every workload")
+    parser.add_argument(
+        '-r', '--repeat', type=int, default=5, help="Runs per benchmark, the best is kept")
+    parser.add_argument(
+        '-o', '--output', help="Write the results as JSON")
+    parser.add_argument(
+        '-c', '--compare', metavar='BASELINE', help="Compare against a previous --output")
+    parser.add_argument(
+        '-t', '--threshold', type=float, default=.1, help="Allowed slowdown for --compare")
+    args = parser.parse_args()
+    for name in args.names:
+        if name not in BENCHMARKS:
+            parser.error(f"unknown benchmark {name}")
+
+    current = run(args.names, args.seed, args.repeat)
+    for name, metrics in current["results"].items():
+        print(f"{name:28}" + "  ".join(f"{key}={value:,.1f}" for key, value in metrics.items()))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(current, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(current, json.load(file), args.threshold)
+        for regression in regressions:
+            print("REGRESSION " + regression)
+        sys.exit(1 if regressions else 0)
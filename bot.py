@@ -0,0 +1,194 @@
+from typing import NamedTuple, Optional
+import time
+from tetris import Action, Board, Placement, TetrisEngine
+from transposition import TranspositionTable
+
+"""Weights for evaluate_board: aggregate height, lines, holes and bumpiness
+"""
+HEIGHT_WEIGHT = -0.510066
+LINES_WEIGHT = 0.760666
+HOLES_WEIGHT = -0.35663
+BUMPINESS_WEIGHT = -0.184483
+
+
+def column_heights(board: Board) -> list:
+    """Returns the height of every column, 0 for an empty column
+
+    Args:
+        board (Board): the board
+
+    Returns:
+        list: one height per column
+    """
+    heights = [0] * board.num_cols
+    covered = 0
+    for r, row in enumerate(board.rows):
+        new = row & ~covered
+        while new:
+            bit = new & -new
+            heights[bit.bit_length() - 1] = board.num_rows - r
+            new ^= bit
+        covered |= row
+        if covered == board.full_mask:
+            break
+    return heights
+
+
+def count_holes(board: Board) -> int:
+    """Returns the number of empty cells with a filled cell somewhere above
+
+    Args:
+        board (Board): the board
+
+    Returns:
+        int: the number of holes
+    """
+    holes = 0
+    covered = 0
+    for row in board.rows:
+        holes += bin(covered & ~row).count("1")
+        covered |= row
+    return holes
+
+
+def evaluate_board(board: Board, lines_cleared: int = 0) -> float:
+    """Scores a board after a placement, higher is better
+
+    Args:
+        board (Board): the board after the placement
+        lines_cleared (int): the lines the placement cleared
+
+    Returns:
+        float: the score
+    """
+    heights = column_heights(board)
+    bumpiness = sum(abs(a - b) for a, b in zip(heights, heights[1:]))
+    return (HEIGHT_WEIGHT * sum(heights) + LINES_WEIGHT * lines_cleared +
+            HOLES_WEIGHT * count_holes(board) + BUMPINESS_WEIGHT * bumpiness)
+
+
+def apply_placement(board: Board, placement: Placement) -> tuple:
+    """Locks a placement into a copy of a board
+
+    Args:
+        board (Board): the board, which is not changed
+        placement (Placement): the placement
+
+    Returns:
+        tuple: (the new board, the lines cleared)
+    """
+    board = board.copy()
+    state = placement.piece.state
+    board.place(state.cells, placement.piece.type, placement.r, placement.c)
+    return board, board.clear_full_lines(placement.r + i for i, _ in state.row_masks)
+
+
+class GreedyPolicy:
+    """
+    Picks the reachable placement with the best evaluate_board score. With
+    a transposition table, placement lists and scores are cached by
+    position hash, so positions seen before (which is often, after line
+    clears) aren't searched or scored again
+    """
+
+    def __init__(self, table: Optional[TranspositionTable] = None) -> None:
+        """Creates a policy
+
+        Args:
+            table (Optional[TranspositionTable]): the cache to use, if any
+        """
+        self.table = table
+
+    def choose(self, engine: TetrisEngine) -> Optional[Placement]:
+        """Picks a placement for the current block
+
+        Args:
+            engine (TetrisEngine): the game
+
+        Returns:
+            Optional[Placement]: the placement, None if there is none
+        """
+        table = self.table
+        if table is None:
+            placements = engine.reachable_placements()
+        else:
+            key = ("placements", engine.position_hash())
+            placements = table.get(key)
+            if placements is None:
+                placements = engine.reachable_placements()
+                table.put(key, placements)
+        best, best_score = None, None
+        for placement in placements:
+            score = self.score(engine.grid, placement)
+            if best_score is None or score > best_score:
+                best, best_score = placement, score
+        return best
+
+    def score(self, board: Board, placement: Placement) -> float:
+        """Scores the board a placement leaves
+
+        Args:
+            board (Board): the board before the placement
+            placement (Placement): the placement
+
+        Returns:
+            float: the evaluate_board score
+        """
+        board, lines = apply_placement(board, placement)
+        if self.table is None:
+            return evaluate_board(board, lines)
+        key = ("score", board.zobrist, lines)
+        score = self.table.get(key)
+        if score is None:
+            score = evaluate_board(board, lines)
+            self.table.put(key, score)
+        return score
+
+
+class GameResult(NamedTuple):
+    """
+    The compact outcome of one automated game
+    """
+
+    seed: int
+    pieces: int
+    lines: int
+    steps: int
+    seconds: float
+    seconds_per_move: float
+
+
+def play_game(seed: int, policy=None, max_pieces: Optional[int] = None,
+              export: Optional[str] = None) -> GameResult:
+    """Plays one game headlessly until it's over or max_pieces are placed
+
+    Args:
+        seed (int): the seed for the game
+        policy (optional): anything with choose(engine), GreedyPolicy by default
+        max_pieces (Optional[int]): a cap on the game length
+        export (Optional[str]): a dataset directory to write every placement
+            to, see dataset.py
+
+    Returns:
+        GameResult: the result
+    """
+    policy = policy or GreedyPolicy()
+    engine = TetrisEngine()
+    engine.reset(seed)
+    if export:
+        from dataset import DatasetWriter
+        engine.exporter = DatasetWriter(export, engine.numRows, engine.numCols, f"game-{seed}")
+    pieces = lines = steps = 0
+    start = time.perf_counter()
+    while not engine.game_over and (max_pieces is None or pieces < max_pieces):
+        placement = policy.choose(engine)
+        actions = placement.actions if placement else (Action.HARD_DROP,)
+        for action in actions:
+            result = engine.step(action, gravity=False)
+            steps += 1
+        lines += result.lines_cleared
+        pieces += 1
+    seconds = time.perf_counter() - start
+    if engine.exporter:
+        engine.exporter.close()
+    return GameResult(seed, pieces, lines, steps, seconds, seconds / max(pieces, 1))
@@ -0,0 +1,229 @@
+from collections import deque
+from typing import Callable, List
+import time
+from stats import percentile, summarize
+from tetris import Action
+
+"""Terminals only send key presses, never releases, so a held key shows up
+as the OS's autorepeat: one press, then after about half a second a press
+every 30 ms or so. A shift key only counts as held once its presses look
+like that: a press, a pause of up to REPEAT_DELAY, then repeats at most
+REPEAT_GAP apart. Anything else, like fast taps or keys that arrived
+together, moves the piece once per press. From there the piece shifts on
+its own, DAS seconds after the first press and every ARR seconds after
+that, worked out from the timestamps rather than from frames, until the
+repeats stop
+"""
+DAS = .167  # delayed auto shift, 10 frames at 60 Hz
+ARR = .033  # auto repeat rate, 2 frames at 60 Hz, 0 shifts straight to the wall
+REPEAT_GAP = .05
+REPEAT_DELAY = .6
+# a read that returns sooner than this found the key already waiting
+BUFFERED = .001
+SHIFTS = (Action.LEFT, Action.RIGHT)
+# the first press, the first repeat, and enough repeats after it to be sure
+REPEATS_TO_HOLD = 4
+
+
+def repeating(presses: deque) -> bool:
+    """Returns whether a key's last few presses look like the terminal
+    repeating it: a press, a pause, then repeats. Presses at the same time
+    came together, so they are taps, not repeats
+
+    Args:
+        presses (deque): the times of its last few presses
+
+    Returns:
+        bool: whether the key is being held
+    """
+    if len(presses) < REPEATS_TO_HOLD:
+        return False
+    times = list(presses)
+    gaps = [later - earlier for earlier, later in zip(times, times[1:])]
+    return REPEAT_GAP < gaps[0] <= REPEAT_DELAY and all(0 < gap <= REPEAT_GAP for gap in gaps[1:])
+
+
+class InputQueue:
+    """
+    Every key the player pressed since the last pass of the event loop,
+    with the time it arrived. It turns held shift keys into DAS and ARR,
+    and measures how long each key takes to show up on screen
+    """
+
+    def __init__(self, translate: Callable, das: float = DAS, arr: float = ARR,
+                 width: int = 10, window: int = 1024, clock=time.monotonic) -> None:
+        """Creates an empty queue
+
+        Args:
+            translate (Callable): turns a keystroke into an Action
+            das (float): seconds a shift key is held before it repeats
+            arr (float): seconds between repeats, 0 to go straight to the wall
+            width (int): the number of columns, the most shifts there can be
+            window (int): how many recent latencies to keep
+            clock (optional): the clock to use, in seconds
+        """
+        self.translate = translate
+        self.das = das
+        self.arr = arr
+        self.width = width
+        self.clock = clock
+        self.pending = deque()
+        self.presses = {shift: deque(maxlen=REPEATS_TO_HOLD) for shift in SHIFTS}
+        self.held = None
+        self.held_since = 0.0
+        self.held_last = 0.0
+        self.shifts = 0
+        self.last_read = clock()
+        self.unrendered = []
+        self.latencies = deque(maxlen=window)
+        self.keys = 0
+
+    def read(self, term, timeout: float) -> int:
+        """Reads every key the terminal has, waiting for the first one. A key
+        that was already waiting is stamped with the end of the last read,
+        the earliest it could have come, so the time it sat in the terminal
+        while a frame was drawn counts towards its latency
+
+        Args:
+            term (Terminal): the terminal
+            timeout (float): the longest to wait for a key
+
+        Returns:
+            int: the number of keys read
+        """
+        clock = self.clock
+        count = 0
+        start = clock()
+        key = term.inkey(timeout)
+        while key:
+            now = clock()
+            self.push(key, self.last_read if now - start < BUFFERED else now)
+            count += 1
+            start = now
+            key = term.inkey(0)
+        self.last_read = clock()
+        return count
+
+    def push(self, key, at: float = None) -> None:
+        """Adds a key
+
+        Args:
+            key (_type_): the keystroke
+            at (float): when it was pressed, now by default
+        """
+        action = self.translate(key)
+        if action == Action.NONE:
+            return
+        at = self.clock() if at is None else at
+        self.keys += 1
+        if action in SHIFTS:
+            presses = self.presses[action]
+            presses.append(at)
+            if action == self.held:
+                # the terminal repeating a key that is already shifting on its own
+                self.held_last = at
+                return
+            if repeating(presses):
+                self.hold(action, presses)
+                return
+            self.held = None
+        self.pending.append((action, at))
+
+    def hold(self, action: Action, presses: deque) -> None:
+        """Starts auto shifting, once repeats show a shift key is held
+
+        Args:
+            action (Action): the shift
+            presses (deque): its last few presses, the first press first
+        """
+        self.held = action
+        self.held_since = presses[0]
+        self.held_last = presses[-1]
+        # the repeats before this one were taken as taps, and have already moved the piece
+        self.shifts = len(presses) - 2
+
+    def shifts_due(self, now: float) -> int:
+        """Returns how many auto shifts the current hold has earned by now
+
+        Args:
+            now (float): the time
+
+        Returns:
+            int: the number of shifts, not counting the first press
+        """
+        held_for = now - self.held_since - self.das
+        if held_for < 0:
+            return 0
+        if self.arr <= 0:
+            return self.width
+        return min(int(held_for / self.arr) + 1, self.width)
+
+    def due(self, now: float = None) -> List[Action]:
+        """Takes out the actions to apply now, in the order they happened
+
+        Args:
+            now (float): the time, now by default
+
+        Returns:
+            List[Action]: the actions
+        """
+        now = self.clock() if now is None else now
+        timed = list(self.pending)
+        self.pending.clear()
+        self.unrendered += [at for _, at in timed]
+        if self.held is not None:
+            # the key was still down at the last repeat, and maybe a little after
+            until = min(now, self.held_last + REPEAT_GAP)
+            due = self.shifts_due(until)
+            timed += [(self.held, self.held_since + self.das + i * self.arr)
+                      for i in range(self.shifts, due)]
+            self.shifts = max(self.shifts, due)
+            if now - self.held_last > REPEAT_GAP:
+                self.held = None
+        timed.sort(key=lambda press: press[1])
+        return [action for action, _ in timed]
+
+    def timeout(self) -> float:
+        """Returns how long until the next auto shift
+
+        Returns:
+            float: seconds, infinite if no key is held
+        """
+        if self.held is None:
+            return float("inf")
+        if self.shifts >= self.width or (self.arr <= 0 and self.shifts):
+            next_shift = float("inf")
+        else:
+            next_shift = self.held_since + self.das + self.shifts * max(self.arr, 0)
+        return max(0.0, min(next_shift, self.held_last + REPEAT_GAP) - self.clock())
+
+    def rendered(self, now: float = None) -> None:
+        """Notes that a frame showing every applied key was just drawn
+
+        Args:
+            now (float): the time, now by default
+        """
+        now = self.clock() if now is None else now
+        self.latencies.extend(now - at for at in self.unrendered)
+        self.unrendered.clear()
+
+    def latency(self) -> dict:
+        """Summarizes the key to frame latencies, in ms
+
+        Returns:
+            dict: see stats.summarize
+        """
+        return summarize([1000 * latency for latency in self.latencies])
+
+    def hud_lines(self) -> List[str]:
+        """Returns lines about input to show next to the board
+
+        Returns:
+            List[str]: the text
+        """
+        ordered = sorted(self.latencies)
+        return [
+            f"keys   {self.keys}",
+            f"in p50 {1000 * percentile(ordered, 50):6.2f} ms",
+            f"in p99 {1000 * percentile(ordered, 99):6.2f} ms",
+        ]
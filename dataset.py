@@ -0,0 +1,188 @@
+from typing import List
+import glob
+import os
+import numpy as np
+from tetris import PIECE_TYPES, Tetromino
+
+"""A dataset is a directory of .npy shards, each one array of records:
+
+    board:    the board before the lock, one bit mask per row (bit c is
+              column c), which is all the rules look at
+    piece:    the index of the piece in PIECE_TYPES
+    rotation: its final rotation
+    r, c:     its final position, as place_curr_block has it
+    lines:    the lines the lock cleared
+
+Shards are memory maps that grow a chunk at a time, and a shard's header is
+rewritten with the real record count whenever it grows or is flushed, so
+np.load(path, mmap_mode="r") can read one while it is still being written.
+The header is padded to a fixed length, so rewriting it never moves the data
+"""
+MAGIC = b"\x93NUMPY\x01\x00"
+HEADER_LEN = 256
+PIECE_INDEX = {type: i for i, type in enumerate(PIECE_TYPES)}
+
+
+def record_dtype(num_rows: int = 20, num_cols: int = 10) -> np.dtype:
+    """Returns the record type for boards of a size
+
+    Args:
+        num_rows (int): the number of rows
+        num_cols (int): the number of columns
+
+    Raises:
+        ValueError: if rows are too wide to store as masks
+
+    Returns:
+        np.dtype: the structured record type
+    """
+    for mask in (np.uint8, np.uint16, np.uint32, np.uint64):
+        if num_cols <= 8 * np.dtype(mask).itemsize:
+            break
+    else:
+        raise ValueError("Boards wider than 64 columns can't be exported")
+    return np.dtype([("board", mask, (num_rows,)), ("piece", np.uint8), ("rotation", np.uint8),
+                     ("r", np.int16), ("c", np.int16), ("lines", np.uint8)])
+
+
+def write_header(file, dtype: np.dtype, count: int) -> None:
+    """Writes a version 1.0 .npy header for count records at the start of
+    a file, padded to HEADER_LEN
+
+    Args:
+        file (_type_): the file, open for writing
+        dtype (np.dtype): the record type
+        count (int): the number of records
+    """
+    header = repr({"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False,
+                   "shape": (count,)}).encode("latin1")
+    length = HEADER_LEN - len(MAGIC) - 2
+    if len(header) + 1 > length:
+        raise ValueError("The record type is too big for the header")
+    file.seek(0)
+    file.write(MAGIC + length.to_bytes(2, "little") + header.ljust(length - 1) + b"\n")
+
+
+class DatasetWriter:
+    """
+    Streams locked placements into memory mapped .npy shards. Attach it to
+    an engine with engine.exporter = writer
+    """
+
+    def __init__(self, directory: str, num_rows: int = 20, num_cols: int = 10,
+                 prefix: str = "shard", shard_size: int = 1 << 22, chunk: int = 1 << 16) -> None:
+        """Creates a writer
+
+        Args:
+            directory (str): where to put the shards, created if needed
+            num_rows (int): the number of rows of the boards
+            num_cols (int): the number of columns of the boards
+            prefix (str): the start of the shards' names
+            shard_size (int): the most records per shard
+            chunk (int): how many records to grow a shard by at a time
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.prefix = prefix
+        self.dtype = record_dtype(num_rows, num_cols)
+        self.shard_size = shard_size
+        self.chunk = min(chunk, shard_size)
+        self.shards = 0
+        self.count = 0
+        self.file = None
+        self.records = None
+        self.used = 0
+
+    def open_shard(self) -> None:
+        """Starts the next shard
+        """
+        self.close_shard()
+        path = os.path.join(self.directory, f"{self.prefix}-{self.shards:05d}.npy")
+        self.file = open(path, "w+b")
+        self.shards += 1
+        self.used = 0
+        self.grow()
+
+    def grow(self) -> None:
+        """Makes room for another chunk of records in the current shard. The
+        file is extended without being written, so the space costs nothing
+        until it's used
+        """
+        capacity = min(self.used + self.chunk, self.shard_size)
+        if self.records is not None:
+            self.records.flush()
+        write_header(self.file, self.dtype, self.used)
+        self.file.truncate(HEADER_LEN + capacity * self.dtype.itemsize)
+        self.records = np.memmap(self.file, self.dtype, "r+", HEADER_LEN, (capacity,))
+
+    def record(self, rows: List[int], piece: Tetromino, r: int, c: int, lines: int) -> None:
+        """Appends one locked placement
+
+        Args:
+            rows (List[int]): the board's row masks before the lock
+            piece (Tetromino): the piece
+            r (int): its row
+            c (int): its column
+            lines (int): the lines the lock cleared
+        """
+        if self.records is None or self.used == self.shard_size:
+            self.open_shard()
+        elif self.used == len(self.records):
+            self.grow()
+        self.records[self.used] = (rows, PIECE_INDEX[piece.type], piece.rotation, r, c, lines)
+        self.used += 1
+        self.count += 1
+
+    def flush(self) -> None:
+        """Writes everything so far to disk, and the count to the header
+        """
+        if self.records is not None:
+            self.records.flush()
+            write_header(self.file, self.dtype, self.used)
+            self.file.flush()
+
+    def close_shard(self) -> None:
+        """Finishes the current shard, cutting off the unused space
+        """
+        if self.records is None:
+            return
+        self.flush()
+        # dropping the last reference unmaps it
+        self.records = None
+        self.file.truncate(HEADER_LEN + self.used * self.dtype.itemsize)
+        self.file.close()
+
+    def close(self) -> None:
+        self.close_shard()
+
+    def __enter__(self) -> "DatasetWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def open_dataset(directory: str) -> List[np.ndarray]:
+    """Opens every shard of a dataset without reading them into memory
+
+    Args:
+        directory (str): the dataset
+
+    Returns:
+        List[np.ndarray]: one read only memory map per shard, in order
+    """
+    return [np.load(path, mmap_mode="r")
+            for path in sorted(glob.glob(os.path.join(directory, "*.npy")))]
+
+
+def unpack_boards(boards: np.ndarray, num_cols: int = 10) -> np.ndarray:
+    """Turns row masks back into cells
+
+    Args:
+        boards (np.ndarray): masks, shape (..., rows)
+        num_cols (int): the number of columns
+
+    Returns:
+        np.ndarray: 1 for filled cells and 0 for empty, shape (..., rows, cols)
+    """
+    return ((boards[..., None] >> np.arange(num_cols, dtype=boards.dtype)) & 1).astype(np.uint8)
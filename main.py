@@ -1,11 +1,18 @@
+from randomizer import RANDOMIZERS
 from tetris import Tetris
-import threading
-import playsound
+from replay import ReplayWriter, run_replay, watch_replay
 import argparse
-from blessed import Terminal
+import random
 
 
 def start_music():
+    """
+    The old way to play music, for when miniaudio isn't installed: no
+    effects, and the track is decoded again on every loop
+    """
+    import threading
+    import playsound
+
     def play_music_on_loop():
         while True:
             # should block the background thread
@@ -15,16 +22,94 @@ def start_music():
     sound_thread.start()
 
 
-def main(play_music: bool):
+def start_audio(out: str = None, volume: float = .6):
+    """
+    Starts the music and sound effects, through the sound card or into a
+    WAV file. Returns None if there is no audio engine to use
+    """
+    from audio import AudioEngine, DeviceBackend, WavBackend, can_decode
+    try:
+        backend = WavBackend(out) if out else DeviceBackend()
+    except ImportError:
+        start_music()
+        return None
+    # without miniaudio a WAV file still gets the effects, but no music
+    music = 'tetris.mp3' if can_decode('tetris.mp3') else None
+    audio = AudioEngine(backend, music, volume)
+    if music is None:
+        audio.error = ImportError("decoding tetris.mp3 needs miniaudio")
+    audio.start()
+    return audio
+
+
+def main(play_music: bool, seed: int = None, record: str = None, max_fps: float = 30,
+         perf: bool = False, perf_log: str = None, audio_out: str = None, volume: float = .6,
+         rows: int = 20, cols: int = 10, autoplay: bool = False, plan_budget: float = None,
+         plan_workers: int = 1, beam_width: int = 8, das: float = None, arr: float = None,
+         randomizer: str = "7bag", export: str = None):
     """
     The main runner of the game
     """
+    from blessed import Terminal
 
     term = Terminal()
-    tetris = Tetris(term)
-    if play_music:
-        start_music()
-    tetris.event_loop()
+    tetris = Tetris(term, rows, cols, randomizer)
+    if record and seed is None:
+        seed = random.getrandbits(63)
+    tetris.reset(seed)
+    if record:
+        tetris.recorder = ReplayWriter(record, seed, tetris.numRows, tetris.numCols, randomizer)
+    if export:
+        from dataset import DatasetWriter
+        # a random name, so games can share a directory
+        tetris.exporter = DatasetWriter(export, rows, cols, f"game-{random.getrandbits(32):08x}")
+    if das is not None:
+        tetris.input.das = das / 1000
+    if arr is not None:
+        tetris.input.arr = arr / 1000
+    if perf or perf_log:
+        tetris.enable_profiling(perf_log, show_hud=perf)
+    if play_music or audio_out:
+        tetris.audio = start_audio(audio_out, volume)
+    if autoplay:
+        from planner import BeamPlanner
+        tetris.planner = BeamPlanner(beam_width, budget=plan_budget, workers=plan_workers)
+    try:
+        tetris.event_loop(max_fps)
+    finally:
+        if tetris.recorder:
+            tetris.recorder.close()
+        if tetris.exporter:
+            tetris.exporter.close()
+        if tetris.profiler:
+            tetris.profiler.close()
+            latency = tetris.input.latency()
+            print(f"input latency: p50 {latency['p50']:.1f} ms, p99 {latency['p99']:.1f} ms, "
+                  f"max {latency['max']:.1f} ms over {latency['count']} keys")
+        if tetris.audio:
+            tetris.audio.stop()
+            if tetris.audio.error:
+                print(f"music: off, {tetris.audio.error}")
+        if tetris.planner:
+            tetris.planner.close()
+            table = tetris.planner.table.stats()
+            print(f"planner: {tetris.planner.nodes_per_second():,.0f} nodes/s, "
+                  f"table {table['hits']} hits, {table['misses']} misses "
+                  f"({table['hit_rate']:.0%})")
+
+
+def replay(path: str, watch: bool):
+    """
+    Re-runs a recorded game and checks it ends on the same board
+    """
+    if watch:
+        from blessed import Terminal
+    result = watch_replay(path, Terminal()) if watch else run_replay(path)
+    print(f"{result.inputs} inputs, {result.engine.tick} ticks in {result.seconds:.3f}s")
+    if result.matches is None:
+        print("replay has no end record, the game was not finished")
+    else:
+        print("final board matches" if result.matches else "final board DOES NOT match")
 
 
 if __name__ == "__main__":
@@ -32,5 +117,51 @@ if __name__ == "__main__":
         description="play tetris in the terminal!")
     parser.add_argument(
         '-m', '--music', action='store_true', help="Play music!")
+    parser.add_argument(
+        '--volume', type=float, default=.6, help="Music volume, from 0 to 1")
+    parser.add_argument(
+        '--audio-out', metavar='FILE', help="Write the music and effects to a WAV file instead")
+    parser.add_argument(
+        '-s', '--seed', type=int, help="Seed for the piece bags")
+    parser.add_argument(
+        '--randomizer', default="7bag", choices=list(RANDOMIZERS),
+        help="How pieces are dealt")
+    parser.add_argument(
+        '--rows', type=int, default=20, help="Rows of the board")
+    parser.add_argument(
+        '--cols', type=int, default=10, help="Columns of the board")
+    parser.add_argument(
+        '-r', '--record', metavar='FILE', help="Record a replay of the game")
+    parser.add_argument(
+        '--fps', type=float, default=30, help="Most frames to draw per second")
+    parser.add_argument(
+        '--das', type=float, metavar='MS', help="Delay before a held shift key repeats")
+    parser.add_argument(
+        '--arr', type=float, metavar='MS', help="Time between repeats, 0 to go to the wall")
+    parser.add_argument(
+        '-e', '--export', metavar='DIR', help="Write every placement to a training dataset")
+    parser.add_argument(
+        '--perf', action='store_true', help="Show frame timings next to the board")
+    parser.add_argument(
+        '--perf-log', metavar='FILE', help="Write per-frame timings as JSON lines")
+    parser.add_argument(
+        '--autoplay', action='store_true', help="Let the lookahead planner play")
+    parser.add_argument(
+        '--plan-budget', type=float, metavar='SECONDS',
+        help="Time to plan each piece for, half a gravity tick by default")
+    parser.add_argument(
+        '--plan-workers', type=int, default=1, help="Processes to plan with")
+    parser.add_argument(
+        '--beam-width', type=int, default=8, help="Boards the planner keeps per piece")
+    parser.add_argument(
+        '--replay', metavar='FILE', help="Re-run a recorded game headlessly")
+    parser.add_argument(
+        '-w', '--watch', action='store_true', help="Watch --replay at real speed")
     args = parser.parse_args()
-    main(args.music)
+    if args.replay:
+        replay(args.replay, args.watch)
+    else:
+        main(args.music, args.seed, args.record, args.fps, args.perf, args.perf_log,
+             args.audio_out, args.volume, args.rows, args.cols, args.autoplay,
+             args.plan_budget, args.plan_workers, args.beam_width, args.das, args.arr,
+             args.randomizer, args.export)
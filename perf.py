@@ -0,0 +1,123 @@
+from collections import deque
+from typing import Callable, List, Optional
+import json
+import time
+from stats import percentile
+
+"""The phases of a frame. drop_search is nested inside logic and render,
+the others add up to the whole frame
+"""
+PHASES = ("input", "logic", "drop_search", "render")
+
+
+class FrameProfiler:
+    """
+    Times each phase of the event loop and the terminal output of every
+    frame. A frame is everything between two rendered frames, so logic
+    passes that didn't draw anything are folded into the next frame
+    """
+
+    def __init__(self, log_path: Optional[str] = None, show_hud: bool = True,
+                 window: int = 256, clock=time.perf_counter) -> None:
+        """Creates a profiler
+
+        Args:
+            log_path (Optional[str]): where to write one JSON line per frame
+            show_hud (bool): whether the game should draw the HUD
+            window (int): how many recent frames the percentiles cover
+            clock (optional): the clock to use, in seconds
+        """
+        self.show_hud = show_hud
+        self.clock = clock
+        self.log = open(log_path, "w") if log_path else None
+        self.frame_times = deque(maxlen=window)
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.last = clock()
+        self.frames = 0
+        self.last_bytes = 0
+        self.last_flushes = 0
+        self.sample = None
+
+    def mark(self, phase: str) -> None:
+        """Adds the time since the last mark to a phase
+
+        Args:
+            phase (str): the phase that just ended
+        """
+        now = self.clock()
+        self.phases[phase] += now - self.last
+        self.last = now
+
+    def wrap(self, phase: str, fn: Callable) -> Callable:
+        """Returns fn, timed into a phase
+
+        Args:
+            phase (str): the phase
+            fn (Callable): the function
+
+        Returns:
+            Callable: the timed function
+        """
+        clock = self.clock
+        phases = self.phases
+
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                phases[phase] += clock() - start
+        return timed
+
+    def end_frame(self, total_bytes: int, total_flushes: int) -> dict:
+        """Records the frame that was just drawn and starts the next one
+
+        Args:
+            total_bytes (int): bytes the renderer has written so far
+            total_flushes (int): flushes the renderer has done so far
+
+        Returns:
+            dict: the frame's sample
+        """
+        phases = self.phases
+        sample = {f"{phase}_ms": 1000 * phases[phase] for phase in PHASES}
+        sample["frame"] = self.frames
+        sample["work_ms"] = sample["logic_ms"] + sample["render_ms"]
+        sample["bytes"] = total_bytes - self.last_bytes
+        sample["flushes"] = total_flushes - self.last_flushes
+        self.last_bytes, self.last_flushes = total_bytes, total_flushes
+        self.frame_times.append(sample["work_ms"])
+        if self.log:
+            self.log.write(json.dumps(sample) + "\n")
+        self.frames += 1
+        self.sample = sample
+        for phase in PHASES:
+            phases[phase] = 0.0
+        return sample
+
+    def hud_lines(self) -> List[str]:
+        """Returns the lines of the performance HUD
+
+        Returns:
+            List[str]: the HUD text
+        """
+        ordered = sorted(self.frame_times)
+        sample = self.sample or dict.fromkeys(("logic_ms", "drop_search_ms", "render_ms",
+                                               "bytes", "flushes"), 0)
+        return [
+            f"frame  {self.frames}",
+            f"p50    {percentile(ordered, 50):6.2f} ms",
+            f"p95    {percentile(ordered, 95):6.2f} ms",
+            f"p99    {percentile(ordered, 99):6.2f} ms",
+            f"logic  {sample['logic_ms']:6.2f} ms",
+            f"drop   {sample['drop_search_ms']:6.2f} ms",
+            f"render {sample['render_ms']:6.2f} ms",
+            f"bytes  {sample['bytes']}",
+            f"flush  {sample['flushes']}",
+        ]
+
+    def close(self) -> None:
+        """Closes the frame log, if any
+        """
+        if self.log:
+            self.log.close()
@@ -0,0 +1,165 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Iterable, List, NamedTuple, Optional
+import argparse
+import json
+import os
+import sys
+import time
+from bot import apply_placement
+from tetris import Board, TetrisEngine, Tetromino, TetrominoType
+
+"""Distinct boards after each piece, from an empty 20x10 board with the
+pieces of seed 0. Any change to the rules or the engine's data structures
+that changes these is a bug, or needs them updated on purpose
+"""
+KNOWN = {0: [17, 578, 10107, 177846]}
+
+
+class PerftResult(NamedTuple):
+    """
+    The size of a placement tree, and how long it took to walk
+    """
+
+    counts: List[int]
+    nodes: int
+    seconds: float
+
+    @property
+    def nodes_per_second(self) -> float:
+        return self.nodes / self.seconds if self.seconds else 0.0
+
+
+def piece_sequence(seed: Optional[int], count: int) -> List[TetrominoType]:
+    """Returns the pieces a game with this seed deals, in order
+
+    Args:
+        seed (Optional[int]): the seed
+        count (int): how many pieces
+
+    Returns:
+        List[TetrominoType]: the pieces
+    """
+    engine = TetrisEngine(seed)
+    pieces = []
+    while len(pieces) < count:
+        # spawn_block takes pieces from the end of the bag
+        pieces += [piece.type for piece in reversed(engine.generate_piece_bag())]
+    return pieces[:count]
+
+
+def children(engine: TetrisEngine, board: Board, type: TetrominoType) -> List[Board]:
+    """Lists the boards a piece can leave behind, by the engine's own rules:
+    it spawns as spawn_block has it, and moves, rotates and locks as
+    find_placements has it
+
+    Args:
+        engine (TetrisEngine): an engine to search with, its board is replaced
+        board (Board): the board, which is not changed
+        type (TetrominoType): the piece
+
+    Returns:
+        List[Board]: one board per placement, empty if the piece can't spawn
+    """
+    engine.grid = board
+    piece = Tetromino.of(type)
+    r, c = engine.spawn_position(piece)
+    if engine.piece_would_collide(piece, -piece.get_bottom_boundary(), c):
+        # topped out
+        return []
+    return [apply_placement(board, placement)[0]
+            for placement in engine.find_placements(piece, r, c)]
+
+
+def expand(boards: Iterable[Board], pieces: List[TetrominoType]) -> tuple:
+    """Places the pieces in turn on every board, in every way. Boards are
+    told apart by which cells are filled, which is all the rules look at,
+    so a board reached in more than one way is only searched once
+
+    Args:
+        boards (Iterable[Board]): the boards to start from
+        pieces (List[TetrominoType]): the pieces
+
+    Returns:
+        tuple: a set of the boards after each piece, and the number of
+        placements made
+    """
+    boards = list(boards)
+    if not boards:
+        return [set() for _ in pieces], 0
+    engine = TetrisEngine(num_rows=boards[0].num_rows, num_cols=boards[0].num_cols)
+    levels = []
+    nodes = 0
+    for type in pieces:
+        following = {}
+        for board in boards:
+            for child in children(engine, board, type):
+                nodes += 1
+                following.setdefault(tuple(child.rows), child)
+        levels.append(set(following))
+        boards = following.values()
+    return levels, nodes
+
+
+def perft(board: Board, pieces: List[TetrominoType], workers: int = 1) -> PerftResult:
+    """Counts the distinct boards after each of the pieces. With more than
+    one worker, the boards after the first piece are split between worker
+    processes, and their boards are merged level by level
+
+    Args:
+        board (Board): the board to start from
+        pieces (List[TetrominoType]): the pieces, one per level
+        workers (int): the number of processes to use
+
+    Returns:
+        PerftResult: the counts, placements made and seconds taken
+    """
+    start = time.perf_counter()
+    if workers > 1 and len(pieces) > 1:
+        engine = TetrisEngine(num_rows=board.num_rows, num_cols=board.num_cols)
+        first = children(engine, board, pieces[0])
+        roots = list({tuple(child.rows): child for child in first}.values())
+        nodes = len(first)
+        chunks = [roots[i::workers] for i in range(workers)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(expand, chunks, repeat(pieces[1:])))
+        counts = [len(roots)]
+        for depth in range(len(pieces) - 1):
+            counts.append(len(set().union(*(levels[depth] for levels, _ in results))))
+        nodes += sum(count for _, count in results)
+    else:
+        levels, nodes = expand([board], pieces)
+        counts = [len(level) for level in levels]
+    return PerftResult(counts, nodes, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="count every board a seed's pieces can make, as a check and a benchmark")
+    parser.add_argument(
+        '-d', '--depth', type=int, default=3, help="Number of pieces to place")
+    parser.add_argument(
+        '-s', '--seed', type=int, default=0, help="Seed for the pieces")
+    parser.add_argument(
+        '-w', '--workers', type=int, default=os.cpu_count(), help="Number of worker processes")
+    parser.add_argument(
+        '--rows', type=int, default=20, help="Rows of the board")
+    parser.add_argument(
+        '--cols', type=int, default=10, help="Columns of the board")
+    parser.add_argument(
+        '--snapshot', metavar='FILE', help="Start from the board of a saved snapshot")
+    args = parser.parse_args()
+    if args.snapshot:
+        from snapshot import decode_snapshot
+        with open(args.snapshot, "rb") as file:
+            start = decode_snapshot(file.read()).grid
+    else:
+        start = Board(args.rows, args.cols)
+    result = perft(start, piece_sequence(args.seed, args.depth), args.workers)
+    print(json.dumps({"seed": args.seed, "counts": result.counts, "nodes": result.nodes,
+                      "seconds": result.seconds,
+                      "nodes_per_second": result.nodes_per_second}, indent=2))
+    known = KNOWN.get(args.seed) if not args.snapshot and (args.rows, args.cols) == (20, 10) else None
+    if known and result.counts[:len(known)] != known[:len(result.counts)]:
+        print(f"counts DO NOT match the known counts {known}")
+        sys.exit(1)
@@ -0,0 +1,245 @@
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from typing import List, NamedTuple, Optional
+import time
+from bot import apply_placement, evaluate_board
+from tetris import ROTATION_STATES, Board, Placement, TetrisEngine, TetrominoType
+from transposition import TranspositionTable
+
+"""Workers stop this share of the budget, and at least this many seconds,
+before the plan's deadline, which leaves time to send their results back
+and pick a move
+"""
+DISPATCH_SHARE = .15
+DISPATCH_MARGIN = .003
+
+
+class PlanResult(NamedTuple):
+    """
+    The move a plan settled on, and how hard it looked
+    """
+
+    placement: Optional[Placement]
+    depth: int
+    nodes: int
+    seconds: float
+
+
+def drop_children(board: Board, type: TetrominoType) -> List[tuple]:
+    """Lists the boards a piece can leave by dropping straight down in every
+    orientation and column. This skips tucks and spins, which makes it much
+    cheaper than find_placements, so it's what the lookahead uses
+
+    Args:
+        board (Board): the board
+        type (TetrominoType): the piece
+
+    Returns:
+        List[tuple]: (board, lines cleared) for every drop
+    """
+    children = []
+    seen = set()
+    for state in ROTATION_STATES[type]:
+        if state.shape_id in seen:
+            continue
+        seen.add(state.shape_id)
+        r = -state.bottom - 2
+        for c in range(-state.left, board.num_cols - state.right):
+            landing = board.landing_row(state, r, c)
+            if landing + state.top < 0:
+                # sticks out of the top, which ends the game
+                continue
+            child = board.copy()
+            child.place(state.cells, type, landing, c)
+            children.append((child, child.clear_full_lines(landing + i for i, _ in state.row_masks)))
+    return children
+
+
+def search(roots: List[tuple], pieces: List[TetrominoType], width: int,
+           deadline: float) -> tuple:
+    """Beam searches ahead of some root moves, one known piece per level,
+    keeping the width best boards of every level. Stops at the deadline,
+    and only levels that were searched in full count
+
+    Args:
+        roots (List[tuple]): (index, board, lines cleared) per root move
+        pieces (List[TetrominoType]): the known pieces after the current one
+        width (int): the beam width
+        deadline (float): when to stop, by time.monotonic
+
+    Returns:
+        tuple: {depth: (score, root index)} for every finished level, and
+        the number of nodes searched
+    """
+    beam = sorted(((evaluate_board(board, lines), index, board, lines)
+                   for index, board, lines in roots), key=lambda node: node[0], reverse=True)
+    nodes = len(beam)
+    best = {1: beam[0][:2]} if beam else {}
+    beam = beam[:width]
+    for depth, type in enumerate(pieces, start=2):
+        children = []
+        for _, index, board, lines in beam:
+            if time.monotonic() >= deadline:
+                return best, nodes
+            for child, cleared in drop_children(board, type):
+                children.append((evaluate_board(child, lines + cleared), index, child,
+                                 lines + cleared))
+                nodes += 1
+        if not children:
+            break
+        children.sort(key=lambda node: node[0], reverse=True)
+        beam = children[:width]
+        best[depth] = beam[0][:2]
+    return best, nodes
+
+
+def search_masks(roots: List[tuple], num_cols: int, pieces: List[TetrominoType], width: int,
+                 deadline: float) -> tuple:
+    """Runs search in a worker process. Roots come as row masks, which is
+    all the search looks at and much less to send than whole boards. The
+    deadline is absolute: time.monotonic is the same clock in every process
+    on a machine, so the time the task took to arrive counts against it
+
+    Args:
+        roots (List[tuple]): (index, row masks, lines cleared) per root move
+        num_cols (int): the number of columns of the boards
+        pieces (List[TetrominoType]): see search
+        width (int): see search
+        deadline (float): see search
+
+    Returns:
+        tuple: see search
+    """
+    boards = []
+    for index, rows, lines in roots:
+        board = Board(len(rows), num_cols)
+        board.rows = list(rows)
+        board.refresh_surface()
+        boards.append((index, board, lines))
+    return search(boards, pieces, width, deadline)
+
+
+class BeamPlanner:
+    """
+    An anytime lookahead planner: it scores every reachable placement of
+    the current block first, so it always has a move, then searches deeper
+    using the coming pieces until its time is up. The root moves
+    can be split across worker processes
+    """
+
+    def __init__(self, width: int = 8, depth: int = 7, budget: Optional[float] = None,
+                 fraction: float = .5, workers: int = 1, table_size: int = 10_000) -> None:
+        """Creates a planner
+
+        Args:
+            width (int): the beam width
+            depth (int): the most pieces to look at, the current one included
+            budget (Optional[float]): seconds per plan, see budget_for
+            fraction (float): the share of a gravity tick to plan for, if
+                there is no fixed budget
+            workers (int): the number of processes to search with
+            table_size (int): entries in the placement cache
+        """
+        self.width = width
+        self.depth = depth
+        self.budget = budget
+        self.fraction = fraction
+        self.workers = workers
+        self.pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        self.table = TranspositionTable(table_size)
+        self.nodes = 0
+        self.seconds = 0.0
+        self.last = None
+
+    def budget_for(self, tick_time: float) -> float:
+        """Returns the seconds to plan for in a game with the given tick
+
+        Args:
+            tick_time (float): seconds per gravity tick
+
+        Returns:
+            float: the budget
+        """
+        return self.budget if self.budget is not None else tick_time * self.fraction
+
+    def plan(self, engine: TetrisEngine, budget: float) -> PlanResult:
+        """Picks a placement for the current block
+
+        Args:
+            engine (TetrisEngine): the game
+            budget (float): the seconds to take, at most
+
+        Returns:
+            PlanResult: the placement (None if there is none) and the search stats
+        """
+        start = time.monotonic()
+        deadline = start + budget
+        key = engine.position_hash()
+        placements = self.table.get(key)
+        if placements is None:
+            placements = engine.reachable_placements()
+            self.table.put(key, placements)
+        roots = [(index, *apply_placement(engine.grid, placement))
+                 for index, placement in enumerate(placements)]
+        pieces = engine.preview(self.depth - 1)
+
+        if self.pool and len(roots) > 1:
+            chunks = [[(index, board.rows, lines) for index, board, lines in roots[i::self.workers]]
+                      for i in range(self.workers)]
+            margin = max(DISPATCH_MARGIN, DISPATCH_SHARE * budget)
+            futures = [self.pool.submit(search_masks, chunk, engine.grid.num_cols, pieces,
+                                        self.width, deadline - margin)
+                       for chunk in chunks if chunk]
+            # the best first move, in case a worker doesn't answer in time
+            fallback = search(roots, [], self.width, deadline)
+            try:
+                results = [future.result(timeout=max(0.0, deadline - time.monotonic()))
+                           for future in futures]
+            except TimeoutError:
+                for future in futures:
+                    future.cancel()
+                results = [fallback]
+        else:
+            results = [search(roots, pieces, self.width, deadline)]
+
+        # only compare levels every worker finished
+        depth = min((max(best, default=0) for best, _ in results), default=0)
+        nodes = sum(count for _, count in results)
+        placement = None
+        if depth:
+            _, index = max(best[depth] for best, _ in results)
+            placement = placements[index]
+        seconds = time.monotonic() - start
+        self.nodes += nodes
+        self.seconds += seconds
+        self.last = PlanResult(placement, depth, nodes, seconds)
+        return self.last
+
+    def nodes_per_second(self) -> float:
+        """Returns the search speed over every plan so far
+
+        Returns:
+            float: nodes per second
+        """
+        return self.nodes / self.seconds if self.seconds else 0.0
+
+    def hud_lines(self) -> List[str]:
+        """Returns lines about the planner to show next to the board
+
+        Returns:
+            List[str]: the text
+        """
+        last = self.last or PlanResult(None, 0, 0, 0.0)
+        table = self.table.stats()
+        return [
+            f"depth  {last.depth}",
+            f"nodes  {last.nodes}",
+            f"plan   {1000 * last.seconds:6.2f} ms",
+            f"n/s    {self.nodes_per_second():,.0f}",
+            f"table  {table['hits']} hits {table['misses']} misses {table['hit_rate']:.0%}",
+        ]
+
+    def close(self) -> None:
+        """Shuts down the worker processes, if any
+        """
+        if self.pool:
+            self.pool.shutdown()
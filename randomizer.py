@@ -0,0 +1,203 @@
+from random import Random
+from typing import Dict, List, Optional, Union
+from tetris import PIECE_TYPES, TetrominoType
+
+"""Pieces are numbered by their index in PIECE_TYPES in piece streams, the
+same as in batch.py
+"""
+INDEX = {type: i for i, type in enumerate(PIECE_TYPES)}
+
+
+class Randomizer:
+    """
+    A way of dealing pieces. Randomizers draw from the generator they are
+    handed, never the global one, so a seed always deals the same pieces.
+    Any other state (like a history) is their own, and reset clears it
+    """
+
+    name = None
+
+    def deal(self, rng: Random) -> List[TetrominoType]:
+        """Deals the next few pieces
+
+        Args:
+            rng (Random): the generator to draw from
+
+        Returns:
+            List[TetrominoType]: the pieces, in the order they come
+        """
+        raise NotImplementedError
+
+    def reset(self) -> None:
+        """Forgets what was dealt, for a new game
+        """
+
+    def getstate(self) -> bytes:
+        """Returns the randomizer's own state, for snapshots. With the
+        generator's state it's enough to deal the same pieces again
+
+        Returns:
+            bytes: the state, empty if it has none
+        """
+        return b""
+
+    def setstate(self, state: bytes) -> None:
+        """Restores what getstate returned
+
+        Args:
+            state (bytes): the state
+        """
+
+
+class SevenBag(Randomizer):
+    """
+    Every piece once, in a random order, then again
+    """
+
+    name = "7bag"
+    copies = 1
+
+    def deal(self, rng: Random) -> List[TetrominoType]:
+        bag = list(PIECE_TYPES) * self.copies
+        rng.shuffle(bag)
+        # the engine used to pop its shuffled bag from the end; keep dealing
+        # in that order so old seeds and replays give the same games
+        bag.reverse()
+        return bag
+
+
+class FourteenBag(SevenBag):
+    """
+    Every piece twice, in a random order, so droughts and repeats can be a
+    little longer than with a 7-bag
+    """
+
+    name = "14bag"
+    copies = 2
+
+
+class History(Randomizer):
+    """
+    Rerolls a piece that was one of the last few dealt, up to a few times,
+    like the Tetris: The Grand Master games. The first piece is never an
+    S, Z or O
+    """
+
+    name = "history"
+
+    def __init__(self, size: int = 4, rolls: int = 6) -> None:
+        """Creates a randomizer
+
+        Args:
+            size (int): how many recent pieces to avoid
+            rolls (int): the most draws per piece
+        """
+        self.size = size
+        self.rolls = rolls
+        self.reset()
+
+    def reset(self) -> None:
+        self.history = [TetrominoType.Z] * self.size
+        self.first = True
+
+    def deal(self, rng: Random) -> List[TetrominoType]:
+        if self.first:
+            self.first = False
+            piece = rng.choice((TetrominoType.I, TetrominoType.J, TetrominoType.L,
+                                TetrominoType.T))
+        else:
+            for _ in range(self.rolls):
+                piece = rng.choice(PIECE_TYPES)
+                if piece not in self.history:
+                    break
+        self.history = self.history[1:] + [piece]
+        return [piece]
+
+    def getstate(self) -> bytes:
+        return bytes([self.first, *(INDEX[type] for type in self.history)])
+
+    def setstate(self, state: bytes) -> None:
+        self.first = bool(state[0])
+        self.history = [PIECE_TYPES[code] for code in state[1:]]
+
+
+class PureRandom(Randomizer):
+    """
+    Any piece, every time
+    """
+
+    name = "random"
+
+    def deal(self, rng: Random) -> List[TetrominoType]:
+        return [rng.choice(PIECE_TYPES)]
+
+
+RANDOMIZERS = {randomizer.name: randomizer for randomizer in
+               (SevenBag, FourteenBag, History, PureRandom)}
+# replays store the randomizer as its position here, so only ever append
+CODES: Dict[str, int] = {name: i for i, name in enumerate(RANDOMIZERS)}
+
+
+def make_randomizer(randomizer: Union[str, Randomizer, None] = None) -> Randomizer:
+    """Returns a randomizer
+
+    Args:
+        randomizer (Union[str, Randomizer, None]): a name from RANDOMIZERS,
+            or a randomizer to use as is; 7-bag by default
+
+    Raises:
+        ValueError: if there is no randomizer by that name
+
+    Returns:
+        Randomizer: the randomizer
+    """
+    if isinstance(randomizer, Randomizer):
+        return randomizer
+    name = randomizer or SevenBag.name
+    if name not in RANDOMIZERS:
+        raise ValueError(f"No randomizer called {name!r}, try one of {', '.join(RANDOMIZERS)}")
+    return RANDOMIZERS[name]()
+
+
+class PieceStream:
+    """
+    A long run of pieces dealt up front, one byte per piece, so looking
+    ahead is just indexing. codes can be read straight into numpy with
+    np.frombuffer(stream.codes, np.uint8)
+    """
+
+    def __init__(self, randomizer: Union[str, Randomizer, None] = None,
+                 seed: Optional[int] = None, length: int = 10_000) -> None:
+        """Deals the stream
+
+        Args:
+            randomizer (Union[str, Randomizer, None]): see make_randomizer
+            seed (Optional[int]): the seed, the same one deals the same pieces
+                as a TetrisEngine with that seed
+            length (int): the number of pieces
+        """
+        randomizer = make_randomizer(randomizer)
+        randomizer.reset()
+        rng = Random(seed)
+        codes = bytearray()
+        while len(codes) < length:
+            codes.extend(INDEX[type] for type in randomizer.deal(rng))
+        self.codes = bytes(codes[:length])
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, i: int) -> TetrominoType:
+        return PIECE_TYPES[self.codes[i]]
+
+    def peek(self, start: int, count: int) -> List[TetrominoType]:
+        """Returns the pieces from start on
+
+        Args:
+            start (int): the first piece
+            count (int): how many
+
+        Returns:
+            List[TetrominoType]: the pieces, fewer if the stream ends
+        """
+        return [PIECE_TYPES[code] for code in self.codes[start:start + count]]
@@ -0,0 +1,244 @@
+from typing import List, Optional
+from tetris import PIECE_TYPES, TetrominoType
+
+"""Marker for a ghost cell in a frame buffer. Every ghost cell is drawn the
+same way, whatever the type of the current block
+"""
+GHOST = "ghost"
+
+
+class Palette:
+    """
+    The escape sequences for every kind of cell, rendered once for a
+    terminal and block width, so drawing is just joining strings
+    """
+
+    def __init__(self, term, block_width: int) -> None:
+        """Renders a palette
+
+        Args:
+            term (Terminal): the terminal to draw to
+            block_width (int): the number of characters per board cell
+        """
+        self.block_width = block_width
+        self.normal = term.normal
+        # the sequence that switches to each cell's background
+        self.colors = {key: str(FrameRenderer.style(term, key))
+                       for key in (*PIECE_TYPES, GHOST)}
+        self.colors[TetrominoType.X] = self.normal
+        self.blank = " " * block_width
+        self.border = term.on_gray44(" ")
+
+
+class FrameRenderer:
+    """
+    Draws a game of tetris by composing each frame into an in-memory buffer
+    of board cells and writing only the cells that changed since the last
+    frame, in a single write
+    """
+
+    def __init__(self, term) -> None:
+        """Creates a renderer
+
+        Args:
+            term (Terminal): the terminal to draw to
+        """
+        self.term = term
+        self.last_frame = None
+        self.palette = None
+        self.bytes_written = 0
+        self.flushes = 0
+
+    def invalidate(self) -> None:
+        """Forces a full redraw on the next frame
+        """
+        self.last_frame = None
+
+    def compose(self, game) -> List[list]:
+        """Composes a frame: the board with the ghost and current block on
+        top, cut down to the game's viewport
+
+        Args:
+            game (Tetris): the game to draw
+
+        Returns:
+            List[list]: one TetrominoType (or GHOST) per cell in view
+        """
+        game.update_viewport()
+        top, left = game.view_r, game.view_c
+        rows, cols = game.view_rows, game.view_cols
+        frame = [row[left:left + cols] for row in game.grid.colors[top:top + rows]]
+        block = game.curr_block
+        if block:
+            down_r, down_c = game.find_curr_block_bottom_xy()
+            for r, c, key in ((down_r - top, down_c - left, GHOST),
+                              (game.curr_block_r - top, game.curr_block_c - left, block.type)):
+                for i, j in block.state.cells:
+                    if 0 <= r + i < rows and 0 <= c + j < cols:
+                        frame[r + i][c + j] = key
+        return frame
+
+    def render(self, game, overlay: Optional[List[str]] = None) -> None:
+        """Draws a frame of the game, redrawing everything only if the
+        terminal was resized
+
+        Args:
+            game (Tetris): the game to draw
+            overlay (Optional[List[str]]): lines of text to draw to the
+                right of the board
+        """
+        term = self.term
+        out = []
+        if game.calculate_term_dimensions() or self.last_frame is None:
+            # board was resized! clear
+            out.append(term.clear)
+            self.palette = Palette(term, game.block_width)
+            out.append(self.draw_border(game))
+            self.last_frame = None
+
+        frame = self.compose(game)
+        last = self.last_frame
+        for r, row in enumerate(frame):
+            if last is not None and row == last[r]:
+                continue
+            for start, end in self.changed_spans(game, row, last and last[r]):
+                out.append(self.draw_span(game, r, start, row[start:end]))
+        self.last_frame = frame
+
+        if overlay:
+            x = game.zero_c + game.block_width * game.view_cols + 3
+            width = max(len(line) for line in overlay)
+            for i, line in enumerate(overlay):
+                out.append(term.move_xy(x, game.zero_r + i) + line.ljust(width))
+
+        if out:
+            text = "".join(out)
+            term.stream.write(text)
+            term.stream.flush()
+            # the output is all ASCII, so characters are bytes
+            self.bytes_written += len(text)
+            self.flushes += 1
+
+    def draw_border(self, game) -> str:
+        """Draws the border of a board
+
+        Args:
+            game (Tetris): the game to draw
+
+        Returns:
+            str: the terminal output
+        """
+        term = self.term
+        inner_width = game.block_width * game.view_cols
+        inner_height = game.block_height * game.view_rows
+        bar = term.on_gray44(" " * (inner_width + 2))
+        out = [
+            term.move_xy(game.zero_c - 1, game.zero_r - 1) + bar,
+            term.move_xy(game.zero_c - 1, game.zero_r + inner_height) + bar,
+        ]
+        side = self.palette.border
+        for i in range(inner_height):
+            out.append(term.move_xy(game.zero_c - 1, game.zero_r + i) + side)
+            out.append(term.move_xy(game.zero_c + inner_width, game.zero_r + i) + side)
+        return "".join(out)
+
+    def changed_spans(self, game, row: list, last_row: Optional[list]) -> List[tuple]:
+        """Finds the spans of a row to redraw: the changed cells, with short
+        runs of unchanged cells between them redrawn too when that's cheaper
+        than moving the cursor past them
+
+        Args:
+            game (Tetris): the game being drawn
+            row (list): the row in the new frame
+            last_row (Optional[list]): the row in the last frame, if any
+
+        Returns:
+            List[tuple]: (start, end) column ranges
+        """
+        if last_row is None:
+            return [(0, len(row))]
+        colors = self.palette.colors
+        width = self.palette.block_width
+        move_cost = len(self.term.move_xy(game.zero_c, game.zero_r))
+        spans = []
+        for c, key in enumerate(row):
+            if key == last_row[c]:
+                continue
+            if spans:
+                end = spans[-1][1]
+                cost = 0
+                for prev, gap in zip(row[end - 1:c - 1], row[end:c]):
+                    cost += width + (len(colors[gap]) if gap != prev else 0)
+                if cost < move_cost:
+                    spans[-1][1] = c + 1
+                    continue
+            spans.append([c, c + 1])
+        return spans
+
+    def draw_span(self, game, r: int, c: int, keys: list) -> str:
+        """Draws a run of cells on one board row, which covers block_height
+        terminal rows. Cells of the same colour are drawn as one run, and
+        each terminal row needs one cursor move
+
+        Args:
+            game (Tetris): the game being drawn
+            r (int): the row in the viewport
+            c (int): the first column in the viewport
+            keys (list): the type (or GHOST) of each cell
+
+        Returns:
+            str: the terminal output
+        """
+        term = self.term
+        palette = self.palette
+        colors, blank = palette.colors, palette.blank
+        parts = []
+        # every write leaves the terminal at the normal style
+        current = TetrominoType.X
+        run = 0
+        for key in keys:
+            if key != current:
+                if run:
+                    parts.append(blank * run)
+                parts.append(colors[key])
+                current, run = key, 0
+            run += 1
+        parts.append(blank * run)
+        if current != TetrominoType.X:
+            parts.append(palette.normal)
+        text = "".join(parts)
+        x = game.zero_c + c * game.block_width
+        y = game.zero_r + r * game.block_height
+        return "".join(term.move_xy(x, y + i) + text for i in range(game.block_height))
+
+    @staticmethod
+    def style(term, key):
+        """Returns the formatter for a cell
+
+        Args:
+            term (Terminal): the terminal to draw to
+            key (TetrominoType | str): the type to draw, or GHOST
+
+        Returns:
+            Callable[[str], str]: the formatter
+        """
+        t = TetrominoType
+        match key:
+            case t.I:
+                return term.on_cyan
+            case t.O:
+                return term.on_yellow
+            case t.T:
+                return term.on_purple
+            case t.J:
+                return term.on_blue
+            case t.L:
+                return term.on_orange
+            case t.S:
+                return term.on_green4
+            case t.Z:
+                return term.on_red
+            case t.X:
+                return str
+            case _:  # GHOST
+                return term.on_gray89
@@ -0,0 +1,266 @@
+from typing import Iterator, NamedTuple, Optional
+import mmap
+import struct
+import time
+import zlib
+from randomizer import CODES, RANDOMIZERS, make_randomizer
+from tetris import Action, Board, Tetris, TetrisEngine
+
+"""A replay is a header followed by one record per input:
+
+    header: magic, version, flags, rows, cols, seed (little endian "<4sBBHHq"),
+            where the low bits of flags are the randomizer's code, and the
+            seed is signed since the game takes any int (version 1 stored
+            it unsigned, "<4sBBHHQ")
+    input:  one byte, the Action value with the high bit set if the step
+            was also a gravity tick, then the varint tick delta
+    end:    0xFF, then the varint tick delta and the CRC-32 of the final board
+
+Pure gravity ticks are not recorded, since a replay can always catch up to
+the tick of the next input. Ticks are delta encoded, so an input usually
+costs two bytes
+"""
+MAGIC = b"PTRP"
+VERSION = 2
+HEADERS = {1: struct.Struct("<4sBBHHQ"), VERSION: struct.Struct("<4sBBHHq")}
+HEADER = HEADERS[VERSION]
+GRAVITY_BIT = 0x80
+END = 0xFF
+RANDOMIZER_BITS = 0x0F
+
+
+def board_digest(board: Board) -> int:
+    """Returns a checksum of the board's occupancy and colours
+
+    Args:
+        board (Board): the board
+
+    Returns:
+        int: the CRC-32
+    """
+    width = (board.num_cols + 7) // 8
+    digest = zlib.crc32(b"".join(row.to_bytes(width, "little") for row in board.rows))
+    colors = "".join(str(type) for row in board.colors for type in row)
+    return zlib.crc32(colors.encode(), digest)
+
+
+def encode_varint(value: int) -> bytes:
+    """Encodes an unsigned integer 7 bits at a time, low bits first
+
+    Args:
+        value (int): the integer
+
+    Returns:
+        bytes: the encoding
+    """
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+class ReplayWriter:
+    """
+    Streams a game's inputs to an append-only replay file as it is played.
+    Attach it to an engine with engine.recorder = writer
+    """
+
+    def __init__(self, path: str, seed: int, num_rows: int, num_cols: int,
+                 randomizer: str = "7bag") -> None:
+        """Creates the file and writes the header
+
+        Args:
+            path (str): where to write the replay
+            seed (int): the seed the game was reset with
+            num_rows (int): the number of rows of the board
+            num_cols (int): the number of columns of the board
+            randomizer (str): the name of the game's randomizer
+
+        Raises:
+            ValueError: if the seed doesn't fit in 64 bits, signed
+        """
+        if not -1 << 63 <= seed < 1 << 63:
+            raise ValueError("Replays can only store seeds that fit in 64 bits, signed")
+        self.file = open(path, "wb")
+        self.file.write(HEADER.pack(MAGIC, VERSION, CODES[randomizer], num_rows, num_cols, seed))
+        self.file.flush()
+        self.last_tick = 0
+
+    def record(self, tick: int, action: Action, gravity: bool) -> None:
+        """Appends one input
+
+        Args:
+            tick (int): the engine's tick before the step
+            action (Action): the input
+            gravity (bool): whether the step was also a gravity tick
+        """
+        self.file.write(bytes((action.value | (GRAVITY_BIT if gravity else 0),)) +
+                        encode_varint(tick - self.last_tick))
+        self.file.flush()
+        self.last_tick = tick
+
+    def finish(self, tick: int, board: Board) -> None:
+        """Appends the end record, so replays can check their final board
+
+        Args:
+            tick (int): the engine's final tick
+            board (Board): the final board
+        """
+        self.file.write(bytes((END,)) + encode_varint(tick - self.last_tick) +
+                        struct.pack("<I", board_digest(board)))
+        self.close()
+
+    def close(self) -> None:
+        """Flushes and closes the file
+        """
+        if not self.file.closed:
+            self.file.close()
+
+    def __enter__(self) -> "ReplayWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class ReplayReader:
+    """
+    Reads a replay file through a memory map, one record at a time
+    """
+
+    def __init__(self, path: str) -> None:
+        """Opens a replay and reads its header
+
+        Args:
+            path (str): the replay file
+
+        Raises:
+            ValueError: if it isn't a replay this version can read
+        """
+        with open(path, "rb") as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.data) < HEADER.size:
+            raise ValueError("Not a replay file")
+        header = HEADERS.get(self.data[len(MAGIC)])
+        if header is None:
+            raise ValueError("Not a replay file")
+        magic, version, self.flags, self.num_rows, self.num_cols, self.seed = \
+            header.unpack_from(self.data)
+        if magic != MAGIC:
+            raise ValueError("Not a replay file")
+        self.end = None
+
+    def records(self) -> Iterator[tuple]:
+        """Yields every input. A truncated final record (say, from a crash)
+        is ignored. Sets self.end to (tick, digest) if the replay has an end
+        record
+
+        Yields:
+            tuple: (tick, action, gravity)
+        """
+        data = self.data
+        pos = HEADER.size
+        tick = 0
+        while pos < len(data):
+            kind = data[pos]
+            pos += 1
+            delta = shift = 0
+            while pos < len(data) and data[pos] & 0x80:
+                delta |= (data[pos] & 0x7F) << shift
+                shift += 7
+                pos += 1
+            if pos >= len(data):
+                return
+            delta |= data[pos] << shift
+            tick += delta
+            pos += 1
+            if kind == END:
+                if pos + 4 <= len(data):
+                    self.end = (tick, struct.unpack_from("<I", data, pos)[0])
+                return
+            yield tick, Action(kind & 0x7F), bool(kind & GRAVITY_BIT)
+
+    def close(self) -> None:
+        """Unmaps the file
+        """
+        self.data.close()
+
+
+class ReplayResult(NamedTuple):
+    """
+    The outcome of re-running a replay
+    """
+
+    engine: TetrisEngine
+    inputs: int
+    seconds: float
+    matches: Optional[bool]
+
+
+def run_replay(path: str, engine: Optional[TetrisEngine] = None, on_step=None) -> ReplayResult:
+    """Re-runs a replay as fast as the engine goes
+
+    Args:
+        path (str): the replay file
+        engine (Optional[TetrisEngine]): the engine to run it on, a new
+            headless one by default
+        on_step (optional): called after every step, for watching
+
+    Returns:
+        ReplayResult: the final engine, the number of inputs, the time it
+        took and whether the final board matched (None if the replay has no
+        end record)
+    """
+    reader = ReplayReader(path)
+    engine = engine or TetrisEngine()
+    engine.numRows, engine.numCols = reader.num_rows, reader.num_cols
+    engine.randomizer = make_randomizer(list(RANDOMIZERS)[reader.flags & RANDOMIZER_BITS])
+    engine.reset(reader.seed)
+    inputs = 0
+    start = time.perf_counter()
+
+    def catch_up(tick: int) -> None:
+        while engine.tick < tick and not engine.game_over:
+            engine.step(Action.NONE, gravity=True)
+            if on_step:
+                on_step(engine)
+
+    for tick, action, gravity in reader.records():
+        catch_up(tick)
+        engine.step(action, gravity)
+        inputs += 1
+        if on_step:
+            on_step(engine)
+    matches = None
+    if reader.end:
+        catch_up(reader.end[0])
+        matches = board_digest(engine.grid) == reader.end[1]
+    reader.close()
+    return ReplayResult(engine, inputs, time.perf_counter() - start, matches)
+
+
+def watch_replay(path: str, term, loop_time: float = .2) -> ReplayResult:
+    """Plays a replay back in the terminal at real speed
+
+    Args:
+        path (str): the replay file
+        term (Terminal): the terminal to draw to
+        loop_time (float): seconds per gravity tick
+
+    Returns:
+        ReplayResult: see run_replay
+    """
+    game = Tetris(term)
+    last_tick = 0
+
+    def show(engine: TetrisEngine) -> None:
+        nonlocal last_tick
+        if engine.tick != last_tick:
+            time.sleep(loop_time)
+            last_tick = engine.tick
+        engine.render_game()
+
+    with term.fullscreen(), term.hidden_cursor():
+        return run_replay(path, game, show)
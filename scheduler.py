@@ -0,0 +1,85 @@
+import time
+
+
+class FixedTimestep:
+    """
+    Runs game logic at a fixed tick rate and rendering at a capped frame
+    rate, both on a monotonic clock. Elapsed time is accumulated, so ticks
+    never drift with input timing, and frames are only drawn when something
+    changed
+    """
+
+    def __init__(self, tick_time: float, max_fps: float = 30, max_catch_up: int = 5,
+                 clock=time.monotonic) -> None:
+        """Creates a scheduler starting now
+
+        Args:
+            tick_time (float): seconds per logic tick
+            max_fps (float): the most frames to draw per second
+            max_catch_up (int): the most ticks to run at once after a stall;
+                any more time than that is dropped rather than caught up
+            clock (optional): the clock to use, in seconds
+        """
+        self.tick_time = tick_time
+        self.frame_time = 1 / max_fps
+        self.max_catch_up = max_catch_up
+        self.clock = clock
+        self.last_time = clock()
+        self.accumulator = 0.0
+        self.last_frame = None
+        self.dirty = True
+        self.skipped_frames = 0
+
+    def advance(self) -> int:
+        """Adds the time since the last call and takes out whole ticks
+
+        Returns:
+            int: the number of logic ticks to run now
+        """
+        now = self.clock()
+        self.accumulator += now - self.last_time
+        self.last_time = now
+        # a hair of slack, so float error can't leave a tick just out of reach
+        ticks = int((self.accumulator + 1e-9) // self.tick_time)
+        self.accumulator = max(0.0, self.accumulator - ticks * self.tick_time)
+        if ticks > self.max_catch_up:
+            ticks = self.max_catch_up
+        if ticks > 1:
+            # several ticks share one frame
+            self.skipped_frames += ticks - 1
+        return ticks
+
+    def mark_dirty(self) -> None:
+        """Notes that the game changed and needs drawing
+        """
+        self.dirty = True
+
+    def should_render(self) -> bool:
+        """Returns whether to draw a frame now: the game changed, and the
+        last frame was long enough ago
+
+        Returns:
+            bool: whether to render
+        """
+        return self.dirty and (self.last_frame is None or
+                               self.clock() - self.last_frame >= self.frame_time)
+
+    def rendered(self) -> None:
+        """Notes that a frame was just drawn
+        """
+        self.last_frame = self.clock()
+        self.dirty = False
+
+    def timeout(self) -> float:
+        """Returns how long to wait for input before there is work to do:
+        the next tick, or the next allowed frame if something needs drawing
+
+        Returns:
+            float: seconds, never negative
+        """
+        now = self.clock()
+        wait = self.tick_time - self.accumulator - (now - self.last_time)
+        if self.dirty:
+            frame_wait = 0 if self.last_frame is None else self.last_frame + self.frame_time - now
+            wait = min(wait, frame_wait)
+        return max(0.0, wait)
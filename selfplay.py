@@ -0,0 +1,87 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+import argparse
+import json
+import os
+import time
+from bot import GameResult, play_game
+from stats import summarize
+
+
+def run_games(games: int, workers: int, seed: int, max_pieces: int,
+              export: Optional[str] = None) -> List[GameResult]:
+    """Plays games across a pool of worker processes, each with its own seed
+
+    Args:
+        games (int): the number of games
+        workers (int): the number of worker processes
+        seed (int): the seed of the first game, the others count up from it
+        max_pieces (int): a cap on the length of each game
+        export (Optional[str]): a dataset directory for every placement of
+            every game, each game writing its own shards
+
+    Returns:
+        List[GameResult]: one result per game, in seed order
+    """
+    seeds = range(seed, seed + games)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(play_game, seeds, [None] * games, [max_pieces] * games,
+                             [export] * games, chunksize=max(1, games // (workers * 4))))
+
+
+def report(results: List[GameResult], seconds: float, workers: int) -> dict:
+    """Combines per-game results into throughput and score distributions
+
+    Args:
+        results (List[GameResult]): the games
+        seconds (float): the wall clock time for all of them
+        workers (int): the number of worker processes
+
+    Returns:
+        dict: the report
+    """
+    pieces = sum(result.pieces for result in results)
+    return {
+        "games": len(results),
+        "workers": workers,
+        "seconds": seconds,
+        "games_per_second": len(results) / seconds,
+        "pieces_per_second": pieces / seconds,
+        "lines": summarize([result.lines for result in results]),
+        "pieces": summarize([result.pieces for result in results]),
+        "steps": summarize([result.steps for result in results]),
+        "ms_per_move": summarize([1000 * result.seconds_per_move for result in results]),
+    }
+
+
+def main(games: int, workers: int, seed: int, max_pieces: int, output: str,
+         export: str = None) -> None:
+    """
+    Runs the games and prints the report
+    """
+    start = time.perf_counter()
+    results = run_games(games, workers, seed, max_pieces, export)
+    summary = report(results, time.perf_counter() - start, workers)
+    print(json.dumps(summary, indent=2))
+    if output:
+        with open(output, "w") as file:
+            json.dump({"summary": summary, "games": [result._asdict() for result in results]}, file)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="play lots of automated games of tetris in parallel")
+    parser.add_argument(
+        '-n', '--games', type=int, default=100, help="Number of games")
+    parser.add_argument(
+        '-w', '--workers', type=int, default=os.cpu_count(), help="Number of worker processes")
+    parser.add_argument(
+        '-s', '--seed', type=int, default=0, help="Seed of the first game")
+    parser.add_argument(
+        '-p', '--max-pieces', type=int, default=1000, help="Cap on pieces per game")
+    parser.add_argument(
+        '-o', '--output', help="Write the report and per-game results as JSON")
+    parser.add_argument(
+        '-e', '--export', metavar='DIR', help="Write every placement to a dataset, see dataset.py")
+    args = parser.parse_args()
+    main(args.games, args.workers, args.seed, args.max_pieces, args.output, args.export)
@@ -0,0 +1,238 @@
+from random import Random
+from typing import List, Optional
+import argparse
+import asyncio
+from scheduler import FixedTimestep
+from tetris import Action, Tetris
+from virtual_terminal import VirtualTerminal
+
+"""The escape sequences arrow keys send, in normal and application mode
+"""
+SEQUENCES = {
+    "\x1b[A": VirtualTerminal.KEY_UP, "\x1bOA": VirtualTerminal.KEY_UP,
+    "\x1b[B": VirtualTerminal.KEY_DOWN, "\x1bOB": VirtualTerminal.KEY_DOWN,
+    "\x1b[C": VirtualTerminal.KEY_RIGHT, "\x1bOC": VirtualTerminal.KEY_RIGHT,
+    "\x1b[D": VirtualTerminal.KEY_LEFT, "\x1bOD": VirtualTerminal.KEY_LEFT,
+}
+# room for a crowd connecting at once, asyncio's default is 100
+BACKLOG = 1024
+# switch to the alternate screen and hide the cursor, and back
+ENTER = "\x1b[?1049h\x1b[?25l"
+LEAVE = "\x1b[?25h\x1b[?1049l"
+
+
+class Key(str):
+    """
+    A keystroke from a remote terminal, shaped like blessed's Keystroke
+    """
+
+    def __new__(cls, text: str, code: Optional[int] = None) -> "Key":
+        key = super().__new__(cls, text)
+        key.code = code
+        return key
+
+    @property
+    def is_sequence(self) -> bool:
+        return self.code is not None
+
+
+class KeyDecoder:
+    """
+    Splits the bytes a remote terminal sends into keystrokes, holding on to
+    escape sequences that were cut in half between reads
+    """
+
+    def __init__(self) -> None:
+        self.pending = ""
+
+    def feed(self, data: bytes) -> List[Key]:
+        """Decodes the next chunk of input
+
+        Args:
+            data (bytes): the chunk
+
+        Returns:
+            List[Key]: the complete keystrokes in it
+        """
+        text = self.pending + data.decode("latin-1")
+        self.pending = ""
+        keys = []
+        i = 0
+        while i < len(text):
+            if text[i] == "\x1b":
+                sequence = text[i:i + 3]
+                if sequence in SEQUENCES:
+                    keys.append(Key(sequence, SEQUENCES[sequence]))
+                    i += 3
+                    continue
+                if len(sequence) < 3 and any(known.startswith(sequence) for known in SEQUENCES):
+                    self.pending = sequence
+                    break
+            keys.append(Key(text[i]))
+            i += 1
+        return keys
+
+
+class SocketSink:
+    """
+    The output stream of a remote terminal. Writes are buffered by asyncio,
+    and the session drains them once per frame
+    """
+
+    def __init__(self, writer: asyncio.StreamWriter) -> None:
+        self.writer = writer
+
+    def write(self, text: str) -> None:
+        self.writer.write(text.encode())
+
+    def flush(self) -> None:
+        pass
+
+
+class Session:
+    """
+    One player's game, driven by their socket and the server's event loop
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, seed: int,
+                 width: int = 80, height: int = 24, tick_time: float = .2,
+                 max_fps: float = 30) -> None:
+        """Creates a session
+
+        Args:
+            reader (asyncio.StreamReader): the player's input
+            writer (asyncio.StreamWriter): the player's terminal
+            seed (int): the seed for the game
+            width (int): the number of columns of the player's terminal
+            height (int): the number of rows of the player's terminal
+            tick_time (float): seconds per gravity tick
+            max_fps (float): the most frames to send per second
+        """
+        self.reader = reader
+        self.writer = writer
+        self.tick_time = tick_time
+        self.max_fps = max_fps
+        self.game = Tetris(VirtualTerminal(width, height, SocketSink(writer)))
+        self.game.reset(seed)
+        self.keys = KeyDecoder()
+
+    async def play(self) -> None:
+        """Plays the game until it's over or the player disconnects. This is
+        the event loop of Tetris.event_loop, with the waits handed to asyncio
+        """
+        game = self.game
+        scheduler = FixedTimestep(self.tick_time, self.max_fps)
+        self.writer.write(ENTER.encode())
+        result = game.step(Action.NONE, gravity=False)
+        while not result.game_over:
+            try:
+                data = await asyncio.wait_for(self.reader.read(1024),
+                                              min(scheduler.timeout(), game.input.timeout()))
+            except asyncio.TimeoutError:
+                data = b""
+            else:
+                if not data:
+                    # disconnected
+                    return
+            # keys from one packet are taps that came together, not a held key
+            now = game.input.clock()
+            for key in self.keys.feed(data):
+                game.input.push(key, now)
+            for action in game.input.due():
+                if result.game_over:
+                    break
+                result = game.step(action, gravity=False)
+                scheduler.mark_dirty()
+
+            ticks = scheduler.advance()
+            for _ in range(ticks):
+                if result.game_over:
+                    break
+                result = game.step(Action.NONE, gravity=True)
+                scheduler.mark_dirty()
+
+            if scheduler.should_render() or result.game_over:
+                game.render_game()
+                scheduler.rendered()
+                game.input.rendered()
+                await self.writer.drain()
+        self.writer.write(LEAVE.encode() + b"Game over!\r\n")
+        await self.writer.drain()
+
+
+class GameServer:
+    """
+    Hosts any number of independent games in one asyncio event loop, one
+    session per connection
+    """
+
+    def __init__(self, width: int = 80, height: int = 24, tick_time: float = .2,
+                 max_fps: float = 30, seed: Optional[int] = None) -> None:
+        """Creates a server
+
+        Args:
+            width (int): the terminal width to draw for
+            height (int): the terminal height to draw for
+            tick_time (float): seconds per gravity tick
+            max_fps (float): the most frames to send each player per second
+            seed (Optional[int]): seeds the seeds of every game
+        """
+        self.width = width
+        self.height = height
+        self.tick_time = tick_time
+        self.max_fps = max_fps
+        self.rng = Random(seed)
+        self.sessions = set()
+        self.games_played = 0
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Runs a session for a new connection
+        """
+        session = Session(reader, writer, self.rng.getrandbits(63), self.width, self.height,
+                          self.tick_time, self.max_fps)
+        self.sessions.add(session)
+        try:
+            await session.play()
+        except ConnectionError:
+            pass
+        finally:
+            self.sessions.discard(session)
+            self.games_played += 1
+            writer.close()
+
+    async def serve_tcp(self, host: str = "127.0.0.1", port: int = 7000) -> asyncio.Server:
+        return await asyncio.start_server(self.handle, host, port, backlog=BACKLOG)
+
+    async def serve_unix(self, path: str) -> asyncio.Server:
+        return await asyncio.start_unix_server(self.handle, path, backlog=BACKLOG)
+
+
+async def serve(server: GameServer, host: str, port: int, unix: Optional[str]) -> None:
+    listener = await (server.serve_unix(unix) if unix else server.serve_tcp(host, port))
+    async with listener:
+        await listener.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="host tetris games for remote terminals "
+                    "(connect with: stty raw -echo; nc HOST PORT; stty sane)")
+    parser.add_argument(
+        '--host', default="127.0.0.1", help="Address to listen on")
+    parser.add_argument(
+        '-p', '--port', type=int, default=7000, help="TCP port to listen on")
+    parser.add_argument(
+        '-u', '--unix', metavar='PATH', help="Listen on a Unix socket instead")
+    parser.add_argument(
+        '--size', default="80x24", help="Terminal size to draw for, as COLSxROWS")
+    parser.add_argument(
+        '--fps', type=float, default=30, help="Most frames to send each player per second")
+    parser.add_argument(
+        '-s', '--seed', type=int, help="Seed for the games' seeds")
+    args = parser.parse_args()
+    width, height = (int(n) for n in args.size.split("x"))
+    try:
+        asyncio.run(serve(GameServer(width, height, max_fps=args.fps, seed=args.seed),
+                          args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
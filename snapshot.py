@@ -0,0 +1,224 @@
+from random import Random
+from typing import List, Optional
+import struct
+import numpy as np
+from randomizer import CODES as RANDOMIZER_CODES, RANDOMIZERS, make_randomizer
+from tetris import PIECE_TYPES, Board, TetrisEngine, Tetromino, TetrominoType
+
+"""A snapshot is the whole state of a game:
+
+    header: version, rows, cols (little endian "<BHH")
+    piece:  flags, tick, type, rotation, r, c, bag size ("<BIBBhhB"), then
+            the bag at 3 bits per piece
+    board:  the index of the highest non-empty row ("<H"), then every row
+            from there down at 3 bits per cell
+    rng:    if the RNG flag is set, the 625 words of the Mersenne Twister,
+            then the randomizer: its code in randomizer.CODES and the length
+            of its state ("<BB"), then its state
+
+A delta is what one step changed, for a reader that already has the state
+before it:
+
+    piece:  as above
+    rows:   how many ("<B"), then each row the locked piece covered, as its
+            index ("<H") and its cells just before lines were cleared
+
+Applying a delta sets those rows and clears full lines, which are exactly
+the lines the lock cleared, so a line clear costs no more than a lock.
+Cells are 0 for empty and 1 to 7 for the piece types
+"""
+VERSION = 2
+# version 1 had no randomizer, its games were all 7-bag
+READABLE = (1, VERSION)
+HEADER = struct.Struct("<BHH")
+PIECE = struct.Struct("<BIBBhhB")
+TOP = struct.Struct("<H")
+ROW = struct.Struct("<H")
+COUNT = struct.Struct("<B")
+RNG = struct.Struct("<625I")
+RANDOMIZER = struct.Struct("<BB")
+GAME_OVER = 1
+HAS_BLOCK = 2
+HAS_RNG = 4
+
+CODES = {type: i + 1 for i, type in enumerate(PIECE_TYPES)}
+CODES[TetrominoType.X] = 0
+TYPES = [TetrominoType.X, *PIECE_TYPES]
+# the bits of a code, lowest first
+SHIFTS = np.arange(3, dtype=np.uint8)
+
+
+def pack_cells(types: List[TetrominoType]) -> bytes:
+    """Packs types at 3 bits each, first one in the lowest bits
+
+    Args:
+        types (List[TetrominoType]): the types
+
+    Returns:
+        bytes: the packed types
+    """
+    codes = np.fromiter(map(CODES.__getitem__, types), np.uint8, len(types))
+    bits = (codes[:, None] >> SHIFTS) & 1
+    return np.packbits(bits.ravel(), bitorder="little").tobytes()
+
+
+def unpack_cells(data: bytes, pos: int, count: int) -> tuple:
+    """Unpacks types packed by pack_cells
+
+    Args:
+        data (bytes): the buffer
+        pos (int): where they start
+        count (int): how many there are
+
+    Returns:
+        tuple: the list of types, and the position after them
+    """
+    end = pos + (3 * count + 7) // 8
+    bits = np.unpackbits(np.frombuffer(data, np.uint8, end - pos, pos), count=3 * count,
+                         bitorder="little").reshape(count, 3)
+    codes = (bits << SHIFTS).sum(axis=1)
+    return [TYPES[code] for code in codes.tolist()], end
+
+
+def encode_piece(engine: TetrisEngine, rng: bool = False) -> bytes:
+    """Serializes everything but the board and the RNG
+
+    Args:
+        engine (TetrisEngine): the game
+        rng (bool): whether the RNG will follow
+
+    Returns:
+        bytes: the piece section
+    """
+    block = engine.curr_block
+    flags = ((GAME_OVER if engine.game_over else 0) | (HAS_BLOCK if block else 0) |
+             (HAS_RNG if rng else 0))
+    bag = [piece.type for piece in engine.bag or ()]
+    return PIECE.pack(flags, engine.tick, CODES[block.type] if block else 0,
+                      block.rotation if block else 0, engine.curr_block_r,
+                      engine.curr_block_c, len(bag)) + pack_cells(bag)
+
+
+def decode_piece(engine: TetrisEngine, data: bytes, pos: int) -> tuple:
+    """Restores what encode_piece saved
+
+    Args:
+        engine (TetrisEngine): the game to restore into
+        data (bytes): the buffer
+        pos (int): where the piece section starts
+
+    Returns:
+        tuple: the flags, and the position after the section
+    """
+    flags, engine.tick, type, rotation, r, c, bag_size = PIECE.unpack_from(data, pos)
+    engine.game_over = bool(flags & GAME_OVER)
+    engine.curr_block = Tetromino.of(TYPES[type], rotation) if flags & HAS_BLOCK else None
+    engine.curr_block_r, engine.curr_block_c = r, c
+    bag, pos = unpack_cells(data, pos + PIECE.size, bag_size)
+    engine.bag = [Tetromino.of(type) for type in bag]
+    return flags, pos
+
+
+def encode_snapshot(engine: TetrisEngine, rng: bool = False) -> bytes:
+    """Serializes a game
+
+    Args:
+        engine (TetrisEngine): the game
+        rng (bool): whether to include the RNG, which is needed to resume
+            the game but not to look at it
+
+    Returns:
+        bytes: the snapshot
+    """
+    board = engine.grid
+    top = next((r for r, row in enumerate(board.rows) if row), board.num_rows)
+    out = [HEADER.pack(VERSION, board.num_rows, board.num_cols), encode_piece(engine, rng),
+           TOP.pack(top),
+           pack_cells([type for row in board.colors[top:] for type in row])]
+    if rng:
+        randomizer = engine.randomizer
+        state = randomizer.getstate()
+        out += [RNG.pack(*engine.rng.getstate()[1]),
+                RANDOMIZER.pack(RANDOMIZER_CODES[randomizer.name], len(state)), state]
+    return b"".join(out)
+
+
+def decode_snapshot(data: bytes, engine: Optional[TetrisEngine] = None) -> TetrisEngine:
+    """Restores a game from a snapshot
+
+    Args:
+        data (bytes): the snapshot
+        engine (Optional[TetrisEngine]): the engine to restore into, a new
+            headless one by default
+
+    Raises:
+        ValueError: if it isn't a snapshot this version can read
+
+    Returns:
+        TetrisEngine: the game
+    """
+    version, num_rows, num_cols = HEADER.unpack_from(data)
+    if version not in READABLE:
+        raise ValueError("Not a snapshot this version can read")
+    engine = engine or TetrisEngine()
+    engine.numRows, engine.numCols = num_rows, num_cols
+    flags, pos = decode_piece(engine, data, HEADER.size)
+    (top,), pos = TOP.unpack_from(data, pos), pos + TOP.size
+    cells, pos = unpack_cells(data, pos, (num_rows - top) * num_cols)
+    board = Board(num_rows, num_cols)
+    for r in range(top, num_rows):
+        start = (r - top) * num_cols
+        row = cells[start:start + num_cols]
+        board.colors[r] = row
+        board.rows[r] = sum(1 << c for c, type in enumerate(row) if type != TetrominoType.X)
+    board.refresh_surface()
+    board.rehash()
+    engine.grid = board
+    if flags & HAS_RNG:
+        engine.rng = Random()
+        engine.rng.setstate((3, RNG.unpack_from(data, pos), None))
+        pos += RNG.size
+        if version == 1:
+            engine.randomizer = make_randomizer()
+        else:
+            code, size = RANDOMIZER.unpack_from(data, pos)
+            pos += RANDOMIZER.size
+            engine.randomizer = make_randomizer(list(RANDOMIZERS)[code])
+            engine.randomizer.setstate(data[pos:pos + size])
+    return engine
+
+
+def encode_delta(engine: TetrisEngine) -> bytes:
+    """Serializes what the engine's last step changed
+
+    Args:
+        engine (TetrisEngine): the game, just after a step
+
+    Returns:
+        bytes: the delta
+    """
+    rows = engine.last_lock or ()
+    out = [encode_piece(engine), COUNT.pack(len(rows))]
+    for r, row in rows:
+        out.append(ROW.pack(r))
+        out.append(pack_cells(row))
+    return b"".join(out)
+
+
+def apply_delta(engine: TetrisEngine, data: bytes) -> None:
+    """Brings a game forward by one step's delta
+
+    Args:
+        engine (TetrisEngine): the game, in the state before the step
+        data (bytes): the delta
+    """
+    _, pos = decode_piece(engine, data, 0)
+    (count,), pos = COUNT.unpack_from(data, pos), pos + COUNT.size
+    if count:
+        board = engine.grid
+        for _ in range(count):
+            (r,), pos = ROW.unpack_from(data, pos), pos + ROW.size
+            row, pos = unpack_cells(data, pos, board.num_cols)
+            board.set_row(r, row, refresh=False)
+        board.refresh_surface()
+        board.clear_full_lines()
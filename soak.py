@@ -0,0 +1,232 @@
+from typing import Callable, List, Optional
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from bot import GreedyPolicy
+from stats import percentile
+from tetris import Action, Tetris
+from transposition import TranspositionTable
+from virtual_terminal import VirtualTerminal
+
+
+def rss_bytes() -> int:
+    """Returns the resident memory of this process
+
+    Returns:
+        int: bytes
+    """
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        # without /proc the peak is the best there is, in bytes on macOS and KiB elsewhere
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def slope_per_hour(times: List[float], values: List[float]) -> float:
+    """Fits a line by least squares and returns its slope
+
+    Args:
+        times (List[float]): seconds
+        values (List[float]): the samples
+
+    Returns:
+        float: the change per hour, 0 with fewer than two samples
+    """
+    if len(times) < 2:
+        return 0.0
+    mean_t = sum(times) / len(times)
+    mean_v = sum(values) / len(values)
+    spread = sum((t - mean_t) ** 2 for t in times)
+    if not spread:
+        return 0.0
+    covariance = sum((t - mean_t) * (v - mean_v) for t, v in zip(times, values))
+    return covariance / spread * 3600
+
+
+class SoakRunner:
+    """
+    Plays Tetris with the greedy bot for as long as it's asked to, drawing
+    every step to a virtual terminal and starting a new game the moment one
+    ends, and samples memory use and latencies as it goes. This is a kiosk
+    left running, sped up, to see whether anything grows or slows down
+    """
+
+    def __init__(self, seed: int = 0, num_rows: int = 20, num_cols: int = 10,
+                 trace: bool = False, top: int = 10, table_size: int = 100_000,
+                 clock=time.perf_counter) -> None:
+        """Creates a runner
+
+        Args:
+            seed (int): the seed of the first game, the others count up from it
+            num_rows (int): the number of rows of the board
+            num_cols (int): the number of columns of the board
+            trace (bool): whether to trace allocations with tracemalloc,
+                which slows everything down a lot
+            top (int): how many allocation sites to report
+            table_size (int): entries in the bot's transposition table
+            clock (optional): the clock to use, in seconds
+        """
+        self.seed = seed
+        self.trace = trace
+        self.top = top
+        self.clock = clock
+        self.game = Tetris(VirtualTerminal(), num_rows, num_cols)
+        self.game.reset(seed)
+        self.table = TranspositionTable(table_size)
+        self.policy = GreedyPolicy(self.table)
+        self.games = 0
+        self.pieces = 0
+        self.think_times = []
+        self.step_times = []
+        self.frame_times = []
+        self.samples = []
+        self.baseline = None
+        self.start = None
+
+    def play_piece(self) -> None:
+        """Picks and plays one placement, drawing every step, and starts a
+        new game if that ended this one
+        """
+        game = self.game
+        clock = self.clock
+        start = clock()
+        placement = self.policy.choose(game)
+        self.think_times.append(clock() - start)
+        for action in placement.actions if placement else (Action.HARD_DROP,):
+            start = clock()
+            result = game.step(action, gravity=False)
+            stepped = clock()
+            game.render_game()
+            self.step_times.append(stepped - start)
+            self.frame_times.append(clock() - stepped)
+            if result.locked or result.game_over:
+                break
+        self.pieces += 1
+        if game.game_over:
+            self.games += 1
+            game.reset(self.seed + self.games)
+
+    def sample(self) -> dict:
+        """Records memory use and the latencies since the last sample
+
+        Returns:
+            dict: the sample
+        """
+        elapsed = self.clock() - self.start
+        sample = {"elapsed_s": elapsed, "games": self.games, "pieces": self.pieces,
+                  "pieces_per_s": self.pieces / elapsed if elapsed else 0.0,
+                  "rss_mb": rss_bytes() / 2 ** 20}
+        for name, value in self.table.stats().items():
+            sample[f"table_{name}"] = value
+        for name, times, scale, unit in (("think", self.think_times, 1e3, "ms"),
+                                         ("step", self.step_times, 1e6, "us"),
+                                         ("frame", self.frame_times, 1e6, "us")):
+            ordered = sorted(times)
+            for q in (50, 99):
+                sample[f"{name}_p{q}_{unit}"] = scale * percentile(ordered, q)
+            times.clear()
+        if self.trace:
+            current, peak = tracemalloc.get_traced_memory()
+            sample["traced_mb"] = current / 2 ** 20
+            sample["traced_peak_mb"] = peak / 2 ** 20
+            snapshot = tracemalloc.take_snapshot().filter_traces(
+                (tracemalloc.Filter(False, tracemalloc.__file__),))
+            # the sites that grew the most since the first sample
+            sample["top"] = [{"site": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                              "size_kb": stat.size / 1024, "growth_kb": stat.size_diff / 1024,
+                              "count": stat.count}
+                             for stat in snapshot.compare_to(self.baseline, "lineno")[:self.top]]
+        self.samples.append(sample)
+        return sample
+
+    def run(self, duration: float, interval: float,
+            on_sample: Optional[Callable[[dict], None]] = None) -> List[dict]:
+        """Plays until the time is up, sampling every interval
+
+        Args:
+            duration (float): seconds to run for
+            interval (float): seconds between samples
+            on_sample (Optional[Callable[[dict], None]]): called with every sample
+
+        Returns:
+            List[dict]: the samples
+        """
+        if self.trace:
+            tracemalloc.start()
+            self.baseline = tracemalloc.take_snapshot()
+        self.start = self.clock()
+        next_sample = self.start + interval
+        end = self.start + duration
+        try:
+            while self.clock() < end:
+                self.play_piece()
+                if self.clock() >= next_sample:
+                    sample = self.sample()
+                    if on_sample:
+                        on_sample(sample)
+                    next_sample += interval
+        finally:
+            if self.trace:
+                tracemalloc.stop()
+        return self.samples
+
+    def report(self) -> dict:
+        """Summarizes the run. Drift is fitted over the second half of the
+        samples, once caches like the transposition table have had time to
+        fill up
+
+        Returns:
+            dict: the totals and the drift per hour of memory and latency
+        """
+        settled = self.samples[len(self.samples) // 2:]
+        times = [sample["elapsed_s"] for sample in settled]
+        report = {"samples": len(self.samples), "games": self.games, "pieces": self.pieces,
+                  "hours": self.samples[-1]["elapsed_s"] / 3600 if self.samples else 0.0,
+                  "table": self.table.stats()}
+        for metric in ("rss_mb", "think_p99_ms", "step_p99_us", "frame_p99_us"):
+            report[f"{metric}_per_hour"] = slope_per_hour(
+                times, [sample[metric] for sample in settled])
+        return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="play tetris unattended for hours and watch memory and latency")
+    parser.add_argument(
+        '-d', '--duration', type=float, default=3600, help="Seconds to run for")
+    parser.add_argument(
+        '-i', '--interval', type=float, default=60, help="Seconds between samples")
+    parser.add_argument(
+        '-s', '--seed', type=int, default=0, help="Seed of the first game")
+    parser.add_argument(
+        '-t', '--trace', action='store_true', help="Trace allocations (much slower)")
+    parser.add_argument(
+        '--top', type=int, default=10, help="Allocation sites to report with --trace")
+    parser.add_argument(
+        '-o', '--output', metavar='FILE', help="Write every sample as a JSON line")
+    args = parser.parse_args()
+    runner = SoakRunner(args.seed, trace=args.trace, top=args.top)
+    log = open(args.output, "w") if args.output else None
+
+    def write(sample: dict) -> None:
+        print(f"{sample['elapsed_s']:8.0f}s  {sample['games']:5d} games  "
+              f"rss {sample['rss_mb']:7.1f} MB  step p99 {sample['step_p99_us']:7.1f} us  "
+              f"frame p99 {sample['frame_p99_us']:7.1f} us  "
+              f"table hits {sample['table_hit_rate']:6.1%}", flush=True)
+        if log:
+            log.write(json.dumps(sample) + "\n")
+            log.flush()
+    try:
+        runner.run(args.duration, args.interval, write)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if log:
+            log.close()
+    print(json.dumps(runner.report(), indent=2))
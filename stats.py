@@ -0,0 +1,40 @@
+from typing import Dict, List
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Returns a percentile by linear interpolation
+
+    Args:
+        sorted_values (List[float]): the samples, sorted ascending
+        q (float): the percentile, between 0 and 100
+
+    Returns:
+        float: the percentile, 0 if there are no samples
+    """
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * q / 100
+    low = int(position)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (position - low)
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    """Summarizes a distribution
+
+    Args:
+        values (List[float]): the samples
+
+    Returns:
+        Dict[str, float]: count, mean, min, p50, p90, p99 and max
+    """
+    ordered = sorted(values)
+    return {
+        "count": len(ordered),
+        "mean": sum(ordered) / len(ordered) if ordered else 0.0,
+        "min": ordered[0] if ordered else 0.0,
+        "p50": percentile(ordered, 50),
+        "p90": percentile(ordered, 90),
+        "p99": percentile(ordered, 99),
+        "max": ordered[-1] if ordered else 0.0,
+    }
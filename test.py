@@ -1,5 +1,41 @@
+from contextlib import nullcontext
+from functools import partial
+from unittest import mock
+import asyncio
+import io
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
 import unittest
-from tetris import TetrominoType, Tetromino
+from blessed import Terminal
+from blessed.keyboard import Keystroke
+import numpy as np
+from audio import EFFECTS, AudioEngine, Mixer, WavBackend, can_decode, load_wav
+from batch import BatchTetris
+from bench import compare, run
+from bot import GreedyPolicy, column_heights, count_holes, play_game
+from controls import REPEAT_GAP, InputQueue
+from dataset import HEADER_LEN, DatasetWriter, open_dataset, unpack_boards
+from perf import FrameProfiler
+from perft import KNOWN, perft, piece_sequence
+from planner import BeamPlanner, PlanResult
+from randomizer import RANDOMIZERS, PieceStream, make_randomizer
+from renderer import GHOST
+from replay import ReplayReader, ReplayWriter, encode_varint, run_replay
+from scheduler import FixedTimestep
+from selfplay import report, run_games
+from server import GameServer, KeyDecoder, Session
+from snapshot import TYPES, apply_delta, decode_snapshot, encode_delta, pack_cells, unpack_cells
+from soak import SoakRunner, slope_per_hour
+from stats import percentile
+from tetris import TetrominoType, Tetromino, Board, Tetris, TetrisEngine, Action, PIECE_TYPES, row_key
+from transposition import TranspositionTable
+from virtual_terminal import VirtualTerminal
 
 
 class TestTetromino(unittest.TestCase):
@@ -45,6 +81,1165 @@ class TestTetromino(unittest.TestCase):
     def test_bottom_boundary(self):
         self.assertEqual(1, Tetromino(TetrominoType.T).get_bottom_boundary())
 
+    def test_rotation_matches_matrix_rotation(self):
+        for type in PIECE_TYPES:
+            matrix = Tetromino.get_shape_of_tetromino(type)
+            for rotation in range(4):
+                self.assertEqual(Tetromino(type, rotation).shape(),
+                                 tuple(tuple(row) for row in matrix))
+                matrix = list(zip(*matrix[::-1]))
+
+    def test_shared_pieces(self):
+        piece = Tetromino.of(TetrominoType.T)
+        self.assertIs(piece.rotated_right().rotated_left(), piece)
+        self.assertIs(Tetromino.of(TetrominoType.T, 4), piece)
+        with self.assertRaises(TypeError):
+            piece.rotate_right()
+
+    def test_symmetric_rotations_are_equal(self):
+        self.assertEqual(Tetromino(TetrominoType.O, 1), Tetromino(TetrominoType.O))
+        self.assertNotEqual(Tetromino(TetrominoType.S, 1), Tetromino(TetrominoType.S))
+
+    def test_row_masks(self):
+        state = Tetromino(TetrominoType.T).state
+        self.assertEqual(state.row_masks, ((0, 0b010), (1, 0b111)))
+        self.assertEqual((state.top, state.bottom, state.left, state.right), (0, 1, 0, 2))
+
+
+class TestBoard(unittest.TestCase):
+    def test_list_round_trip(self):
+        t = TetrominoType
+        grid = [[t.X for _ in range(10)] for _ in range(20)]
+        grid[19][0] = t.I
+        grid[18][9] = t.Z
+        board = Board.from_list(grid)
+        self.assertEqual(board.rows[19], 1)
+        self.assertEqual(board.rows[18], 1 << 9)
+        self.assertEqual(board.to_list(), grid)
+
+    def test_collides_with_walls_and_floor(self):
+        board = Board(20, 10)
+        state = Tetromino(TetrominoType.I).state
+        row_masks, left, right = state.row_masks, state.left, state.right
+        self.assertFalse(board.collides(row_masks, left, right, 0, -1))
+        self.assertTrue(board.collides(row_masks, left, right, 0, -2))
+        self.assertFalse(board.collides(row_masks, left, right, 0, 8))
+        self.assertTrue(board.collides(row_masks, left, right, 0, 9))
+        self.assertFalse(board.collides(row_masks, left, right, 16, 0))
+        self.assertTrue(board.collides(row_masks, left, right, 17, 0))
+        self.assertFalse(board.collides(row_masks, left, right, -10, 0))
+
+    def test_collides_with_blocks(self):
+        board = Board(20, 10)
+        state = Tetromino(TetrominoType.T).state
+        board.place(state.cells, TetrominoType.T, 18, 0)
+        row_masks, left, right = state.row_masks, state.left, state.right
+        self.assertTrue(board.collides(row_masks, left, right, 17, 0))
+        self.assertFalse(board.collides(row_masks, left, right, 17, 3))
+        self.assertFalse(board.collides(row_masks, left, right, 16, 0))
+
+    def test_clear_full_lines(self):
+        t = TetrominoType
+        grid = [
+            [t.X, t.X, t.X],
+            [t.I, t.I, t.I],
+            [t.X, t.O, t.X],
+            [t.S, t.S, t.S],
+        ]
+        board = Board.from_list(grid)
+        self.assertEqual(board.clear_full_lines(), 2)
+        self.assertEqual(board.rows, [0, 0, 0, 0b010])
+        self.assertEqual(board.to_list()[3], [t.X, t.O, t.X])
+        self.assertEqual(board.to_list()[0], [t.X, t.X, t.X])
+
+    def test_surface_follows_changes(self):
+        board = Board(20, 10)
+        self.assertEqual(board.surface, [20] * 10)
+        state = Tetromino(TetrominoType.T).state
+        version = board.version
+        board.place(state.cells, TetrominoType.T, 18, 0)
+        self.assertGreater(board.version, version)
+        self.assertEqual(board.surface[:4], [19, 18, 19, 20])
+        board.set_row(19, [TetrominoType.S] * 10)
+        board.clear_full_lines()
+        self.assertEqual(board.surface[:3], [20, 19, 20])
+
+    def test_bulk_load_refreshes_surface_once(self):
+        grid = [[TetrominoType.X] * 10 for _ in range(2000)]
+        grid[1500][3] = grid[1999][0] = TetrominoType.L
+        with mock.patch.object(Board, "refresh_surface", autospec=True,
+                               side_effect=Board.refresh_surface) as refresh:
+            board = Board.from_list(grid)
+        self.assertEqual(refresh.call_count, 1)
+        self.assertEqual(board.surface[:4], [1999, 2000, 2000, 1500])
+
+    def test_clear_checks_only_given_rows(self):
+        rng = random.Random(4)
+        t = TetrominoType
+        for _ in range(50):
+            grid = [[t.S if rng.random() < .7 else t.X for _ in range(6)] for _ in range(12)]
+            for r in rng.sample(range(12), 3):
+                grid[r] = [t.Z] * 6
+            board, expected = Board.from_list(grid), Board.from_list(grid)
+            full = [r for r, row in enumerate(grid) if t.X not in row]
+            self.assertEqual(board.clear_full_lines(full + [0, 11, 40]), len(full))
+            self.assertEqual(expected.clear_full_lines(), len(full))
+            self.assertEqual(board.to_list(), expected.to_list())
+            surface = list(board.surface)
+            board.refresh_surface()
+            self.assertEqual(surface, board.surface)
+        self.assertEqual(Board.from_list(grid).clear_full_lines([]), 0)
+
+    def test_landing_row_matches_step_search(self):
+        engine = TetrisEngine()
+        engine.reset(3)
+        rng = random.Random(3)
+        for _ in range(400):
+            if engine.step(Action(rng.randrange(len(Action))), rng.random() < .3).game_over:
+                engine.reset(rng.randrange(100))
+            piece, grid = engine.curr_block, engine.grid
+            state = piece.state
+            for c in range(-state.left, engine.numCols - state.right):
+                r = -4
+                while not grid.collides(state.row_masks, state.left, state.right, r + 1, c):
+                    r += 1
+                self.assertEqual(grid.landing_row(state, -4, c), r)
+
+
+class TestTetrisEngine(unittest.TestCase):
+    def test_reset_is_deterministic(self):
+        first, second = TetrisEngine(), TetrisEngine()
+        first.reset(7)
+        second.reset(7)
+        for _ in range(50):
+            a = first.step(Action.HARD_DROP)
+            b = second.step(Action.HARD_DROP)
+            self.assertEqual(a.state.board.rows, b.state.board.rows)
+            self.assertEqual(a.state.piece, b.state.piece)
+
+    def test_hard_drop_locks(self):
+        engine = TetrisEngine()
+        engine.reset(0)
+        piece = engine.curr_block
+        result = engine.step(Action.HARD_DROP, gravity=False)
+        self.assertTrue(result.locked)
+        self.assertEqual(result.lines_cleared, 0)
+        self.assertEqual(sum(bin(row).count("1") for row in engine.grid.rows), 4)
+        self.assertIsNot(engine.curr_block, None)
+        self.assertIn(piece.type, engine.grid.colors[19])
+
+    def test_gravity_moves_block_down(self):
+        engine = TetrisEngine()
+        engine.reset(0)
+        r = engine.curr_block_r
+        engine.step(Action.NONE)
+        self.assertEqual(engine.curr_block_r, r + 1)
+        self.assertEqual(engine.tick, 1)
+        engine.step(Action.NONE, gravity=False)
+        self.assertEqual(engine.curr_block_r, r + 1)
+
+    def test_line_clear_is_reported(self):
+        engine = TetrisEngine()
+        engine.reset(0)
+        engine.grid.set_row(19, [TetrominoType.S] * 9 + [TetrominoType.X])
+        engine.curr_block = Tetromino.of(TetrominoType.I)
+        engine.curr_block_c = 8
+        result = engine.step(Action.HARD_DROP, gravity=False)
+        self.assertEqual(result.lines_cleared, 1)
+        self.assertEqual(engine.grid.rows[19], 1 << 9)
+
+    def test_landing_cache_sees_board_changes(self):
+        engine = TetrisEngine()
+        engine.reset(0)
+        engine.spawn_block()
+        r, c = engine.find_curr_block_bottom_xy()
+        self.assertEqual(engine.find_curr_block_bottom_xy(), (r, c))
+        state = engine.curr_block.state
+        engine.grid.place(state.cells, TetrominoType.O, r, c)
+        self.assertLess(engine.find_curr_block_bottom_xy()[0], r)
+
+    def test_game_over_instead_of_exit(self):
+        engine = TetrisEngine()
+        engine.reset(0)
+        result = engine.step(Action.HARD_DROP)
+        while not result.game_over:
+            result = engine.step(Action.HARD_DROP)
+        self.assertTrue(engine.step(Action.LEFT).game_over)
+
+
+class TestPlacements(unittest.TestCase):
+    def spawn(self, engine, type):
+        engine.curr_block = Tetromino.of(type)
+        engine.curr_block_r, engine.curr_block_c = engine.spawn_position(engine.curr_block)
+
+    def test_empty_board_counts(self):
+        expected = {"I": 17, "O": 9, "T": 34, "J": 34, "L": 34, "S": 17, "Z": 17}
+        engine = TetrisEngine()
+        for type in PIECE_TYPES:
+            self.spawn(engine, type)
+            self.assertEqual(len(engine.reachable_placements()), expected[type.value])
+
+    def test_actions_reach_placement(self):
+        engine = TetrisEngine()
+        engine.reset(5)
+        for _ in range(8):
+            engine.step(Action.HARD_DROP, gravity=False)
+        for placement in engine.reachable_placements():
+            copy = TetrisEngine()
+            copy.grid = Board.from_list(engine.board)
+            copy.curr_block = engine.curr_block
+            copy.curr_block_r, copy.curr_block_c = engine.curr_block_r, engine.curr_block_c
+            for action in placement.actions[:-1]:
+                self.assertFalse(copy.step(action, gravity=False).locked)
+            self.assertEqual(copy.transition(copy.curr_block, copy.curr_block_r,
+                                             copy.curr_block_c, placement.actions[-1]),
+                             (placement.piece, placement.r, placement.c))
+            self.assertTrue(copy.step(placement.actions[-1], gravity=False).locked)
+
+    def test_board_is_read_only(self):
+        engine = TetrisEngine()
+        engine.reset(0)
+        engine.step(Action.HARD_DROP, gravity=False)
+        board = engine.board
+        self.assertEqual([list(row) for row in board], engine.grid.to_list())
+        with self.assertRaises(TypeError):
+            board[19][0] = TetrominoType.I
+
+    def test_tuck_under_overhang(self):
+        engine = TetrisEngine()
+        t = TetrominoType
+        grid = [[t.X] * 10 for _ in range(20)]
+        grid[16] = [t.X] * 4 + [t.Z] * 6
+        engine.board = grid
+        self.spawn(engine, TetrominoType.O)
+        under = [p for p in engine.reachable_placements() if p.r == 18 and p.c == 4]
+        self.assertEqual(len(under), 1)
+        self.assertIn(Action.RIGHT, under[0].actions)
+        self.assertNotEqual(under[0].actions[0], Action.RIGHT)
+
+
+class TestSelfPlay(unittest.TestCase):
+    def test_board_features(self):
+        t = TetrominoType
+        grid = [[t.X] * 4 for _ in range(4)]
+        grid[1][1] = t.I
+        grid[3][0] = t.O
+        grid[3][2] = t.O
+        board = Board.from_list(grid)
+        self.assertEqual(column_heights(board), [1, 3, 1, 0])
+        self.assertEqual(count_holes(board), 2)
+
+    def test_percentile(self):
+        self.assertEqual(percentile([1, 2, 3, 4, 5], 50), 3)
+        self.assertEqual(percentile([0, 10], 90), 9)
+        self.assertEqual(percentile([], 50), 0)
+
+    def test_play_game_is_reproducible(self):
+        first = play_game(3, max_pieces=10)
+        second = play_game(3, max_pieces=10)
+        self.assertEqual(first.pieces, 10)
+        self.assertEqual((first.lines, first.steps), (second.lines, second.steps))
+
+    def test_run_games_in_workers(self):
+        results = run_games(3, 2, 10, 4)
+        self.assertEqual([result.seed for result in results], [10, 11, 12])
+        summary = report(results, 1.0, 2)
+        self.assertEqual(summary["games"], 3)
+        self.assertEqual(summary["pieces_per_second"], 12)
+
+
+class TestReplay(unittest.TestCase):
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp()
+        os.close(handle)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def record_game(self, seed: int, randomizer: str = "7bag") -> TetrisEngine:
+        engine = TetrisEngine(randomizer=randomizer)
+        engine.reset(seed)
+        engine.recorder = ReplayWriter(self.path, seed, engine.numRows, engine.numCols,
+                                       randomizer)
+        rng = random.Random(seed)
+        while not engine.game_over:
+            # long runs of pure gravity make some tick deltas need two bytes
+            action = Action(rng.randrange(len(Action))) if rng.random() < 0.1 else Action.NONE
+            engine.step(action, rng.random() < 0.5)
+        return engine
+
+    def test_replay_matches(self):
+        engine = self.record_game(11)
+        result = run_replay(self.path)
+        self.assertTrue(result.matches)
+        self.assertEqual(result.engine.grid.rows, engine.grid.rows)
+        self.assertEqual(result.engine.tick, engine.tick)
+
+    def test_negative_seed(self):
+        engine = self.record_game(-12)
+        result = run_replay(self.path)
+        self.assertEqual(ReplayReader(self.path).seed, -12)
+        self.assertTrue(result.matches)
+        self.assertEqual(result.engine.grid.rows, engine.grid.rows)
+        with self.assertRaises(ValueError):
+            ReplayWriter(self.path, 1 << 63, 20, 10)
+
+    def test_replay_keeps_randomizer(self):
+        engine = self.record_game(13, "history")
+        result = run_replay(self.path)
+        self.assertTrue(result.matches)
+        self.assertEqual(result.engine.randomizer.name, "history")
+        self.assertEqual(result.engine.grid.rows, engine.grid.rows)
+
+    def test_truncated_replay(self):
+        self.record_game(12)
+        with open(self.path, "rb") as file:
+            data = file.read()
+        with open(self.path, "wb") as file:
+            file.write(data[:-3])
+        result = run_replay(self.path)
+        self.assertIsNone(result.matches)
+        self.assertGreater(result.inputs, 0)
+
+    def test_records(self):
+        with ReplayWriter(self.path, 5, 20, 10) as writer:
+            writer.record(0, Action.LEFT, False)
+            writer.record(300, Action.HARD_DROP, True)
+        reader = ReplayReader(self.path)
+        self.assertEqual(reader.seed, 5)
+        self.assertEqual(list(reader.records()),
+                         [(0, Action.LEFT, False), (300, Action.HARD_DROP, True)])
+        reader.close()
+        self.assertEqual(encode_varint(300), bytes((0xAC, 0x02)))
+
+
+class TestFixedTimestep(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.scheduler = FixedTimestep(.2, max_fps=10, max_catch_up=3, clock=lambda: self.now)
+
+    def test_ticks_do_not_drift(self):
+        ticks = 0
+        for _ in range(1000):
+            self.now += .07
+            ticks += self.scheduler.advance()
+        self.assertEqual(ticks, 350)
+
+    def test_stall_is_capped(self):
+        self.now += 10
+        self.assertEqual(self.scheduler.advance(), 3)
+        self.assertEqual(self.scheduler.advance(), 0)
+
+    def test_renders_only_when_dirty_and_capped(self):
+        self.assertTrue(self.scheduler.should_render())
+        self.scheduler.rendered()
+        self.assertFalse(self.scheduler.should_render())
+        self.scheduler.mark_dirty()
+        self.assertFalse(self.scheduler.should_render())
+        self.assertAlmostEqual(self.scheduler.timeout(), .1)
+        self.now += .1
+        self.assertTrue(self.scheduler.should_render())
+
+    def test_idle_waits_for_next_tick(self):
+        self.scheduler.rendered()
+        self.now += .05
+        self.assertAlmostEqual(self.scheduler.timeout(), .15)
+
+
+class TestBench(unittest.TestCase):
+    def test_virtual_terminal_counts_output(self):
+        term = VirtualTerminal(120, 50)
+        game = Tetris(term)
+        game.reset(0)
+        game.render_game()
+        self.assertEqual((term.stream.writes, term.stream.flushes), (1, 1))
+        self.assertGreater(term.stream.bytes, 0)
+        self.assertEqual(term.on_cyan("  "), "\x1b[46m  \x1b[m")
+
+    def test_run_reports_every_metric(self):
+        results = run(["rotate", "render_game"], 0, 1)["results"]
+        self.assertGreater(results["rotate"]["ns_per_op"], 0)
+        self.assertIn("bytes_per_frame", results["render_game"])
+
+    def test_headless_import_skips_terminal_and_audio(self):
+        code = ("import sys, replay, bot; "
+                "print([m for m in ('blessed', 'playsound', 'numpy') if m in sys.modules])")
+        output = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True,
+                                text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+        self.assertEqual(output.strip(), "[]")
+
+    def test_compare_flags_regressions(self):
+        baseline = {"results": {"rotate": {"ns_per_op": 100.0}}}
+        self.assertEqual(compare({"results": {"rotate": {"ns_per_op": 105.0}}}, baseline, .1), [])
+        regressions = compare({"results": {"rotate": {"ns_per_op": 150.0}}}, baseline, .1)
+        self.assertEqual(len(regressions), 1)
+        self.assertIn("rotate.ns_per_op", regressions[0])
+
+
+class ScriptedTerminal(VirtualTerminal):
+    """
+    A virtual terminal that plays back keys and moves a fake clock forward
+    by however long the game waits for them
+    """
+
+    def __init__(self, keys, clock):
+        super().__init__(120, 50)
+        self.keys = list(keys)
+        self.clock = clock
+
+    def inkey(self, timeout=None):
+        self.clock[0] += timeout or 0
+        return Keystroke(self.keys.pop(0) if self.keys else "")
+
+    def fullscreen(self):
+        return nullcontext()
+
+    cbreak = hidden_cursor = location = fullscreen
+
+
+def run_event_loop(game, clock):
+    with mock.patch("tetris.FixedTimestep",
+                    partial(FixedTimestep, clock=lambda: clock[0])):
+        game.event_loop()
+
+
+class TestFrameProfiler(unittest.TestCase):
+    def test_phases_and_output_are_recorded(self):
+        now = [0.0]
+        profiler = FrameProfiler(clock=lambda: now[0])
+        slow = profiler.wrap("drop_search", lambda: now.__setitem__(0, now[0] + .001))
+        now[0] += .010
+        profiler.mark("input")
+        slow()
+        now[0] += .001
+        profiler.mark("logic")
+        now[0] += .003
+        profiler.mark("render")
+        sample = profiler.end_frame(500, 1)
+        self.assertAlmostEqual(sample["input_ms"], 10)
+        self.assertAlmostEqual(sample["logic_ms"], 2)
+        self.assertAlmostEqual(sample["drop_search_ms"], 1)
+        self.assertAlmostEqual(sample["work_ms"], 5)
+        self.assertEqual((sample["bytes"], sample["flushes"]), (500, 1))
+        self.assertEqual(profiler.end_frame(700, 2)["bytes"], 200)
+        self.assertIn("p99", profiler.hud_lines()[3])
+
+    def test_event_loop_exports_frames(self):
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        clock = [0.0]
+        # the blanks end each read, so every drop gets a frame of its own
+        game = Tetris(ScriptedTerminal([" ", ""] * 40, clock))
+        game.reset(0)
+        game.enable_profiling(path)
+        run_event_loop(game, clock)
+        game.profiler.close()
+        with open(path) as file:
+            samples = [json.loads(line) for line in file]
+        os.remove(path)
+        self.assertEqual(len(samples), game.profiler.frames)
+        self.assertGreater(len(samples), 5)
+        self.assertEqual(sum(sample["bytes"] for sample in samples), game.renderer.bytes_written)
+        self.assertGreater(sum(sample["drop_search_ms"] for sample in samples), 0)
+
+
+class TestBatchTetris(unittest.TestCase):
+    def test_matches_engine(self):
+        batch = BatchTetris(8, seed=3)
+        batch.reset()
+        engines = []
+        for i in range(batch.num_envs):
+            engine = TetrisEngine()
+            engine.curr_block = Tetromino.of(PIECE_TYPES[batch.piece[i]])
+            engine.curr_block_r, engine.curr_block_c = int(batch.r[i]), int(batch.c[i])
+            engines.append(engine)
+
+        rng = random.Random(1)
+        for _ in range(1000):
+            actions = np.array([rng.randrange(len(Action)) for _ in engines])
+            gravity = rng.random() < 0.3
+            next_pieces = batch.next_pieces()
+            for engine, piece in zip(engines, next_pieces):
+                engine.bag = [Tetromino.of(PIECE_TYPES[piece])]
+            result = batch.step(actions, gravity)
+            for i, engine in enumerate(engines):
+                if engine.game_over:
+                    continue
+                expected = engine.step(Action(int(actions[i])), gravity)
+                board = [[0 if type == TetrominoType.X else PIECE_TYPES.index(type) + 1
+                          for type in row] for row in engine.grid.colors]
+                self.assertEqual(batch.boards[i].tolist(), board)
+                self.assertEqual(result.lines_cleared[i], expected.lines_cleared)
+                self.assertEqual(result.game_over[i], expected.game_over)
+                if not expected.game_over:
+                    self.assertEqual((batch.r[i], batch.c[i], batch.rotation[i]),
+                                     (engine.curr_block_r, engine.curr_block_c,
+                                      engine.curr_block.rotation))
+
+    def test_clear_full_lines(self):
+        batch = BatchTetris(2, num_rows=4, num_cols=3)
+        batch.boards[0] = [[0, 0, 0], [1, 1, 1], [0, 2, 0], [3, 3, 3]]
+        batch.boards[1] = [[0, 0, 0], [0, 0, 0], [0, 0, 0], [4, 0, 0]]
+        cleared = batch.clear_full_lines(np.arange(2))
+        self.assertEqual(cleared.tolist(), [2, 0])
+        self.assertEqual(batch.boards[0].tolist(), [[0, 0, 0]] * 3 + [[0, 2, 0]])
+        self.assertEqual(batch.boards[1, 3].tolist(), [4, 0, 0])
+
+    def test_reset_only_finished_games(self):
+        batch = BatchTetris(2, seed=0)
+        batch.reset()
+        batch.boards[1, 19] = 1
+        batch.game_over[0] = True
+        batch.reset(batch.game_over)
+        self.assertFalse(batch.game_over.any())
+        self.assertTrue(batch.boards[1, 19].all())
+
+
+def apply_output(screen: dict, text: str) -> None:
+    """Plays terminal output onto screen, a map from (x, y) to the style
+    of the character there
+    """
+    x = y = 0
+    style = ""
+    tokens = r"(\x1b\[H\x1b\[2J)|\x1b\[(\d+);(\d+)H|\x1b\(B|(\x1b\[[\d;]*m)|(.)"
+    for clear, row, col, sgr, char in re.findall(tokens, text):
+        if clear:
+            screen.clear()
+        elif row:
+            y, x = int(row) - 1, int(col) - 1
+        elif sgr:
+            style = "" if sgr == "\x1b[m" else sgr
+        elif char:
+            screen[x, y] = style
+            x += 1
+
+
+class TestFrameRenderer(unittest.TestCase):
+    def setUp(self):
+        self.stream = io.StringIO()
+        term = Terminal(kind="xterm-256color", stream=self.stream, force_styling=True)
+        self.game = Tetris(term)
+        self.game.curr_block = Tetromino.of(TetrominoType.T)
+        self.game.curr_block_r = 0
+        self.game.curr_block_c = 4
+
+    def render(self) -> str:
+        start = len(self.stream.getvalue())
+        self.game.render_game()
+        return self.stream.getvalue()[start:]
+
+    def test_unchanged_frame_writes_nothing(self):
+        self.assertIn(self.game.term.clear, self.render())
+        self.assertEqual(self.render(), "")
+
+    def test_only_changed_cells_are_written(self):
+        self.render()
+        self.game.curr_block_c += 1
+        moved = self.render()
+        self.assertNotIn(self.game.term.clear, moved)
+        # the piece and its ghost both gain a column on the right and lose
+        # one on the left: one span on their top rows, two on their bottom rows
+        moves = re.findall(r"\x1b\[\d+;\d+H", moved)
+        self.assertEqual(len(moves), 6 * self.game.block_height)
+
+    def test_diffs_add_up_to_full_frames(self):
+        rng = random.Random(0)
+        self.game.reset(0)
+        screen = {}
+        for _ in range(300):
+            if self.game.step(Action(rng.randrange(len(Action))), rng.random() < .3).game_over:
+                self.game.reset(rng.randrange(100))
+            apply_output(screen, self.render())
+        full = {}
+        self.game.renderer.invalidate()
+        apply_output(full, self.render())
+        self.assertEqual(screen, full)
+
+    def test_default_board_fits_default_terminal(self):
+        game = Tetris(VirtualTerminal(80, 24))
+        game.reset(0)
+        game.render_game()
+        self.assertEqual((game.view_rows, game.view_cols), (20, 10))
+        self.assertEqual(game.view_r, 0)
+        # the border below the board is still on screen
+        self.assertLessEqual(game.zero_r + game.block_height * game.view_rows, 23)
+        game = Tetris(VirtualTerminal(80, 21))
+        game.calculate_term_dimensions()
+        self.assertEqual(game.view_rows, 19)
+
+    def test_narrow_terminal_shrinks_blocks_before_scrolling(self):
+        for width, height in ((60, 100), (40, 50)):
+            game = Tetris(VirtualTerminal(width, height))
+            game.calculate_term_dimensions()
+            self.assertEqual((game.view_rows, game.view_cols), (20, 10))
+            self.assertLessEqual(game.block_width * game.view_cols + 2, width)
+        game = Tetris(VirtualTerminal(60, 100))
+        game.calculate_term_dimensions()
+        self.assertEqual(game.block_height, 2)
+
+    def test_viewport_follows_block_on_huge_board(self):
+        game = Tetris(VirtualTerminal(80, 24), 1000, 500)
+        game.reset(0)
+        game.render_game()
+        self.assertLess(game.view_rows, 1000)
+        self.assertLess(game.view_cols, 500)
+        game.step(Action.NONE, gravity=False)
+        for _ in range(100):
+            game.step(Action.RIGHT, gravity=False)
+        for _ in range(600):
+            game.step(Action.NONE, gravity=True)
+        frame = game.renderer.compose(game)
+        self.assertEqual((len(frame), len(frame[0])), (game.view_rows, game.view_cols))
+        self.assertIn(game.curr_block.type, [key for row in frame for key in row])
+        self.assertGreater(game.view_r, 500)
+        self.assertGreater(game.view_c, 0)
+        # scrolling redraws at most the viewport
+        written = game.renderer.bytes_written
+        game.render_game()
+        self.assertLess(game.renderer.bytes_written - written, 20 * game.view_rows * game.view_cols)
+
+    def test_compose_overlays_ghost_and_block(self):
+        frame = self.game.renderer.compose(self.game)
+        self.assertEqual(frame[0][5], TetrominoType.T)
+        self.assertEqual(frame[18][5], GHOST)
+        self.assertEqual(frame[19][4], GHOST)
+        self.assertEqual(frame[18][4], TetrominoType.X)
+
+
+class TestAudio(unittest.TestCase):
+    def test_music_loops_without_gaps(self):
+        music = np.arange(-500, 500, dtype=np.int16).reshape(-1, 2)
+        mixer = Mixer(music, volume=1)
+        out = np.concatenate([mixer.mix(300) for _ in range(5)])
+        np.testing.assert_array_equal(out, np.tile(music, (3, 1))[:1500])
+
+    def test_effects_are_mixed_in(self):
+        mixer = Mixer()
+        effect = EFFECTS["clear"]
+        mixer.play(effect)
+        mixer.play(effect)
+        out = np.concatenate([mixer.mix(1024) for _ in range(len(effect) // 1024 + 2)])
+        expected = np.clip(effect.astype(np.int32) * 2, -32768, 32767)
+        np.testing.assert_array_equal(out[:len(effect)], expected)
+        self.assertFalse(out[len(effect):].any())
+        self.assertEqual(mixer.playing, [])
+
+    def test_wav_backend_round_trip(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "out.wav")
+            backend = WavBackend(path, realtime=False, limit=4096)
+            audio = AudioEngine(backend)
+            # queued before mixing starts, so it begins on the first frame
+            audio.play("lock")
+            with audio:
+                backend.thread.join(timeout=10)
+                self.assertFalse(backend.thread.is_alive())
+            samples = load_wav(path)
+        self.assertEqual(len(samples), 4096)
+        np.testing.assert_array_equal(samples[:len(EFFECTS["lock"])], EFFECTS["lock"])
+
+    def test_locks_play_effects(self):
+        game = Tetris(VirtualTerminal())
+        game.reset(0)
+        game.audio = mock.Mock()
+        game.play_effects(game.step(Action.HARD_DROP, gravity=False))
+        game.audio.play.assert_called_once_with("lock")
+
+    def test_undecodable_track_plays_silence(self):
+        with tempfile.TemporaryDirectory() as folder, \
+                mock.patch.dict(sys.modules, {"miniaudio": None}):
+            track = os.path.join(folder, "track.mp3")
+            backend = WavBackend(os.path.join(folder, "out.wav"), realtime=False)
+            audio = AudioEngine(backend, track)
+            with audio:
+                audio.loader.join()
+            self.assertIsInstance(audio.error, ImportError)
+            self.assertIsNone(audio.mixer.music)
+            self.assertFalse(can_decode(track))
+            self.assertTrue(can_decode(os.path.join(folder, "track.wav")))
+
+    def test_audio_out_without_miniaudio_has_no_music(self):
+        from main import start_audio
+        with tempfile.TemporaryDirectory() as folder, \
+                mock.patch("importlib.util.find_spec", return_value=None):
+            audio = start_audio(os.path.join(folder, "out.wav"))
+            audio.stop()
+        self.assertIsNone(audio.music_path)
+        self.assertIsNone(audio.loader)
+        self.assertIn("miniaudio", str(audio.error))
+
+    def test_hud_says_when_music_is_off(self):
+        game = Tetris(VirtualTerminal())
+        game.reset(0)
+        game.audio = mock.Mock(error=None)
+        with mock.patch.object(game.renderer, "render") as render:
+            game.render_game()
+            self.assertIsNone(render.call_args.args[1])
+            game.audio.error = ImportError("no miniaudio")
+            game.render_game()
+            self.assertIn("music  off", render.call_args.args[1])
+
+
+class TestGameServer(unittest.TestCase):
+    def test_key_decoder_joins_split_sequences(self):
+        decoder = KeyDecoder()
+        self.assertEqual(decoder.feed(b"x\x1b["), ["x"])
+        keys = decoder.feed(b"D ")
+        self.assertEqual(keys, ["\x1b[D", " "])
+        self.assertEqual(keys[0].code, VirtualTerminal.KEY_LEFT)
+        self.assertFalse(keys[1].is_sequence)
+
+    def test_concurrent_sessions_play_to_the_end(self):
+        async def play(path):
+            reader, writer = await asyncio.open_unix_connection(path)
+            writer.write(b"\x1b[D \x1b[C\x1b[C " * 40)
+            await writer.drain()
+            output = await reader.read()
+            writer.close()
+            return output
+
+        async def run_clients(server, path):
+            listener = await server.serve_unix(path)
+            async with listener:
+                return await asyncio.gather(*(play(path) for _ in range(20)))
+
+        server = GameServer(tick_time=.005, max_fps=1000, seed=0)
+        with tempfile.TemporaryDirectory() as folder:
+            outputs = asyncio.run(run_clients(server, os.path.join(folder, "tetris.sock")))
+        for output in outputs:
+            self.assertIn(b"\x1b[2J", output)
+            self.assertTrue(output.endswith(b"Game over!\r\n"))
+        self.assertEqual(server.games_played, 20)
+        self.assertEqual(server.sessions, set())
+
+
+class TestSnapshot(unittest.TestCase):
+    def play(self, engine, rng, steps):
+        for _ in range(steps):
+            if engine.step(Action(rng.randrange(len(Action))), rng.random() < .3).game_over:
+                return
+
+    def assertSameGame(self, a, b):
+        self.assertEqual(a.grid.to_list(), b.grid.to_list())
+        self.assertEqual(a.grid.rows, b.grid.rows)
+        self.assertEqual((a.curr_block, a.curr_block_r, a.curr_block_c, a.tick, a.game_over),
+                         (b.curr_block, b.curr_block_r, b.curr_block_c, b.tick, b.game_over))
+        self.assertEqual(a.bag, b.bag)
+
+    def test_resume_from_snapshot(self):
+        engine = TetrisEngine()
+        engine.reset(5)
+        self.play(engine, random.Random(5), 300)
+        resumed = TetrisEngine()
+        resumed.deserialize(engine.serialize(rng=True))
+        self.assertSameGame(engine, resumed)
+        self.play(engine, random.Random(6), 500)
+        self.play(resumed, random.Random(6), 500)
+        self.assertSameGame(engine, resumed)
+
+    def test_resume_keeps_the_randomizer(self):
+        for name in RANDOMIZERS:
+            engine = TetrisEngine(randomizer=name)
+            engine.reset(3)
+            self.play(engine, random.Random(3), 100)
+            resumed = TetrisEngine()
+            resumed.deserialize(engine.serialize(rng=True))
+            self.assertEqual(resumed.randomizer.name, name)
+            self.assertEqual(resumed.randomizer.getstate(), engine.randomizer.getstate())
+            self.assertEqual(resumed.preview(40), engine.preview(40))
+
+    def test_cells_round_trip(self):
+        types = [TYPES[i % 8] for i in range(200_001)]
+        data = pack_cells(types)
+        self.assertEqual(len(data), (3 * len(types) + 7) // 8)
+        self.assertEqual(unpack_cells(b"\0" + data, 1, len(types)), (types, len(data) + 1))
+        self.assertEqual(pack_cells(types[:3]), bytes([0b10001000, 0]))
+
+    def test_snapshot_is_compact(self):
+        engine = TetrisEngine()
+        engine.reset(1)
+        self.play(engine, random.Random(1), 300)
+        # 3 bits per cell at most, plus a small header
+        self.assertLess(len(engine.serialize()), 200 * 3 // 8 + 30)
+
+    def test_deltas_follow_the_game(self):
+        engine = TetrisEngine()
+        engine.reset(2)
+        spectator = decode_snapshot(engine.serialize())
+        policy = GreedyPolicy()
+        lines = 0
+        for _ in range(40):
+            for action in policy.choose(engine).actions:
+                result = engine.step(action, gravity=False)
+                apply_delta(spectator, encode_delta(engine))
+                lines += result.lines_cleared
+        self.assertGreater(lines, 0)
+        self.assertSameGame(engine, spectator)
+
+
+class TestTransposition(unittest.TestCase):
+    def test_zobrist_is_kept_up_to_date(self):
+        engine = TetrisEngine()
+        engine.reset(7)
+        policy = GreedyPolicy()
+        lines = 0
+        for _ in range(60):
+            for action in policy.choose(engine).actions:
+                lines += engine.step(action, gravity=False).lines_cleared
+            zobrist = engine.grid.zobrist
+            engine.grid.rehash()
+            self.assertEqual(zobrist, engine.grid.zobrist)
+            self.assertEqual(zobrist, Board.from_list(engine.grid.to_list()).zobrist)
+        self.assertGreater(lines, 0)
+
+    def test_wide_rows_have_distinct_keys(self):
+        zobrists = set()
+        for start in range(3):
+            board = Board(4, 100)
+            board.set_row(2, [TetrominoType.X] * start + [TetrominoType.I] * 61 +
+                          [TetrominoType.X] * (39 - start))
+            zobrists.add(board.zobrist)
+            zobrist = board.zobrist
+            board.rehash()
+            self.assertEqual(board.zobrist, zobrist)
+        self.assertEqual(len(zobrists), 3)
+        self.assertNotEqual(row_key(1, 1 << 99), row_key(2, 1 << 99))
+
+    def test_position_hash_includes_piece(self):
+        engine = TetrisEngine()
+        engine.reset(0)
+        before = engine.position_hash()
+        engine.step(Action.LEFT, gravity=False)
+        self.assertNotEqual(engine.position_hash(), before)
+        engine.step(Action.RIGHT, gravity=False)
+        self.assertEqual(engine.position_hash(), before)
+
+    def test_lru_eviction_and_counts(self):
+        table = TranspositionTable(2)
+        table.put(1, "a")
+        table.put(2, "b")
+        self.assertEqual(table.get(1), "a")
+        table.put(3, "c")
+        self.assertIsNone(table.get(2))
+        self.assertEqual(len(table), 2)
+        self.assertEqual(table.stats(), {"entries": 2, "hits": 1, "misses": 1, "evictions": 1,
+                                         "hit_rate": .5})
+
+    def test_cached_policy_plays_the_same(self):
+        table = TranspositionTable(5000)
+        plain = play_game(3, GreedyPolicy(), 40)
+        cached = play_game(3, GreedyPolicy(table), 40)
+        self.assertEqual((plain.lines, plain.steps), (cached.lines, cached.steps))
+        misses = table.misses
+        play_game(3, GreedyPolicy(table), 40)
+        self.assertEqual(table.misses, misses)
+        self.assertLessEqual(len(table), 5000)
+
+
+class TestPlanner(unittest.TestCase):
+    def setUp(self):
+        self.engine = TetrisEngine()
+        self.engine.reset(5)
+
+    def test_no_budget_still_has_a_move(self):
+        result = BeamPlanner().plan(self.engine, 0)
+        self.assertEqual(result.depth, 1)
+        self.assertIn(result.placement, self.engine.reachable_placements())
+
+    def test_searches_deeper_with_time(self):
+        planner = BeamPlanner(width=4, depth=4)
+        result = planner.plan(self.engine, 10)
+        self.assertEqual(result.depth, 4)
+        self.assertGreater(result.nodes, len(self.engine.reachable_placements()))
+        self.assertGreater(planner.nodes_per_second(), 0)
+
+    def test_workers_split_the_roots(self):
+        planner = BeamPlanner(width=4, depth=3, workers=2)
+        try:
+            result = planner.plan(self.engine, 10)
+        finally:
+            planner.close()
+        self.assertEqual(result.depth, 3)
+        self.assertIn(result.placement, self.engine.reachable_placements())
+
+    def test_workers_keep_to_the_budget(self):
+        budget = .1
+        planner = BeamPlanner(workers=2)
+        try:
+            for _ in range(3):
+                result = planner.plan(self.engine, budget)
+                self.assertLessEqual(result.seconds, budget * 1.1)
+                self.assertIn(result.placement, self.engine.reachable_placements())
+        finally:
+            planner.close()
+
+    def test_autoplay_places_pieces(self):
+        class Limited(BeamPlanner):
+            # give up after a few pieces so the game ends
+            def plan(self, engine, budget):
+                if self.nodes > 2000:
+                    return PlanResult(None, 0, 0, 0.0)
+                return super().plan(engine, budget)
+
+        clock = [0.0]
+        game = Tetris(ScriptedTerminal([], clock))
+        game.reset(0)
+        game.planner = Limited(budget=0)
+        run_event_loop(game, clock)
+        self.assertTrue(game.game_over)
+        self.assertGreater(game.planner.nodes, 2000)
+        self.assertIn("depth", game.planner.hud_lines()[0])
+        self.assertRegex(game.planner.hud_lines()[-1], r"table  \d+ hits \d+ misses \d+%")
+
+
+class TestInputQueue(unittest.TestCase):
+    def setUp(self):
+        self.now = [0.0]
+        self.queue = InputQueue(lambda action: action, das=.1, arr=.05, width=10,
+                                clock=lambda: self.now[0])
+
+    def test_taps_move_once_each(self):
+        for at in (0, .2, .4):
+            self.queue.push(Action.LEFT, at)
+        self.queue.push(Action.ROTATE_RIGHT, .3)
+        self.assertEqual(self.queue.due(.5), [Action.LEFT, Action.LEFT, Action.ROTATE_RIGHT,
+                                              Action.LEFT])
+        self.assertIsNone(self.queue.held)
+        self.assertEqual(self.queue.due(1), [])
+
+    def test_held_key_shifts_on_das_and_arr(self):
+        # pressed at 0, then the terminal repeats it from .3
+        self.queue.push(Action.LEFT, 0)
+        for at in (.3, .33, .36, .39, .42):
+            self.queue.push(Action.LEFT, at)
+        self.assertEqual(self.queue.held, Action.LEFT)
+        # the press, the first repeat, then shifts at .1, .15, ... .4
+        self.assertEqual(self.queue.due(.42), [Action.LEFT] * 8)
+        self.now[0] = .42
+        # the next shift is at .45, before the key could have been let go
+        self.assertAlmostEqual(self.queue.timeout(), .03)
+        self.assertLess(self.queue.timeout(), REPEAT_GAP)
+        # the repeats stopped, so the key was let go soon after .42
+        self.assertEqual(self.queue.due(.6), [Action.LEFT])
+        self.assertIsNone(self.queue.held)
+        self.assertEqual(self.queue.timeout(), float("inf"))
+
+    def test_zero_arr_goes_to_the_wall(self):
+        self.queue.arr = 0
+        for at in (0, .3, .33, .36):
+            self.queue.push(Action.RIGHT, at)
+        self.assertEqual(self.queue.due(.33), [Action.RIGHT] * 11)
+
+    def test_keys_that_come_together_are_taps(self):
+        for _ in range(3):
+            self.queue.push(Action.LEFT, 1.0)
+        self.assertEqual(self.queue.due(1.0), [Action.LEFT] * 3)
+        self.assertIsNone(self.queue.held)
+        self.assertEqual(self.queue.due(1.3), [])
+
+    def test_fast_taps_move_once_each(self):
+        # faster than the terminal repeats, but with no pause before them
+        for at in (0, .03, .06):
+            self.queue.push(Action.RIGHT, at)
+        self.assertIsNone(self.queue.held)
+        self.assertEqual(self.queue.due(.5), [Action.RIGHT] * 3)
+
+    def test_server_packet_moves_once_per_key(self):
+        async def play():
+            reader = asyncio.StreamReader()
+            reader.feed_data(b"\x1b[D\x1b[D\x1b[D")
+            reader.feed_eof()
+            session = Session(reader, mock.Mock(drain=mock.AsyncMock()), seed=0, tick_time=60)
+            start = session.game.curr_block_c
+            await session.play()
+            return start - session.game.curr_block_c
+
+        self.assertEqual(asyncio.run(play()), 3)
+
+    def test_latency_is_press_to_frame(self):
+        self.queue.push(Action.HARD_DROP, 1.0)
+        self.queue.push(Action.LEFT, 1.01)
+        self.queue.due(1.02)
+        self.queue.rendered(1.03)
+        self.assertEqual(len(self.queue.latencies), 2)
+        self.assertAlmostEqual(self.queue.latency()["max"], 30)
+        self.assertAlmostEqual(self.queue.latency()["min"], 20)
+
+    def test_event_loop_drains_every_waiting_key(self):
+        clock = [0.0]
+        game = Tetris(ScriptedTerminal([" "] * 3, clock))
+        game.reset(0)
+        frames = []
+        render_game = game.render_game
+
+        def render():
+            frames.append(sum(bin(row).count("1") for row in game.grid.rows))
+            render_game()
+        game.render_game = render
+        run_event_loop(game, clock)
+        # all three drops were waiting, so they land before the first frame
+        self.assertEqual(frames[0], 12)
+        self.assertEqual(game.input.keys, 3)
+        self.assertEqual(len(game.input.latencies), 3)
+
+
+class TestPerft(unittest.TestCase):
+    def test_sequence_is_the_games(self):
+        engine = TetrisEngine()
+        engine.reset(0)
+        dealt = [engine.curr_block.type] + [piece.type for piece in reversed(engine.bag)]
+        self.assertEqual(piece_sequence(0, 7), dealt)
+
+    def test_known_counts(self):
+        result = perft(Board(20, 10), piece_sequence(0, 2))
+        self.assertEqual(result.counts, KNOWN[0][:2])
+        self.assertGreater(result.nodes_per_second, 0)
+
+    def test_workers_count_the_same(self):
+        result = perft(Board(20, 10), piece_sequence(0, 2), workers=2)
+        self.assertEqual(result.counts, KNOWN[0][:2])
+
+    def test_topped_out_board_has_no_moves(self):
+        board = Board(4, 10)
+        for r in range(4):
+            board.set_row(r, [TetrominoType.X] + [TetrominoType.Z] * 9)
+        self.assertEqual(perft(board, [TetrominoType.O, TetrominoType.O]).counts, [0, 0])
+
+
+class TestRandomizer(unittest.TestCase):
+    def dealt(self, engine, count):
+        pieces = []
+        for _ in range(count):
+            pieces.append(engine.curr_block.type)
+            engine.step(Action.HARD_DROP, gravity=False)
+        return pieces
+
+    def test_bags_hold_every_piece(self):
+        for name, size in (("7bag", 7), ("14bag", 14)):
+            stream = PieceStream(name, 3, size * 20)
+            for start in range(0, len(stream), size):
+                self.assertEqual(sorted(stream.codes[start:start + size]),
+                                 sorted(list(range(7)) * (size // 7)))
+
+    def test_stream_matches_engine(self):
+        for name in RANDOMIZERS:
+            engine = TetrisEngine(num_rows=200, randomizer=name)
+            engine.reset(4)
+            self.assertEqual(self.dealt(engine, 30), PieceStream(name, 4, 30).peek(0, 30))
+
+    def test_streams_ignore_the_global_generator(self):
+        random.seed(1)
+        first = PieceStream("random", 9, 50).codes
+        random.seed(2)
+        self.assertEqual(PieceStream("random", 9, 50).codes, first)
+        self.assertNotEqual(PieceStream("random", 10, 50).codes, first)
+
+    def test_history_avoids_repeats(self):
+        stream = PieceStream("history", 0, 2000)
+        self.assertIn(stream[0], (TetrominoType.I, TetrominoType.J, TetrominoType.L,
+                                  TetrominoType.T))
+        repeats = sum(stream.codes[i] in stream.codes[i - 4:i] for i in range(4, len(stream)))
+        # a pure random stream repeats one of the last 4 about 45% of the time
+        self.assertLess(repeats / len(stream), .1)
+
+    def test_preview_deals_ahead(self):
+        engine = TetrisEngine(num_rows=200, randomizer="history")
+        engine.reset(6)
+        coming = engine.preview(12)
+        self.assertEqual(self.dealt(engine, 13)[1:], coming)
+        self.assertEqual(engine.preview(0), [])
+
+    def test_unknown_randomizer(self):
+        with self.assertRaises(ValueError):
+            make_randomizer("tgm3")
+
+    def test_batch_deals_streams(self):
+        streams = np.stack([np.frombuffer(PieceStream(name, 1, 50).codes, np.uint8)
+                            for name in ("7bag", "random")])
+        env = BatchTetris(2, streams=streams)
+        env.reset()
+        dealt = [env.piece.copy()]
+        for _ in range(5):
+            self.assertEqual(list(env.next_pieces()), list(streams[:, len(dealt)]))
+            env.step(np.full(2, Action.HARD_DROP.value), gravity=False)
+            dealt.append(env.piece.copy())
+        self.assertEqual(np.stack(dealt, axis=1).tolist(), streams[:, :6].tolist())
+
+
+class TestDataset(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_records_every_lock(self):
+        engine = TetrisEngine()
+        engine.reset(2)
+        engine.exporter = DatasetWriter(self.directory, shard_size=16, chunk=4)
+        policy = GreedyPolicy()
+        expected = []
+        for _ in range(40):
+            before = list(engine.grid.rows)
+            placement = policy.choose(engine)
+            for action in placement.actions:
+                result = engine.step(action, gravity=False)
+            piece = placement.piece
+            expected.append((before, PIECE_TYPES.index(piece.type), piece.rotation, placement.r,
+                             placement.c, result.lines_cleared))
+        # readable while it's still being written
+        self.assertEqual(sum(len(shard) for shard in open_dataset(self.directory)), 36)
+        engine.exporter.close()
+        shards = open_dataset(self.directory)
+        self.assertEqual([len(shard) for shard in shards], [16, 16, 8])
+        records = np.concatenate(shards)
+        self.assertEqual([(record["board"].tolist(), *(int(record[name]) for name in
+                           ("piece", "rotation", "r", "c", "lines"))) for record in records],
+                         expected)
+        self.assertGreater(records["lines"].sum(), 0)
+        path = os.path.join(self.directory, "shard-00002.npy")
+        self.assertEqual(os.path.getsize(path), HEADER_LEN + 8 * records.dtype.itemsize)
+
+    def test_unpack_boards(self):
+        board = Board(20, 10)
+        board.place(Tetromino.of(TetrominoType.T).state.cells, TetrominoType.T, 18, 3)
+        masks = np.array(board.rows, dtype=np.uint16)
+        cells = [[int(type != TetrominoType.X) for type in row] for row in board.to_list()]
+        self.assertEqual(unpack_boards(masks).tolist(), cells)
+
+    def test_self_play_export(self):
+        result = play_game(8, max_pieces=30, export=self.directory)
+        shards = open_dataset(self.directory)
+        self.assertEqual(sum(len(shard) for shard in shards), result.pieces)
+        self.assertEqual(int(sum(shard["lines"].sum() for shard in shards)), result.lines)
+        self.assertTrue(os.path.exists(os.path.join(self.directory, "game-8-00000.npy")))
+
+
+class TestSoak(unittest.TestCase):
+    def test_restarts_and_samples(self):
+        runner = SoakRunner(num_rows=5, num_cols=5, table_size=100)
+        samples = runner.run(.6, .1)
+        self.assertGreaterEqual(len(samples), 3)
+        self.assertGreater(runner.games, 0)
+        self.assertLessEqual(samples[-1]["table_entries"], 100)
+        self.assertGreater(samples[-1]["rss_mb"], 0)
+        self.assertGreater(samples[-1]["frame_p99_us"], 0)
+        self.assertEqual(runner.report()["samples"], len(samples))
+        self.assertEqual(samples[-1]["table_hits"] + samples[-1]["table_misses"],
+                         runner.table.hits + runner.table.misses)
+        self.assertGreater(samples[-1]["table_hit_rate"], 0)
+        self.assertEqual(runner.report()["table"], runner.table.stats())
+
+    def test_traces_allocations(self):
+        runner = SoakRunner(num_rows=5, num_cols=5, trace=True, top=3)
+        sample = runner.run(.3, .1)[-1]
+        self.assertEqual(len(sample["top"]), 3)
+        self.assertGreater(sample["traced_mb"], 0)
+
+    def test_slope(self):
+        self.assertAlmostEqual(slope_per_hour([0, 1800, 3600], [10, 11, 12]), 2)
+        self.assertEqual(slope_per_hour([5], [1]), 0)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,8 +1,14 @@
 from enum import Enum
-from typing import List
-from blessed import Terminal
-from random import shuffle
-import time
+from hashlib import blake2b
+from typing import TYPE_CHECKING, Iterable, List, NamedTuple, Optional, Tuple
+from random import Random
+import sys
+from scheduler import FixedTimestep
+
+if TYPE_CHECKING:
+    # blessed is only needed by the terminal front end, so headless users
+    # don't pay for importing it
+    from blessed import Terminal
 
 
 class TetrominoType(Enum):
@@ -42,18 +48,103 @@ class TetrominoType(Enum):
         return self.value
 
 
+class Action(Enum):
+    """
+    An enum for the inputs the engine understands
+    """
+
+    NONE = 0
+    LEFT = 1
+    RIGHT = 2
+    DOWN = 3
+    ROTATE_RIGHT = 4
+    ROTATE_LEFT = 5
+    HARD_DROP = 6
+
+
+class RotationState:
+    """
+    One precomputed orientation of a tetromino. These are built once at
+    import time and shared by every piece
+    """
+
+    __slots__ = ("matrix", "size", "cells", "row_masks", "col_bottoms",
+                 "left", "right", "top", "bottom", "shape_id")
+
+    def __init__(self, matrix: List[List[TetrominoType]], shape_id: int) -> None:
+        """Creates a rotation state from its matrix
+
+        Args:
+            matrix (List[List[TetrominoType]]): the shape in this orientation
+            shape_id (int): the index of the first orientation with the same
+                matrix, so that symmetric orientations compare equal
+        """
+        self.matrix = tuple(tuple(row) for row in matrix)
+        self.size = len(matrix)
+        self.shape_id = shape_id
+        self.cells = tuple((i, j) for i, row in enumerate(matrix)
+                           for j, type in enumerate(row) if type != TetrominoType.X)
+        row_masks = {}
+        for i, j in self.cells:
+            row_masks[i] = row_masks.get(i, 0) | (1 << j)
+        self.row_masks = tuple(sorted(row_masks.items()))
+        col_bottoms = {}
+        for i, j in self.cells:
+            col_bottoms[j] = max(col_bottoms.get(j, i), i)
+        self.col_bottoms = tuple(sorted(col_bottoms.items()))
+        self.left = min(j for _, j in self.cells)
+        self.right = max(j for _, j in self.cells)
+        self.top = min(i for i, _ in self.cells)
+        self.bottom = max(i for i, _ in self.cells)
+
+
 class Tetromino:
     """
-    Represents a single tetromino
+    Represents a single tetromino as a (type, rotation) pair into the
+    precomputed rotation tables
     """
 
-    def __init__(self, type: TetrominoType) -> None:
+    __slots__ = ("type", "rotation", "state", "shared")
+
+    def __init__(self, type: TetrominoType, rotation: int = 0) -> None:
         """Creates a tetromino
 
         Args:
             type (TetrominoType): The type of tetromino
+            rotation (int): the number of right rotations from the spawn state
+
+        Raises:
+            ValueError: On bad input type
+        """
+        states = ROTATION_STATES.get(type)
+        if states is None:
+            raise ValueError("No type given")
+        self.type = type
+        self.rotation = rotation % 4
+        self.state = states[self.rotation]
+        self.shared = False
+
+    @staticmethod
+    def of(type: TetrominoType, rotation: int = 0) -> "Tetromino":
+        """Returns the shared, immutable instance for a type and rotation
+
+        Args:
+            type (TetrominoType): The type of tetromino
+            rotation (int): the number of right rotations from the spawn state
+
+        Returns:
+            Tetromino: the shared piece
         """
-        self.matrix = Tetromino.get_shape_of_tetromino(type)
+        return SHARED_TETROMINOS[type][rotation % 4]
+
+    @property
+    def matrix(self) -> tuple:
+        """The shape of the current orientation
+
+        Returns:
+            tuple: the rows of the shape
+        """
+        return self.state.matrix
 
     def shape(self) -> List[List[TetrominoType]]:
         """Returns how to draw the tetromino, with booleans denoting if it should be drawn
@@ -61,7 +152,7 @@ class Tetromino:
         Returns:
             List[List[TetrominoType]]: The shape
         """
-        return self.matrix
+        return self.state.matrix
 
     def get_left_boundary(self) -> int:
         """Gets the leftmost column that contains a nonzero value
@@ -69,13 +160,7 @@ class Tetromino:
         Returns:
             int: the leftmost index with something
         """
-        for i in range(0, len(self.matrix)):
-            column_empty = True
-            for j in range(0, len(self.matrix)):
-                if self.matrix[j][i] != TetrominoType.X:
-                    column_empty = False
-            if not column_empty:
-                return i
+        return self.state.left
 
     def get_right_boundary(self) -> int:
         """Gets the rightmost column that contains a nonzero value
@@ -83,13 +168,7 @@ class Tetromino:
         Returns:
             int: the rightmost index with something
         """
-        for i in range(len(self.matrix) - 1, -1, -1):
-            column_empty = True
-            for j in range(0, len(self.matrix)):
-                if self.matrix[j][i] != TetrominoType.X:
-                    column_empty = False
-            if not column_empty:
-                return i
+        return self.state.right
 
     def get_bottom_boundary(self) -> int:
         """Gets the lowest row that contains a nonzero value
@@ -97,13 +176,7 @@ class Tetromino:
         Returns:
             int: the lowest index with something
         """
-        for i in range(len(self.matrix) - 1, -1, -1):
-            row_empty = True
-            for j in range(0, len(self.matrix)):
-                if self.matrix[i][j] != TetrominoType.X:
-                    row_empty = False
-            if not row_empty:
-                return i
+        return self.state.bottom
 
     def get_size(self) -> int:
         """Returns the size of the block
@@ -111,17 +184,46 @@ class Tetromino:
         Returns:
             int: the side length
         """
-        return len(self.matrix)
+        return self.state.size
+
+    def rotated_left(self) -> "Tetromino":
+        """Returns the shared piece rotated left 90 degrees from this one
+
+        Returns:
+            Tetromino: the rotated piece
+        """
+        return SHARED_TETROMINOS[self.type][(self.rotation - 1) % 4]
+
+    def rotated_right(self) -> "Tetromino":
+        """Returns the shared piece rotated right 90 degrees from this one
+
+        Returns:
+            Tetromino: the rotated piece
+        """
+        return SHARED_TETROMINOS[self.type][(self.rotation + 1) % 4]
 
     def rotate_left(self) -> None:
         """Rotates this tetromino left 90 degrees
+
+        Raises:
+            TypeError: if this is a shared instance
         """
-        self.matrix = list(zip(*self.matrix[::]))[::-1]
+        self._set_rotation(self.rotation - 1)
 
     def rotate_right(self) -> None:
         """Rotates this tetromino right 90 degrees
+
+        Raises:
+            TypeError: if this is a shared instance
         """
-        self.matrix = list(zip(*self.matrix[::-1]))
+        self._set_rotation(self.rotation + 1)
+
+    def _set_rotation(self, rotation: int) -> None:
+        if self.shared:
+            raise TypeError(
+                "shared tetrominos are immutable, use rotated_left/rotated_right")
+        self.rotation = rotation % 4
+        self.state = ROTATION_STATES[self.type][self.rotation]
 
     def __str__(self) -> str:
         """Dunder for to string
@@ -129,18 +231,16 @@ class Tetromino:
         Returns:
             str: the string representation
         """
-        string: str = ""
-        for row in self.matrix:
-            for type in row:
-                string += str(type)
-            string += "\n"
-        return string
+        return "".join("".join(str(type) for type in row) + "\n" for row in self.state.matrix)
 
     def __eq__(self, __value: object) -> bool:
         if isinstance(__value, Tetromino):
-            return str(self) == str(__value)
+            return self.type is __value.type and self.state.shape_id == __value.state.shape_id
         return False
 
+    def __hash__(self) -> int:
+        return hash((self.type, self.state.shape_id))
+
     @staticmethod
     def get_shape_of_tetromino(type: TetrominoType) -> List[List[TetrominoType]]:
         """Returns the shape of the given type
@@ -202,250 +302,678 @@ class Tetromino:
                 raise ValueError("No type given")
 
 
-class Tetris:
+def _build_rotation_states(type: TetrominoType) -> tuple:
+    """Builds the four orientations of a type, rotating right each time
+
+    Args:
+        type (TetrominoType): the type of tetromino
+
+    Returns:
+        tuple: the four RotationStates
+    """
+    matrices = [Tetromino.get_shape_of_tetromino(type)]
+    for _ in range(3):
+        matrices.append([list(row) for row in zip(*matrices[-1][::-1])])
+    return tuple(RotationState(matrix, matrices.index(matrix)) for matrix in matrices)
+
+
+def _build_shared_tetrominos(type: TetrominoType) -> tuple:
+    """Builds the shared, immutable piece for every orientation of a type
+
+    Args:
+        type (TetrominoType): the type of tetromino
+
+    Returns:
+        tuple: the four shared Tetrominos
+    """
+    pieces = tuple(Tetromino(type, rotation) for rotation in range(4))
+    for piece in pieces:
+        piece.shared = True
+    return pieces
+
+
+"""The playable types, in a fixed order
+"""
+PIECE_TYPES = tuple(type for type in TetrominoType if type != TetrominoType.X)
+ROTATION_STATES = {type: _build_rotation_states(type) for type in PIECE_TYPES}
+SHARED_TETROMINOS = {type: _build_shared_tetrominos(type) for type in PIECE_TYPES}
+
+"""Zobrist keys. Rather than a table of random keys per cell, which
+would be huge for big boards, a row's key is the hash of its height and
+contents, so a change to a row costs two keys whatever its width. Python
+hashes an int below HASH_MODULUS to itself, so narrow rows (up to 60
+columns) use the fast built-in hash, and wider rows, which it would reduce
+modulo HASH_MODULUS and so collide, are hashed with BLAKE2. Only integers
+and bytes are hashed, so keys are the same in every process
+"""
+MASK64 = (1 << 64) - 1
+HASH_MODULUS = sys.hash_info.modulus
+PIECE_SALT = 0x5DEECE66D
+
+
+def row_key(r: int, row: int) -> int:
+    """Returns the Zobrist key of a row's contents at a height
+
+    Args:
+        r (int): the row
+        row (int): its occupancy mask
+
+    Returns:
+        int: the key, 0 for an empty row
+    """
+    if not row:
+        return 0
+    if row < HASH_MODULUS:
+        return hash((r, row)) & MASK64
+    data = r.to_bytes(4, "little") + row.to_bytes((row.bit_length() + 7) // 8, "little")
+    return int.from_bytes(blake2b(data, digest_size=8).digest(), "little")
+
+
+def piece_key(piece: Tetromino, r: int, c: int) -> int:
+    """Returns the Zobrist key of a piece at a position. Rotations with the
+    same shape get the same key
+
+    Args:
+        piece (Tetromino): the piece
+        r (int): its row
+        c (int): its column
+
+    Returns:
+        int: the key
+    """
+    return hash((PIECE_SALT, PIECE_TYPES.index(piece.type), piece.state.shape_id, r, c)) & MASK64
+
+
+class Board:
+    """
+    A bitboard backed tetris board. Every row is stored as one integer
+    occupancy mask (bit c set if column c is filled), and the colour of each
+    cell is kept in a separate grid that is only used for drawing.
+
+    The board also keeps the surface, the top filled row of every column,
+    up to date as pieces are placed and lines cleared, a version that
+    changes whenever the board does, and a Zobrist hash of the occupancy.
+    Change rows through place, set_row and clear_full_lines (or call
+    refresh_surface and rehash) to keep them right
+    """
+
+    def __init__(self, num_rows: int, num_cols: int) -> None:
+        """Creates an empty board
+
+        Args:
+            num_rows (int): the number of rows
+            num_cols (int): the number of columns
+        """
+        self.num_rows = num_rows
+        self.num_cols = num_cols
+        self.full_mask = (1 << num_cols) - 1
+        self.rows = [0] * num_rows
+        self.colors = [[TetrominoType.X] * num_cols for _ in range(num_rows)]
+        self.surface = [num_rows] * num_cols
+        self.version = 0
+        self.zobrist = 0
+
+    @staticmethod
+    def from_list(grid: List[List[TetrominoType]]) -> "Board":
+        """Builds a board from its list of lists view
+
+        Args:
+            grid (List[List[TetrominoType]]): the board, row by row
+
+        Returns:
+            Board: the equivalent bitboard
+        """
+        board = Board(len(grid), len(grid[0]) if grid else 0)
+        for r, row in enumerate(grid):
+            board.set_row(r, row, refresh=False)
+        board.refresh_surface()
+        return board
+
+    def copy(self) -> "Board":
+        """Returns an independent copy of the board
+
+        Returns:
+            Board: the copy
+        """
+        board = Board.__new__(Board)
+        board.num_rows = self.num_rows
+        board.num_cols = self.num_cols
+        board.full_mask = self.full_mask
+        board.rows = list(self.rows)
+        board.colors = [list(row) for row in self.colors]
+        board.surface = list(self.surface)
+        board.version = self.version
+        board.zobrist = self.zobrist
+        return board
+
+    def set_row(self, r: int, row: List[TetrominoType], refresh: bool = True) -> None:
+        """Overwrites a whole row
+
+        Args:
+            r (int): the row
+            row (List[TetrominoType]): its new cells
+            refresh (bool): whether to refresh the surface. When setting many
+                rows, pass False and call refresh_surface once at the end
+        """
+        mask = 0
+        for c, type in enumerate(row):
+            if type != TetrominoType.X:
+                mask |= 1 << c
+        self.zobrist ^= row_key(r, self.rows[r]) ^ row_key(r, mask)
+        self.rows[r] = mask
+        self.colors[r] = list(row)
+        if refresh:
+            self.refresh_surface()
+
+    def rehash(self) -> None:
+        """Recomputes the Zobrist hash from the rows
+        """
+        zobrist = 0
+        for r, row in enumerate(self.rows):
+            if row:
+                zobrist ^= row_key(r, row)
+        self.zobrist = zobrist
+
+    def refresh_surface(self) -> None:
+        """Recomputes the surface from the rows, scanning down only as far
+        as the highest block of every column
+        """
+        surface = [self.num_rows] * self.num_cols
+        seen = 0
+        for r, row in enumerate(self.rows):
+            new = row & ~seen
+            while new:
+                bit = new & -new
+                surface[bit.bit_length() - 1] = r
+                new ^= bit
+            seen |= row
+            if seen == self.full_mask:
+                break
+        self.surface = surface
+        self.version += 1
+
+    def to_list(self) -> List[List[TetrominoType]]:
+        """Returns a copy of the board as a list of lists of types
+
+        Returns:
+            List[List[TetrominoType]]: the board, row by row
+        """
+        return [list(row) for row in self.colors]
+
+    def collides(self, row_masks: list, left: int, right: int, test_r: int, test_c: int) -> bool:
+        """Returns whether a piece with the given profile would collide with
+        the walls, the floor or some block on the board at test_r, test_c
+
+        Args:
+            row_masks (list): (row offset, mask) for the piece's non-empty rows
+            left (int): the piece's leftmost filled column offset
+            right (int): the piece's rightmost filled column offset
+            test_r (int): the test r
+            test_c (int): the test c
+
+        Returns:
+            bool: whether it collides
+        """
+        if test_c + left < 0 or test_c + right >= self.num_cols:
+            return True
+        rows = self.rows
+        for i, mask in row_masks:
+            r = test_r + i
+            if r >= self.num_rows:
+                return True
+            if r >= 0 and rows[r] & (mask << test_c if test_c >= 0 else mask >> -test_c):
+                return True
+        return False
+
+    def place(self, cells: tuple, type: TetrominoType, r: int, c: int) -> None:
+        """Writes a piece into the board. Cells above the top of the board
+        are dropped
+
+        Args:
+            cells (tuple): (row offset, column offset) for every filled cell
+            type (TetrominoType): the colour to fill them with
+            r (int): the row of the piece's top left corner
+            c (int): the column of the piece's top left corner
+        """
+        surface, rows = self.surface, self.rows
+        # cells go row by row, so each row is re-keyed once
+        zobrist = self.zobrist
+        last = None
+        for i, j in cells:
+            if r + i >= 0:
+                if r + i != last:
+                    if last is not None:
+                        zobrist ^= row_key(last, rows[last])
+                    last = r + i
+                    zobrist ^= row_key(last, rows[last])
+                rows[r + i] |= 1 << (c + j)
+                self.colors[r + i][c + j] = type
+                if r + i < surface[c + j]:
+                    surface[c + j] = r + i
+        if last is not None:
+            zobrist ^= row_key(last, rows[last])
+        self.zobrist = zobrist
+        self.version += 1
+
+    def landing_row(self, state: RotationState, r: int, c: int) -> int:
+        """Finds the row a piece lands on if dropped straight down from r.
+        When the piece is above the surface in all its columns, this is
+        read straight off the surface; otherwise (say, tucked under an
+        overhang) it steps down a row at a time. Assumes the placement at r
+        is valid, and like the step-by-step search, returns r - 1 if it isn't
+
+        Args:
+            state (RotationState): the piece's orientation
+            r (int): its row
+            c (int): its column
+
+        Returns:
+            int: the bottommost valid row
+        """
+        if c + state.left >= 0 and c + state.right < self.num_cols:
+            surface = self.surface
+            landing = self.num_rows
+            for j, bottom in state.col_bottoms:
+                top = surface[c + j]
+                if r + bottom >= top:
+                    break
+                if top - 1 - bottom < landing:
+                    landing = top - 1 - bottom
+            else:
+                return landing
+        while not self.collides(state.row_masks, state.left, state.right, r, c):
+            r += 1
+        # the last one is bad, so backtrack one
+        return r - 1
+
+    def clear_full_lines(self, rows: Optional[Iterable[int]] = None) -> int:
+        """Removes every full row, moving the rows above them down. Only
+        the given rows are checked, and the surface is shifted rather than
+        rebuilt, so a clear doesn't cost a pass over a tall board
+
+        Args:
+            rows (Optional[Iterable[int]]): the only rows that can be full,
+                say the ones a block was just placed in; every row if None
+
+        Returns:
+            int: the number of lines cleared
+        """
+        full, num_rows = self.full_mask, self.num_rows
+        board_rows = self.rows
+        if rows is None:
+            cleared = [r for r, row in enumerate(board_rows) if row == full]
+        else:
+            cleared = sorted(r for r in set(rows) if 0 <= r < num_rows and board_rows[r] == full)
+        if not cleared:
+            return 0
+        # every row from the top of the stack down to the last cleared one
+        # moves, so only those are re-keyed
+        top, last = min(self.surface), cleared[-1]
+        zobrist = self.zobrist
+        for r in range(top, last + 1):
+            zobrist ^= row_key(r, board_rows[r])
+        colors = self.colors
+        for r in reversed(cleared):
+            del board_rows[r]
+            del colors[r]
+        count = len(cleared)
+        board_rows[0:0] = [0] * count
+        colors[0:0] = [[TetrominoType.X] * self.num_cols for _ in range(count)]
+        for r in range(top + count, last + 1):
+            zobrist ^= row_key(r, board_rows[r])
+        self.zobrist = zobrist
+
+        # a full row covers every column, so each column's top is at or
+        # above the first cleared row: either it moves down with the rows
+        # above, or it was cleared and the new top is further down
+        surface = self.surface
+        first = cleared[0]
+        pending = 0
+        for j, top in enumerate(surface):
+            if top < first:
+                surface[j] = top + count
+            else:
+                pending |= 1 << j
+        r = first + count
+        while pending and r < num_rows:
+            found = board_rows[r] & pending
+            while found:
+                low = found & -found
+                surface[low.bit_length() - 1] = r
+                found ^= low
+            pending &= ~board_rows[r]
+            r += 1
+        while pending:
+            low = pending & -pending
+            surface[low.bit_length() - 1] = num_rows
+            pending ^= low
+        self.version += 1
+        return count
+
+
+class GameState(NamedTuple):
     """
-    Main class for representing the game of Tetris
+    The state of an engine after a step. The board is the engine's live
+    board, not a copy
     """
 
-    def __init__(self, term: Terminal) -> None:
+    board: "Board"
+    piece: Optional["Tetromino"]
+    r: int
+    c: int
+
+
+class StepResult(NamedTuple):
+    """
+    The outcome of one engine step
+    """
+
+    state: GameState
+    lines_cleared: int
+    game_over: bool
+    locked: bool
+
+
+class Placement(NamedTuple):
+    """
+    A final resting place of a piece, and the inputs that get it there
+    """
+
+    piece: Tetromino
+    r: int
+    c: int
+    actions: tuple
+
+
+class TetrisEngine:
+    """
+    The rules of tetris, without any terminal I/O. Owns the board, the bag
+    and the current block, and is driven one step at a time
+    """
+
+    def __init__(self, seed: Optional[int] = None, num_rows: int = 20, num_cols: int = 10,
+                 randomizer=None) -> None:
         """Creates a blank game of tetris
+
+        Args:
+            seed (Optional[int]): the seed for the piece bags
+            num_rows (int): the number of rows of the board
+            num_cols (int): the number of columns of the board
+            randomizer (optional): how pieces are dealt, a name or a
+                Randomizer (see randomizer.py), 7-bag by default
         """
-        self.numRows = 20
-        self.numCols = 10
-        self.board = [[TetrominoType.X for _ in range(
-            self.numCols)] for _ in range(self.numRows)]
-        self.term = term
-        self.width = None
-        self.height = None
-        self.calculate_term_dimensions()
+        from randomizer import make_randomizer
+        self.numRows = num_rows
+        self.numCols = num_cols
+        self.grid = Board(self.numRows, self.numCols)
+        self.rng = Random(seed)
+        self.randomizer = make_randomizer(randomizer)
+        self.tick = 0
+        self.game_over = False
+        self.recorder = None
+        # gets every locked placement, see dataset.py
+        self.exporter = None
+        self._landing_cache = None
+        # the rows the last step locked a block into, see snapshot.py
+        self.last_lock = None
 
         self.curr_block = None
+        self.curr_block_r = 0
+        self.curr_block_c = 0
         self.bag = None
 
-    def calculate_term_dimensions(self) -> bool:
-        """Recalculates the term dimensions
+    @property
+    def board(self) -> Tuple[Tuple[TetrominoType, ...], ...]:
+        """The board as rows of types, built from self.grid on every read, so
+        it costs a pass over every cell. It's a tuple of tuples, so writing
+        to a cell raises rather than changing nothing: change cells through
+        self.grid, or assign a whole board
 
         Returns:
-            bool: True if it's resized from a previous iteration
+            Tuple[Tuple[TetrominoType, ...], ...]: the board, row by row
         """
-        if self.term.width != self.width or self.term.height != self.height:
-            self.width = self.term.width
-            self.height = self.term.height
-            self.zero_r = int(.1 * self.height)
-            self.block_height = max(1, int(.8 * self.height) // (self.numRows))
-            self.block_width = 2 * self.block_height
-            self.zero_c = (self.width // 2) - \
-                (self.numCols * self.block_width // 2)
-            return True
-        return False
+        return tuple(map(tuple, self.grid.colors))
+
+    @board.setter
+    def board(self, grid: List[List[TetrominoType]]) -> None:
+        self.grid = Board.from_list(grid)
+
+    def reset(self, seed: Optional[int] = None) -> GameState:
+        """Starts a new game with an empty board and spawns the first block
+
+        Args:
+            seed (Optional[int]): the seed for the piece bags
+
+        Returns:
+            GameState: the initial state
+        """
+        self.grid = Board(self.numRows, self.numCols)
+        self.rng = Random(seed)
+        self.randomizer.reset()
+        self.tick = 0
+        self.game_over = False
+        self.curr_block = None
+        self.bag = None
+        self.last_lock = None
+        self.spawn_block()
+        return self.state()
+
+    def serialize(self, rng: bool = False) -> bytes:
+        """Returns a compact snapshot of the game, see snapshot.py
+
+        Args:
+            rng (bool): whether to include the RNG, so the game can be resumed
+
+        Returns:
+            bytes: the snapshot
+        """
+        from snapshot import encode_snapshot
+        return encode_snapshot(self, rng)
+
+    def deserialize(self, data: bytes) -> None:
+        """Restores the game from a snapshot made by serialize
+
+        Args:
+            data (bytes): the snapshot
+        """
+        from snapshot import decode_snapshot
+        decode_snapshot(data, self)
+
+    def state(self) -> GameState:
+        """Returns the current state
+
+        Returns:
+            GameState: the board, current block and its position
+        """
+        return GameState(self.grid, self.curr_block, self.curr_block_r, self.curr_block_c)
+
+    def position_hash(self) -> int:
+        """Returns the Zobrist hash of the board and the current block
+
+        Returns:
+            int: the hash
+        """
+        block = self.curr_block
+        if block is None:
+            return self.grid.zobrist
+        return self.grid.zobrist ^ piece_key(block, self.curr_block_r, self.curr_block_c)
 
     def generate_piece_bag(self) -> List[Tetromino]:
-        """Generates the next so many pieces
+        """Deals the next so many pieces from the randomizer
 
         Returns:
-            List[TetrominoType]: a bag of tetrominos
+            List[TetrominoType]: a bag of tetrominos, to be popped from the end
         """
-        bag = [Tetromino(type)
-               for type in TetrominoType if type != TetrominoType.X]
-        shuffle(bag)
+        bag = [Tetromino.of(type) for type in self.randomizer.deal(self.rng)]
+        bag.reverse()
         return bag
 
-    def draw_board_border(self) -> None:
-        """Draws the border of a board
-        """
-        # top
-        print(self.term.move_xy(self.zero_c - 1, self.zero_r - 1) +
-              self.term.on_gray44(
-                  "".join([" " for _ in range(self.block_width * self.numCols + 2)])),
-              flush=True,
-              end="")
-
-        # bottom
-        print(self.term.move_xy(self.zero_c - 1, self.zero_r + self.block_height * self.numRows) +
-              self.term.on_gray44(
-                  "".join([" " for _ in range(self.block_width * self.numCols + 2)])),
-              flush=True,
-              end="")
-
-        # left
-        print("".join(
-            [
-                self.term.move_xy(
-                    self.zero_c - 1, self.zero_r - 1 + i) + self.term.on_gray44(" ")
-                for i in range(self.block_height * self.numRows + 2)
-            ]
-        ), flush=True, end="")
-
-        # right
-        print("".join(
-            [
-                self.term.move_xy(
-                    self.zero_c + self.block_width * self.numCols, self.zero_r - 1 + i) + self.term.on_gray44(" ")
-                for i in range(self.block_height * self.numRows + 2)
-            ]
-        ), flush=True, end="")
-
-    def draw_board_coord(self, r: int, c: int, block_type: TetrominoType, ghost: bool = False) -> None:
-        """Gets the terminal x, y values of a board coordinate
-
-        Args:
-            r (int): the row in board space
-            c (int): the column in board space
-            block_type (TetrominoType): the type to draw to the screen
-            ghost (bool): whether it's a ghost block
-        """
-
-        # drawing should be between 10% and 90% height, and then calculate squares from there
-        start_r = self.zero_r + r * self.block_height
-        end_r = self.zero_r + (r + 1) * self.block_height
-        start_c = self.zero_c + c * self.block_width
-        end_c = self.zero_c + (c + 1) * self.block_width
-
-        for i in range(start_r, end_r):
-            for j in range(start_c, end_c):
-                self.draw_space_of_block(block_type, j, i, ghost)
-
-    def draw_curr_block(self) -> None:
-        """Draws the moving block (this should be handled separately)
-        """
-        for i in range(self.curr_block.get_size()):
-            for j in range(self.curr_block.get_size()):
-                r = self.curr_block_r + i
-                c = self.curr_block_c + j
-                if r >= 0 and r < self.numRows and c >= 0 and c < self.numCols:
-                    if self.curr_block.shape()[i][j] != TetrominoType.X:
-                        self.draw_board_coord(
-                            r, c, self.curr_block.shape()[i][j])
-
-    def draw_ghost_block(self) -> None:
-        """Draws the ghost block (where fast drop would put it)
-        """
-        for i in range(self.curr_block.get_size()):
-            for j in range(self.curr_block.get_size()):
-                down_r, down_c = self.find_curr_block_bottom_xy()
-                r = down_r + i
-                c = down_c + j
-                if r >= 0 and r < self.numRows and c >= 0 and c < self.numCols:
-                    if self.curr_block.shape()[i][j] != TetrominoType.X:
-                        self.draw_board_coord(
-                            r, c, self.curr_block.shape()[i][j], True)
-
-    def draw_space_of_block(self, block_type: TetrominoType, x: int, y: int, ghost: bool = False) -> None:
-        """Draws one space of the block in terminal space
-
-        Args:
-            block_type (TetrominoType): the block type to draw
-            x (int): the x value in terminal space
-            y (int): the y value in terminal space
-            ghost (int): whether it's a ghost
-        """
-        toDraw = self.term.move_xy(x, y)
-        t = TetrominoType
-        if not ghost:
-            match block_type:
-                case t.I:
-                    toDraw += self.term.on_cyan(" ")
-                case t.O:
-                    toDraw += self.term.on_yellow(" ")
-                case t.T:
-                    toDraw += self.term.on_purple(" ")
-                case t.J:
-                    toDraw += self.term.on_blue(" ")
-                case t.L:
-                    toDraw += self.term.on_orange(" ")
-                case t.S:
-                    toDraw += self.term.on_green4(" ")
-                case t.Z:
-                    toDraw += self.term.on_red(" ")
-                case t.X:
-                    toDraw += " "
-        else:
-            match block_type:
-                case t.I | t.O | t.T | t.J | t.L | t.S | t.Z:
-                    toDraw += self.term.on_gray89(" ")
-                case t.X:
-                    toDraw += " "
-        print(toDraw, end="", flush=True)
+    def preview(self, count: int) -> List[TetrominoType]:
+        """Returns the pieces after the current block, dealing ahead as far
+        as needed. Dealing early doesn't change what comes
 
-    def render_game(self) -> None:
+        Args:
+            count (int): how many pieces
+
+        Returns:
+            List[TetrominoType]: the pieces, next one first
         """
-        Draws the board to the screen
+        while len(self.bag or ()) < count:
+            self.bag = self.generate_piece_bag() + (self.bag or [])
+        return [piece.type for piece in self.bag[:-count - 1:-1]] if count else []
+
+    def spawn_block(self) -> bool:
+        """Takes the next block from the bag and puts it above the board
+
+        Returns:
+            bool: False if it collides on spawn, which ends the game
         """
-        if self.calculate_term_dimensions():
-            # board was resized! clear
-            print(self.term.clear, end="", flush=True)
+        if not self.bag:
+            self.bag = self.generate_piece_bag()
 
-        self.draw_board_border()
+        self.curr_block = self.bag.pop()
+        self.curr_block_r, self.curr_block_c = self.spawn_position(self.curr_block)
+        if self.block_would_collide(-self.curr_block.get_bottom_boundary(), self.curr_block_c):
+            # collides on spawn? we're dead
+            self.game_over = True
+        return not self.game_over
 
-        for r, board_row in enumerate(self.board):
-            for c, block_type in enumerate(board_row):
-                self.draw_board_coord(r, c, block_type)
+    def step(self, action: Action = Action.NONE, gravity: bool = True) -> StepResult:
+        """Advances the game: applies gravity (if asked), then the action,
+        then locks the block if it has landed
 
-        self.draw_ghost_block()
-        self.draw_curr_block()
+        Args:
+            action (Action): the input to apply
+            gravity (bool): whether this step is a gravity tick
 
-        if self.height < self.numRows * 1.20:
-            print(self.term.move_xy(self.width // 2 - 15, self.height // 2) +
-                  self.term.on_red("Please make your terminal taller!"),
-                  end="", flush=True)
+        Returns:
+            StepResult: the new state, the lines cleared and whether the game is over
+        """
+        self.last_lock = None
+        if not self.game_over and not self.curr_block:
+            self.spawn_block()
+            self.finish_recording()
+        if self.game_over:
+            return StepResult(self.state(), 0, True, False)
+
+        if self.recorder is not None and action != Action.NONE:
+            self.recorder.record(self.tick, action, gravity)
+        if gravity:
+            self.tick += 1
+            if not self.block_would_collide(self.curr_block_r + 1, self.curr_block_c):
+                self.curr_block_r += 1
+
+        self.apply_action(action)
+
+        lines_cleared = 0
+        locked = (self.curr_block_r, self.curr_block_c) == self.find_curr_block_bottom_xy()
+        if locked:
+            block, r, c = self.curr_block, self.curr_block_r, self.curr_block_c
+            rows = {r + i for i, _ in block.state.row_masks}
+            before = list(self.grid.rows) if self.exporter is not None else None
+            self.place_curr_block()
+            colors = self.grid.colors
+            # the rows the block went into, before any of them are cleared
+            self.last_lock = [(r, list(colors[r])) for r in sorted(rows) if 0 <= r < self.numRows]
+            lines_cleared = self.clear_full_lines(rows)
+            if self.exporter is not None:
+                self.exporter.record(before, block, r, c, lines_cleared)
+            self.spawn_block()
+            self.finish_recording()
+        return StepResult(self.state(), lines_cleared, self.game_over, locked)
+
+    def spawn_position(self, piece: Tetromino) -> tuple([int, int]):
+        """Returns where a piece enters the game, above the board
 
-    def handle_key(self, key) -> None:
-        """Handles a keystroke
+        Args:
+            piece (Tetromino): the piece
+
+        Returns:
+            tuple([int, int]): (r, c)
+        """
+        return (-piece.get_bottom_boundary() - 2, self.numCols // 2)
+
+    def finish_recording(self) -> None:
+        """Ends the replay being recorded, if any, once the game is over
+        """
+        if self.game_over and self.recorder is not None:
+            self.recorder.finish(self.tick, self.grid)
+            self.recorder = None
+
+    def apply_action(self, action: Action) -> None:
+        """Moves or rotates the current block
 
         Args:
-            key (_type_): the keycode
+            action (Action): the input to apply
         """
-        term = self.term
-        if self.curr_block:
-            if key.is_sequence:
-                match key.code:
-                    case term.KEY_LEFT:
-                        self.curr_block_c -= 1
-                        if self.curr_block_collides():
-                            self.curr_block_c += 1
-                        self.maintain_in_boundary()
-                    case term.KEY_RIGHT:
-                        self.curr_block_c += 1
-                        if self.curr_block_collides():
-                            self.curr_block_c -= 1
-                        self.maintain_in_boundary()
-                    case term.KEY_DOWN:
-                        if (self.curr_block_r, self.curr_block_c) != self.find_curr_block_bottom_xy():
-                            self.curr_block_r += 1
-                    case term.KEY_UP:
-                        self.rotate_curr_right()
-
-            elif key:
-                if key.lower() == 'z':
-                    self.rotate_curr_left()
-                elif key.lower() == 'x':
-                    self.rotate_curr_right()
-                elif key.lower() == ' ':
-                    self.curr_block_r, self.curr_block_c = self.find_curr_block_bottom_xy()
+        if not self.curr_block:
+            return
+        self.curr_block, self.curr_block_r, self.curr_block_c = self.transition(
+            self.curr_block, self.curr_block_r, self.curr_block_c, action)
+
+    def transition(self, piece: Tetromino, r: int, c: int, action: Action) -> tuple:
+        """Returns where an action takes a piece, without changing the game.
+        This holds every movement rule, so the current block and the move
+        generator always agree
+
+        Args:
+            piece (Tetromino): the piece
+            r (int): its row
+            c (int): its column
+            action (Action): the input to apply
+
+        Returns:
+            tuple: (piece, r, c) after the action
+        """
+        match action:
+            case Action.LEFT | Action.RIGHT:
+                dc = -1 if action == Action.LEFT else 1
+                if not self.piece_would_collide(piece, r, c + dc):
+                    c += dc
+                c = self.clamp_in_boundary(piece, c)
+            case Action.DOWN:
+                if not self.piece_would_collide(piece, r + 1, c):
+                    r += 1
+            case Action.ROTATE_RIGHT | Action.ROTATE_LEFT:
+                rotated = piece.rotated_right() if action == Action.ROTATE_RIGHT else piece.rotated_left()
+                # the boundary fix-up sticks even if the rotation is undone
+                c = self.clamp_in_boundary(rotated, c)
+                if not self.piece_would_collide(rotated, r, c):
+                    piece = rotated
+            case Action.HARD_DROP:
+                r = self.landing_row(piece, r, c)
+        return piece, r, c
+
+    def clamp_in_boundary(self, piece: Tetromino, c: int) -> int:
+        """Returns the closest column to c that keeps a piece within the walls
+
+        Args:
+            piece (Tetromino): the piece
+            c (int): the column
+
+        Returns:
+            int: the clamped column
+        """
+        if c > self.numCols - 1 - piece.get_right_boundary():
+            c = self.numCols - 1 - piece.get_right_boundary()
+        if c < -piece.get_left_boundary():
+            c = -piece.get_left_boundary()
+        return c
 
     def maintain_in_boundary(self) -> None:
         """makes sure the current block is in boundary
         """
-        if self.curr_block_c > self.numCols - 1 - self.curr_block.get_right_boundary():
-            self.curr_block_c = self.numCols - 1 - self.curr_block.get_right_boundary()
-        if self.curr_block_c < -self.curr_block.get_left_boundary():
-            self.curr_block_c = -self.curr_block.get_left_boundary()
+        self.curr_block_c = self.clamp_in_boundary(self.curr_block, self.curr_block_c)
 
     def rotate_curr_right(self) -> None:
         """Rotates the current block right
         """
-        self.curr_block.rotate_right()
-        self.maintain_in_boundary()
-        if self.curr_block_collides():
-            self.curr_block.rotate_left()
+        self.apply_action(Action.ROTATE_RIGHT)
 
     def rotate_curr_left(self) -> None:
         """Rotates the current block left
         """
-        self.curr_block.rotate_left()
-        self.maintain_in_boundary()
-        if self.curr_block_collides():
-            self.curr_block.rotate_right()
+        self.apply_action(Action.ROTATE_LEFT)
 
     def curr_block_collides(self) -> bool:
         """Returns whether the current block collides with some block in the 
@@ -467,29 +995,34 @@ class Tetris:
         Returns:
             bool: whether it collides
         """
+        return self.piece_would_collide(self.curr_block, test_r, test_c)
 
-        for i in range(self.curr_block.get_size()):
-            for j in range(self.curr_block.get_size()):
-                r = test_r + i
-                c = test_c + j
-                # out of bounds
-                if self.curr_block.shape()[i][j] != TetrominoType.X and \
-                        (r >= self.numRows or c < 0 or c >= self.numCols):
-                    return True
-                # in bounds
-                if (r >= 0 and r < self.numRows and c >= 0 and c < self.numCols) and \
-                        self.board[r][c] != TetrominoType.X and \
-                        self.curr_block.shape()[i][j] != TetrominoType.X:
-                    return True
-        return False
+    def piece_would_collide(self, piece: Tetromino, test_r: int, test_c: int) -> bool:
+        """Returns whether a piece would collide with the walls, the floor or
+        some block in the board already if it were at test_r, test_c
+
+        Args:
+            piece (Tetromino): the piece
+            test_r (int): the test r
+            test_c (int): the test c
+
+        Returns:
+            bool: whether it collides
+        """
+        state = piece.state
+        return self.grid.collides(state.row_masks, state.left, state.right, test_r, test_c)
 
-    def clear_full_lines(self) -> None:
+    def clear_full_lines(self, rows: Optional[Iterable[int]] = None) -> int:
         """Clears the full lines
+
+        Args:
+            rows (Optional[Iterable[int]]): the only rows that can be full,
+                every row if None
+
+        Returns:
+            int: the number of lines cleared
         """
-        for r in range(self.numRows):
-            if all([curr_type != TetrominoType.X for curr_type in self.board[r]]):
-                self.board = [[TetrominoType.X for _ in range(
-                    self.numCols)]] + self.board[:r] + self.board[r + 1:]
+        return self.grid.clear_full_lines(rows)
 
     def find_curr_block_bottom_xy(self) -> tuple([int, int]):
         """Finds the bottommost valid placement. Assumes
@@ -501,52 +1034,359 @@ class Tetris:
         Returns:
             tuple([int, int]): (bottomr, bottomc)
         """
-        curr_r = self.curr_block_r
-        curr_c = self.curr_block_c
+        grid, state, r, c = self.grid, self.curr_block.state, self.curr_block_r, self.curr_block_c
+        cache = self._landing_cache
+        # falling never changes where a block lands, so the cache holds
+        # until the board, the orientation or the column changes
+        if cache is None or cache[0] is not grid or cache[1] != grid.version or \
+                cache[2] is not state or cache[3] != c or cache[4] < r:
+            cache = self._landing_cache = (grid, grid.version, state, c, grid.landing_row(state, r, c))
+        return (cache[4], c)
+
+    def landing_row(self, piece: Tetromino, r: int, c: int) -> int:
+        """Finds the row a piece lands on if dropped straight down from r.
+        Assumes the placement at r is valid
 
-        while not self.block_would_collide(curr_r, curr_c):
-            curr_r += 1
-        # the last one is bad, so backtrack one
-        return (curr_r - 1, curr_c)
+        Args:
+            piece (Tetromino): the piece
+            r (int): its row
+            c (int): its column
+
+        Returns:
+            int: the bottommost valid row
+        """
+        return self.grid.landing_row(piece.state, r, c)
+
+    def reachable_placements(self) -> List["Placement"]:
+        """Lists every final placement the current block can reach
+
+        Returns:
+            List[Placement]: the placements, see find_placements
+        """
+        return self.find_placements(self.curr_block, self.curr_block_r, self.curr_block_c)
+
+    def find_placements(self, piece: Tetromino, r: int, c: int) -> List["Placement"]:
+        """Lists every final placement a piece can reach from (r, c) with the
+        inputs of handle_key, along with the shortest input sequence that
+        reaches it. The search is breadth first over (orientation, r, c) and
+        never visits a state twice. A piece locks as soon as it lands, so
+        landed states are never moved on from, and gravity is ignored since
+        it only ever does what DOWN does. Moves that would leave the piece
+        overlapping the stack are skipped
+
+        Args:
+            piece (Tetromino): the piece
+            r (int): its row
+            c (int): its column
+
+        Returns:
+            List[Placement]: one placement per distinct set of final cells
+        """
+        moves = (Action.HARD_DROP, Action.LEFT, Action.RIGHT,
+                 Action.ROTATE_RIGHT, Action.ROTATE_LEFT, Action.DOWN)
+        start = (piece.state.shape_id, r, c)
+        parents = {start: None}
+        frontier = [(piece, r, c)]
+        placements = []
+        cells_seen = set()
+        landings = {}
+        while frontier:
+            next_frontier = []
+            for piece, r, c in frontier:
+                key = (piece.state.shape_id, r, c)
+                if self.piece_would_collide(piece, r + 1, c):
+                    cells = (piece.type, frozenset((r + i, c + j) for i, j in piece.state.cells))
+                    if cells not in cells_seen:
+                        cells_seen.add(cells)
+                        actions = []
+                        while parents[key] is not None:
+                            key, action = parents[key]
+                            actions.append(action)
+                        placements.append(Placement(piece, r, c, tuple(actions[::-1])))
+                    continue
+                for action in moves:
+                    if action == Action.HARD_DROP:
+                        moved = (piece, self._memo_landing_row(landings, piece, r, c), c)
+                    else:
+                        moved = self.transition(piece, r, c, action)
+                    moved_key = (moved[0].state.shape_id, moved[1], moved[2])
+                    # a rotation that is undone keeps its boundary fix-up,
+                    # which can push the piece into the stack; never go there
+                    if moved_key not in parents and not self.piece_would_collide(*moved):
+                        parents[moved_key] = (key, action)
+                        next_frontier.append(moved)
+            frontier = next_frontier
+        return placements
+
+    def _memo_landing_row(self, landings: dict, piece: Tetromino, r: int, c: int) -> int:
+        """landing_row, sharing the work between every row of a column that
+        falls to the same place
+        """
+        shape_id = piece.state.shape_id
+        path = []
+        while (shape_id, r, c) not in landings:
+            path.append(r)
+            if self.piece_would_collide(piece, r + 1, c):
+                landings[(shape_id, r, c)] = r
+                break
+            r += 1
+        landing = landings[(shape_id, r, c)]
+        for row in path:
+            landings[(shape_id, row, c)] = landing
+        return landing
 
     def place_curr_block(self) -> None:
         """Places the current block and resets the current block
         """
-        for i in range(self.curr_block.get_size()):
-            for j in range(self.curr_block.get_size()):
-                r = self.curr_block_r + i
-                c = self.curr_block_c + j
-                if self.curr_block.shape()[i][j] != TetrominoType.X:
-                    self.board[r][c] = self.curr_block.shape()[i][j]
+        self.grid.place(self.curr_block.state.cells, self.curr_block.type,
+                        self.curr_block_r, self.curr_block_c)
         self.curr_block = None
 
-    def event_loop(self) -> None:
+
+class Tetris(TetrisEngine):
+    """
+    Main class for representing the game of Tetris: a terminal front end
+    over TetrisEngine
+    """
+
+    def __init__(self, term: "Terminal", num_rows: int = 20, num_cols: int = 10,
+                 randomizer=None) -> None:
+        """Creates a blank game of tetris
+
+        Args:
+            term (Terminal): the terminal to play in
+            num_rows (int): the number of rows of the board
+            num_cols (int): the number of columns of the board
+            randomizer (optional): how pieces are dealt, see TetrisEngine
+        """
+        super().__init__(num_rows=num_rows, num_cols=num_cols, randomizer=randomizer)
+        self.term = term
+        self.width = None
+        self.height = None
+        self.layout = None
+        self.view_r = 0
+        self.view_c = 0
+        self.calculate_term_dimensions()
+
+        from renderer import FrameRenderer
+        from controls import InputQueue
+        self.renderer = FrameRenderer(term)
+        self.input = InputQueue(self.key_to_action, width=num_cols)
+        self.profiler = None
+        self.audio = None
+        self.planner = None
+
+    def calculate_term_dimensions(self) -> bool:
+        """Recalculates the term dimensions. A board too big for the terminal
+        is drawn through a viewport of view_rows by view_cols cells
+
+        Returns:
+            bool: True if it's resized from a previous iteration
         """
-        Main game event loop
+        layout = (self.term.width, self.term.height, self.numRows, self.numCols)
+        if layout != self.layout:
+            self.layout = layout
+            self.width = self.term.width
+            self.height = self.term.height
+            # every row but the border above and below the board
+            free = max(1, self.height - 2)
+            # as big as fits both ways, a block is twice as wide as it is high
+            self.block_height = max(1, min(min(int(.8 * self.height), free) // self.numRows,
+                                           (self.width - 2) // (2 * self.numCols)))
+            self.block_width = 2 * self.block_height
+            self.view_rows = min(self.numRows, free // self.block_height)
+            # the top margin shrinks before the board scrolls
+            self.zero_r = max(1, min(int(.1 * self.height),
+                                     self.height - 1 - self.view_rows * self.block_height))
+            # leave room for the border
+            self.view_cols = min(self.numCols, max(1, (self.width - 2) // self.block_width))
+            self.zero_c = (self.width // 2) - \
+                (self.view_cols * self.block_width // 2)
+            self.update_viewport()
+            return True
+        return False
+
+    def update_viewport(self) -> None:
+        """Scrolls the viewport as little as it takes to keep the current
+        block in view, a few cells away from the edges
+        """
+        if self.view_rows == self.numRows and self.view_cols == self.numCols:
+            # the whole board fits
+            self.view_r = self.view_c = 0
+            return
+        block = self.curr_block
+        if block:
+            state = block.state
+            self.view_r = self.follow(self.view_r, self.view_rows, self.numRows,
+                                      self.curr_block_r + state.top,
+                                      self.curr_block_r + state.bottom)
+            self.view_c = self.follow(self.view_c, self.view_cols, self.numCols,
+                                      self.curr_block_c + state.left,
+                                      self.curr_block_c + state.right)
+        self.view_r = max(0, min(self.view_r, self.numRows - self.view_rows))
+        self.view_c = max(0, min(self.view_c, self.numCols - self.view_cols))
+
+    @staticmethod
+    def follow(start: int, size: int, total: int, low: int, high: int) -> int:
+        """Moves one axis of the viewport so that low to high is in view
+
+        Args:
+            start (int): the first cell in view
+            size (int): the number of cells in view
+            total (int): the number of cells on the board
+            low (int): the first cell to show
+            high (int): the last cell to show
+
+        Returns:
+            int: the new first cell in view
+        """
+        margin = min(4, size // 4)
+        if low < start + margin:
+            start = low - margin
+        elif high > start + size - 1 - margin:
+            start = high - size + 1 + margin
+        return max(0, min(start, total - size))
+
+    def render_game(self) -> None:
+        """
+        Draws the board to the screen
+        """
+        profiler = self.profiler
+        lines = []
+        if profiler and profiler.show_hud:
+            lines += profiler.hud_lines() + self.input.hud_lines()
+        if self.planner:
+            lines += self.planner.hud_lines()
+        if self.audio and self.audio.error:
+            # the music failed to load, say so rather than just being quiet
+            lines.append("music  off")
+        self.renderer.render(self, lines or None)
+
+    def enable_profiling(self, log_path: Optional[str] = None, show_hud: bool = True) -> None:
+        """Turns on per-frame timing of the event loop. When it's off, the
+        loop pays for nothing but a few checks of self.profiler
+
+        Args:
+            log_path (Optional[str]): where to write one JSON line per frame
+            show_hud (bool): whether to draw the performance HUD
+        """
+        from perf import FrameProfiler
+        self.profiler = FrameProfiler(log_path, show_hud)
+        # shadow the method on this instance only, so unprofiled games never pay for it
+        self.find_curr_block_bottom_xy = self.profiler.wrap(
+            "drop_search", self.find_curr_block_bottom_xy)
+
+    def key_to_action(self, key) -> Action:
+        """Translates a keystroke into an engine action
+
+        Args:
+            key (_type_): the keycode
+
+        Returns:
+            Action: the action, Action.NONE if the key does nothing
+        """
+        term = self.term
+        if key.is_sequence:
+            match key.code:
+                case term.KEY_LEFT:
+                    return Action.LEFT
+                case term.KEY_RIGHT:
+                    return Action.RIGHT
+                case term.KEY_DOWN:
+                    return Action.DOWN
+                case term.KEY_UP:
+                    return Action.ROTATE_RIGHT
+        elif key:
+            match key.lower():
+                case 'z':
+                    return Action.ROTATE_LEFT
+                case 'x':
+                    return Action.ROTATE_RIGHT
+                case ' ':
+                    return Action.HARD_DROP
+        return Action.NONE
+
+    def handle_key(self, key) -> None:
+        """Handles a keystroke
+
+        Args:
+            key (_type_): the keycode
+        """
+        self.apply_action(self.key_to_action(key))
+
+    def play_effects(self, result: StepResult) -> None:
+        """Plays the sound for a step, if there is audio and it locked a piece
+
+        Args:
+            result (StepResult): the step
+        """
+        if self.audio and result.locked:
+            if result.lines_cleared == 4:
+                self.audio.play("tetris")
+            else:
+                self.audio.play("clear" if result.lines_cleared else "lock")
+
+    def autoplay(self, budget: float) -> StepResult:
+        """Lets self.planner place the current block
+
+        Args:
+            budget (float): the seconds the planner may think for
+
+        Returns:
+            StepResult: the last step taken
+        """
+        placement = self.planner.plan(self, budget).placement
+        actions = placement.actions if placement else (Action.HARD_DROP,)
+        result = None
+        for action in actions:
+            result = self.step(action, gravity=False)
+            self.play_effects(result)
+            if result.locked or result.game_over:
+                break
+        return result
+
+    def event_loop(self, max_fps: float = 30) -> None:
+        """
+        Main game event loop, which returns when the game is over. Gravity
+        runs on a fixed tick, every waiting key is applied as soon as the
+        loop gets to it, and a frame is drawn only when something changed
+
+        Args:
+            max_fps (float): the most frames to draw per second
         """
-        LOOP_TIME = .2  # number of seconds for one iteration
-        last_time = time.time()
+        LOOP_TIME = .2  # number of seconds for one gravity tick
+        scheduler = FixedTimestep(LOOP_TIME, max_fps)
         with self.term.fullscreen(), self.term.cbreak(), self.term.hidden_cursor(), self.term.location():
-            while True:
-                if not self.bag or not len(self.bag):
-                    self.bag = self.generate_piece_bag()
-
-                if not self.curr_block:
-                    self.curr_block = self.bag.pop()
-                    self.curr_block_r = -self.curr_block.get_bottom_boundary() - 2
-                    self.curr_block_c = self.numCols // 2
-                    if self.block_would_collide(-self.curr_block.get_bottom_boundary(), self.curr_block_c):
-                        # collides on spawn? we're dead
-                        exit(0)
-
-                if (time.time() > last_time + LOOP_TIME):
-                    self.curr_block_r += 1
-                    last_time = time.time()
-
-                self.render_game()
-                input = self.term.inkey(LOOP_TIME)
-
-                self.handle_key(input)
-                if (self.curr_block_r, self.curr_block_c) == self.find_curr_block_bottom_xy():
-                    self.place_curr_block()
-                    self.clear_full_lines()
+            profiler = self.profiler
+            result = self.step(Action.NONE, gravity=False)
+            while not result.game_over:
+                self.input.read(self.term, min(scheduler.timeout(), self.input.timeout()))
+                if profiler:
+                    profiler.mark("input")
+                for action in self.input.due():
+                    if result.game_over:
+                        break
+                    result = self.step(action, gravity=False)
+                    self.play_effects(result)
+                    scheduler.mark_dirty()
+                if self.planner and not result.game_over:
+                    result = self.autoplay(self.planner.budget_for(LOOP_TIME))
+                    scheduler.mark_dirty()
+
+                ticks = scheduler.advance()
+                for _ in range(ticks):
+                    if result.game_over:
+                        break
+                    result = self.step(Action.NONE, gravity=True)
+                    self.play_effects(result)
+                    scheduler.mark_dirty()
+                if profiler:
+                    profiler.mark("logic")
+
+                if scheduler.should_render():
+                    self.render_game()
+                    scheduler.rendered()
+                    self.input.rendered()
+                    if profiler:
+                        profiler.mark("render")
+                        profiler.end_frame(self.renderer.bytes_written, self.renderer.flushes)
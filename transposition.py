@@ -0,0 +1,74 @@
+from collections import OrderedDict
+from typing import Any, Hashable
+
+
+class TranspositionTable:
+    """
+    A bounded cache of search results keyed by position hashes. When it is
+    full, the least recently used entry makes room for the new one, so a
+    long run never holds more than max_entries results
+    """
+
+    def __init__(self, max_entries: int = 100_000) -> None:
+        """Creates an empty table
+
+        Args:
+            max_entries (int): the most entries to keep
+        """
+        if max_entries < 1:
+            raise ValueError("The table needs room for at least one entry")
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Looks up an entry, counting the hit or miss
+
+        Args:
+            key (Hashable): the key
+            default (Any): what to return on a miss
+
+        Returns:
+            Any: the entry, or default
+        """
+        entries = self.entries
+        if key in entries:
+            entries.move_to_end(key)
+            self.hits += 1
+            return entries[key]
+        self.misses += 1
+        return default
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Stores an entry, evicting the least recently used one if full
+
+        Args:
+            key (Hashable): the key
+            value (Any): the entry
+        """
+        entries = self.entries
+        entries[key] = value
+        entries.move_to_end(key)
+        if len(entries) > self.max_entries:
+            entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        """Returns the table's counters
+
+        Returns:
+            dict: the entries, hits, misses, evictions and hit rate
+        """
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def __len__(self) -> int:
+        return len(self.entries)
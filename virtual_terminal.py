@@ -0,0 +1,101 @@
+from typing import Optional, TextIO
+
+"""The background colours the game draws with, as the xterm-256color
+sequences blessed emits for them
+"""
+BACKGROUNDS = {
+    "on_cyan": "\x1b[46m",
+    "on_yellow": "\x1b[43m",
+    "on_purple": "\x1b[48;5;129m",
+    "on_blue": "\x1b[44m",
+    "on_orange": "\x1b[48;5;214m",
+    "on_green4": "\x1b[48;5;28m",
+    "on_red": "\x1b[41m",
+    "on_gray44": "\x1b[48;5;242m",
+    "on_gray89": "\x1b[48;5;254m",
+}
+NORMAL = "\x1b[m"
+
+
+class Formatter(str):
+    """
+    A colour sequence that, like blessed's, can also be called to wrap text
+    """
+
+    def __call__(self, text: str) -> str:
+        return self + text + NORMAL
+
+
+class CountingStream:
+    """
+    A text stream that counts the bytes, writes and flushes that go through
+    it, optionally passing them on to another stream
+    """
+
+    def __init__(self, sink: Optional[TextIO] = None) -> None:
+        """Creates a stream
+
+        Args:
+            sink (Optional[TextIO]): where to pass writes on to, if anywhere
+        """
+        self.sink = sink
+        self.bytes = 0
+        self.writes = 0
+        self.flushes = 0
+
+    def write(self, text: str) -> int:
+        self.bytes += len(text.encode())
+        self.writes += 1
+        if self.sink:
+            self.sink.write(text)
+        return len(text)
+
+    def flush(self) -> None:
+        self.flushes += 1
+        if self.sink:
+            self.sink.flush()
+
+
+class VirtualTerminal:
+    """
+    An in-memory stand-in for blessed's Terminal with just what the
+    renderer needs: a fixed size, cursor moves, the game's colours and a
+    counting output stream
+    """
+
+    clear = "\x1b[H\x1b[2J"
+    normal = NORMAL
+    # the curses key codes blessed uses
+    KEY_DOWN = 258
+    KEY_UP = 259
+    KEY_LEFT = 260
+    KEY_RIGHT = 261
+
+    def __init__(self, width: int = 80, height: int = 24, sink: Optional[TextIO] = None) -> None:
+        """Creates a terminal
+
+        Args:
+            width (int): the number of columns
+            height (int): the number of rows
+            sink (Optional[TextIO]): where to pass output on to, if anywhere
+        """
+        self.width = width
+        self.height = height
+        self.stream = CountingStream(sink)
+
+    def move_xy(self, x: int, y: int) -> str:
+        """Returns the sequence that moves the cursor to (x, y)
+
+        Args:
+            x (int): the column, from 0
+            y (int): the row, from 0
+
+        Returns:
+            str: the sequence
+        """
+        return f"\x1b[{y + 1};{x + 1}H"
+
+    def __getattr__(self, name: str) -> Formatter:
+        if name in BACKGROUNDS:
+            return Formatter(BACKGROUNDS[name])
+        raise AttributeError(name)